@@ -54,14 +54,18 @@ CORS_ALLOW_HEADERS = [
     "content-type",
     "authorization",
     "x-requested-with",
+    "idempotency-key",
+    "x-region",
 ]
 
 CORS_ALLOW_CREDENTIALS = False
 
 # Application definition
 
+# API-only workers can skip loading the admin (and every admin.py module) at boot
+ADMIN_ENABLED = getenv('DJANGO_ADMIN_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -74,8 +78,12 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
 ]
 
+if ADMIN_ENABLED:
+    INSTALLED_APPS.insert(0, 'django.contrib.admin')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'grocereats_api.profiling.ProfilingMiddleware',
 
     'corsheaders.middleware.CorsMiddleware',
 
@@ -83,17 +91,108 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',  # Disabled CSRF
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'grocereats_api.regions.RegionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'grocereats_api.query_budget.QueryBudgetMiddleware',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'grocereats_api.tokens.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'grocereats_api.throttling.TokenBucketThrottle',
+    ],
+}
+
+# Token bucket shared by all endpoints of a user. Every request costs the weight of its
+# URL name (1 by default). Use CacheBucketBackend to share the budget between workers.
+THROTTLE_BUCKET = {
+    'BACKEND': 'grocereats_api.throttling.InProcessBucketBackend',
+    'OPTIONS': {},
+    'CAPACITY': 60,
+    'REFILL_RATE': 1.0,  # Tokens per second
+    'COSTS': {
+        'token_obtain_pair': 5,
+        'register': 5,
+        'shops': 10,
+        'list_orders': 10,
+        'export_orders': 30,
+        'shop_analytics': 10,
+        'pickup_point_clusters': 2,
+        'shops_in_bbox': 2,
+        'list_pickup_points': 5,
+        'list_subcategories': 3,
+        'list_categories': 3,
+        'view_stocks': 3,
+    },
+}
+
+# Most queries each endpoint may run, by URL name (see query_budget.py). MODE is 'raise'
+# (fail the request, used by the tests), 'log' (warn with a stack trace) or 'off', and
+# defaults to 'log' with DEBUG on and 'off' otherwise.
+QUERY_BUDGET = {
+    'MODE': None,
+    'DEFAULT': 10,
+    # The queries of the heaviest path of every route with several regions, on all databases and
+    # including streamed bodies, as counted by tests/test_query_budgets.py. Authentication takes one
+    # query. Writes include the ledger, forecast and shop card updates and the copies of mirrored rows.
+    'ROUTES': {
+        'index': 0,
+        'token_obtain_pair': 4,
+        'token_refresh': 9,
+        'register': 4,
+        'logout': 5,
+        'list_orders': 5,
+        'export_orders': 3,
+        'place_order': 12,
+        'order_detail': 12,
+        'add_item_to_order': 12,
+        'submit_order': 4,
+        'confirm_order': 7,
+        'cancel_order': 10,
+        'delete_item_from_order': 11,
+        'edit_item_quantity': 11,
+        'get_active_order': 4,
+        'list_carts': 5,
+        'checkout': 5,
+        'bulk_transition_orders': 15,
+        'view_stocks': 3,
+        'stock_forecast': 2,
+        'related_stocks': 4,
+        'add_stock': 9,
+        'remove_stock': 10,
+        'edit_stock': 10,
+        'shops': 10,
+        'shop_cards': 2,
+        'shops_in_bbox': 2,
+        'manage_shop': 6,
+        'shop_analytics': 8,
+        'rate_user_or_shop': 4,
+        'list_subcategories': 2,
+        'list_categories': 3,
+        'create_pickup_point': 5,
+        'list_pickup_points': 2,
+        'pickup_point_clusters': 2,
+        'profile': 3,
+        'list_profiles': 1,
+        'profile_detail': 1,
+        'region_summary': 7,
+        # The first request after a deployment builds the bundle
+        'catalog_bundle': 6,
+    },
+}
+
+# On demand request profiling (see profiling.py). Profiles are kept in DIR, the newest KEEP of them.
+PROFILING = {
+    'DIR': BASE_DIR / 'profiles',
+    'INTERVAL': 0.005,  # Seconds between two stack samples
+    'TOKEN_MAX_AGE': 3600,  # Seconds an X-Profile token stays valid
+    'KEEP': 200,
 }
 
 SIMPLE_JWT = {
@@ -111,8 +210,43 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
+    'TOKEN_REFRESH_SERIALIZER': 'grocereats_api.tokens.TokenRefreshSerializer',
+}
+
+# Seconds between reads of the tokens blacklisted by other workers into the revocation filter,
+# and between full rebuilds of the filter
+TOKEN_REVOCATION_SYNC_INTERVAL = 1
+TOKEN_REVOCATION_REBUILD_INTERVAL = 3600
+
+# Responses of order-mutating requests sent with an Idempotency-Key header are replayed
+# from this cache on retries. Use a shared backend (e.g. Redis) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+IDEMPOTENCY_CACHE = 'default'
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Seconds a shop's stock list is served from the cache, writes to its stock invalidate it sooner
+STOCK_LIST_CACHE_TTL = 5
+
+# Seconds between reloads of the in-memory "frequently bought together" table of each worker
+RECOMMENDATIONS_REFRESH_INTERVAL = 300
+
+# Offline catalog bundle served by GET /catalog/bundle/ (see catalog.py). It is rebuilt DEBOUNCE seconds
+# after the catalog changes, or by `manage.py build_catalog_bundle`. The newest KEEP bundles stay in DIR.
+CATALOG_BUNDLE = {
+    'DIR': BASE_DIR / 'catalog',
+    'DEBOUNCE': 5,
+    'KEEP': 3,
 }
 
+# Completed and cancelled orders older than this are moved to the archive tables by
+# `manage.py archive_orders`
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -137,7 +271,8 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-tmpPostgres = urlparse(getenv("DATABASE_URL"))
+# Without DATABASE_URL the settings still load (e.g. with config.test_settings), only connecting fails
+tmpPostgres = urlparse(getenv("DATABASE_URL", ""))
 
 # DATABASES = {
 #     'default': {
@@ -161,6 +296,21 @@ DATABASES = {
     }
 }
 
+# Regional shards (see regions.py). The shops, stocks and orders of a region live in its DATABASE,
+# users, pickup points, shops and categories are written to the default database and copied to the
+# others. A pickup point belongs to the first region whose BBOX (min_lat, min_long, max_lat, max_long)
+# contains it, or to DEFAULT_REGION. Requests go to the region of their X-Region header, else of the
+# shop they address, else of the user. For example, with a second database:
+#   DATABASES['cluj'] = {...}
+#   REGIONS['cluj'] = {'DATABASE': 'cluj', 'BBOX': (46.6, 23.4, 46.9, 23.8)}
+# then `manage.py migrate --database cluj` and `manage.py prepare_regions`.
+REGIONS = {
+    'default': {'DATABASE': 'default'},
+}
+DEFAULT_REGION = 'default'
+
+DATABASE_ROUTERS = ['grocereats_api.regions.RegionRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -198,6 +348,29 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded stock photos and their thumbnails. Point the default storage to an S3 compatible
+# backend (e.g. django-storages) to serve them from object storage instead of the local disk.
+MEDIA_URL = getenv('DJANGO_MEDIA_URL', '/media/')
+MEDIA_ROOT = BASE_DIR / 'media'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Thumbnail widths in pixels generated for every stock photo
+STOCK_THUMBNAIL_SIZES = {
+    'small': 160,
+    'medium': 320,
+    'large': 640,
+}
+STOCK_THUMBNAIL_WORKERS = 2
+STOCK_PHOTO_MAX_SIZE = 10 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
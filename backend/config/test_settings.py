@@ -0,0 +1,94 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=config.test_settings --parallel
+
+--parallel runs one test process per core (or DJANGO_TEST_PROCESSES of them), each on its own
+copy of the test database. By default the database is an in-memory SQLite, so no server is
+needed. Set TEST_DATABASE_URL to run against a local PostgreSQL instead, for the tests relying on
+row locks or PostgreSQL-only SQL: the test database is created once and cloned for every process
+with CREATE DATABASE ... TEMPLATE.
+
+The schema is created straight from the models instead of running the migrations.
+"""
+import tempfile
+from os import getenv
+from urllib.parse import urlparse
+
+from .settings import *  # noqa: F401,F403
+from .settings import QUERY_BUDGET, REST_FRAMEWORK
+
+
+class DisableMigrations:
+    """
+    MIGRATION_MODULES mapping every app to None, which makes the test runner create the tables with syncdb.
+    """
+
+    def __contains__(self, app_label):
+        return True
+
+    def __getitem__(self, app_label):
+        return None
+
+
+DEBUG = False
+
+testPostgres = urlparse(getenv('TEST_DATABASE_URL', ''))
+
+if testPostgres.hostname:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': testPostgres.path.replace('/', ''),
+            'USER': testPostgres.username,
+            'PASSWORD': testPostgres.password,
+            'HOST': testPostgres.hostname,
+            'PORT': testPostgres.port or 5432,
+        }
+    }
+    DATABASES['cluj'] = dict(DATABASES['default'], TEST={'NAME': f"test_{DATABASES['default']['NAME']}_cluj"})
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
+        'cluj': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
+    }
+
+MIGRATION_MODULES = DisableMigrations()
+
+# Hashing the passwords of the test users with PBKDF2 would dominate the run time
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Tests must not be rate limited, and fail when an endpoint goes over its query budget
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=[])
+QUERY_BUDGET = dict(QUERY_BUDGET, MODE='raise')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Uploaded photos stay in memory, profiles go to a directory of their own
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.InMemoryStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+PROFILING = dict(PROFILING, DIR=tempfile.mkdtemp(prefix='grocereats-profiles-'))  # noqa: F405
+CATALOG_BUNDLE = dict(CATALOG_BUNDLE, DIR=tempfile.mkdtemp(prefix='grocereats-catalog-'))  # noqa: F405
+
+# A single region by default. The second database is only created for the tests of the regional
+# partitioning, which declare it in `databases` and add its region with override_settings()
+REGIONS = {
+    'default': {'DATABASE': 'default'},
+}
+DEFAULT_REGION = 'default'
@@ -1,12 +1,190 @@
 from django.contrib import admin
-from .models import User, PickupPoint, Shop, Stock, Order, OrderItem, Category, SubCategory
-
-# Register models
-admin.site.register(User)
-admin.site.register(PickupPoint)
-admin.site.register(Shop)
-admin.site.register(Stock)
-admin.site.register(Order)
-admin.site.register(OrderItem)
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import User, PickupPoint, Shop, Stock, Order, OrderItem, Category, SubCategory, ShopCard, \
+    ArchivedOrder, ArchivedOrderItem, StockMovement, StockForecast, PickupPointCluster, \
+    StockCoOccurrence
+
+# Below this many rows the planner estimate is replaced by an exact count
+EXACT_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using PostgreSQL's row estimate instead of COUNT(*) for unfiltered changelists
+    of big tables. Filtered lists, small tables and other databases are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= EXACT_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableMixin:
+    """
+    Changelist settings for tables with millions of rows: estimated counts and no second COUNT(*)
+    of the whole table when filtering. Search fields use exact or prefix lookups so that they can
+    be answered from an index, the id lookups are only used for numeric search terms.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_fields(self, request):
+        search_fields = super().get_search_fields(request)
+        if request.GET.get(SEARCH_VAR, '').strip().isdigit():
+            return search_fields
+        return [field for field in search_fields if not field.endswith('id__exact')]
+
+
+class LargeTableAdmin(LargeTableMixin, admin.ModelAdmin):
+    """
+    Base admin of the big tables. Their subclasses list their foreign keys in raw_id_fields,
+    a select box would load the whole related table.
+    """
+
+
+@admin.register(User)
+class UserAdmin(LargeTableMixin, BaseUserAdmin):
+    list_display = ['id', 'username', 'email', 'role', 'rating', 'region', 'is_staff', 'date_joined']
+    list_filter = ['role', 'region', 'is_staff', 'is_active']
+    # username and email are unique, PostgreSQL also gets a pattern index for their prefix searches
+    search_fields = ['id__exact', 'username__startswith', 'email__startswith']
+    ordering = ['-id']
+    fieldsets = BaseUserAdmin.fieldsets + (
+        # The region of a staff user also picks the database the admin shows
+        ('GrocerEats', {'fields': ['phone', 'role', 'rating', 'region']}),
+    )
+    add_fieldsets = BaseUserAdmin.add_fieldsets + (
+        ('GrocerEats', {'fields': ['email', 'phone', 'role']}),
+    )
+
+
+@admin.register(Shop)
+class ShopAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'seller', 'pickup_point', 'region']
+    list_select_related = ['seller', 'pickup_point']
+    list_filter = ['region']
+    readonly_fields = ['region']
+    raw_id_fields = ['seller', 'pickup_point']
+    search_fields = ['id__exact', 'seller__username__startswith']
+
+
+@admin.register(Stock)
+class StockAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'shop', 'subcategory', 'price_per_unit', 'quantity', 'timestamp_last_modified']
+    list_select_related = ['shop', 'subcategory']
+    raw_id_fields = ['shop', 'subcategory']
+    search_fields = ['id__exact', 'shop__id__exact']
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ['stock']
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('stock')
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'buyer', 'shop', 'status', 'total_price', 'timestamp']
+    list_select_related = ['buyer', 'shop']
+    list_filter = ['status']
+    raw_id_fields = ['buyer', 'shop']
+    search_fields = ['id__exact', 'buyer__username__startswith', 'shop__id__exact']
+    date_hierarchy = 'timestamp'
+    inlines = [OrderItemInline]
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'order', 'stock', 'quantity', 'price_at_purchase']
+    list_select_related = ['order__shop', 'stock']
+    raw_id_fields = ['order', 'stock']
+    search_fields = ['order__id__exact', 'stock__id__exact']
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'buyer', 'shop', 'status', 'total_price', 'timestamp', 'archived_at']
+    list_select_related = ['buyer', 'shop']
+    list_filter = ['status']
+    raw_id_fields = ['buyer', 'shop']
+    search_fields = ['id__exact', 'buyer__username__startswith', 'shop__id__exact']
+    date_hierarchy = 'timestamp'
+
+
+@admin.register(ArchivedOrderItem)
+class ArchivedOrderItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'order', 'stock', 'quantity', 'price_at_purchase']
+    list_select_related = ['order__shop', 'stock']
+    raw_id_fields = ['order', 'stock']
+    search_fields = ['order__id__exact', 'stock__id__exact']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(LargeTableAdmin):
+    list_display = ['id', 'stock', 'order', 'quantity', 'reason', 'timestamp']
+    list_select_related = ['stock', 'order__shop']
+    list_filter = ['reason']
+    raw_id_fields = ['stock', 'order']
+    search_fields = ['stock__id__exact', 'order__id__exact']
+
+
+@admin.register(StockForecast)
+class StockForecastAdmin(LargeTableAdmin):
+    list_display = ['stock', 'daily_demand', 'day', 'day_demand']
+    list_select_related = ['stock']
+    raw_id_fields = ['stock']
+    search_fields = ['stock__id__exact']
+
+
+@admin.register(StockCoOccurrence)
+class StockCoOccurrenceAdmin(LargeTableAdmin):
+    list_display = ['id', 'stock', 'other', 'count']
+    list_select_related = ['stock', 'other']
+    raw_id_fields = ['stock', 'other']
+    search_fields = ['stock__id__exact']
+
+
+@admin.register(ShopCard)
+class ShopCardAdmin(LargeTableAdmin):
+    list_display = ['shop_id', 'name', 'pickup_point_name', 'rating', 'stock_count', 'completed_orders']
+    raw_id_fields = ['shop', 'pickup_point']
+    search_fields = ['shop__id__exact', 'name__startswith']
+
+
+@admin.register(PickupPoint)
+class PickupPointAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'address', 'lat', 'long', 'region']
+    list_filter = ['region']
+    readonly_fields = ['region']
+    search_fields = ['id__exact', 'name__startswith']
+
+
+@admin.register(PickupPointCluster)
+class PickupPointClusterAdmin(LargeTableAdmin):
+    list_display = ['id', 'zoom', 'cell_x', 'cell_y', 'count']
+    list_filter = ['zoom']
+
+
+@admin.register(SubCategory)
+class SubCategoryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'category']
+    list_select_related = ['category']
+
+
 admin.site.register(Category)
-admin.site.register(SubCategory)
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncWeek
+from .models import OrderItem, ArchivedOrderItem
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+}
+
+CENTS = Decimal('0.01')
+
+LINE_TOTAL = ExpressionWrapper(F('price_at_purchase') * F('quantity'),
+                               output_field=DecimalField(max_digits=20, decimal_places=4))
+
+
+def _items(model, shop, date_from, date_to):
+    items = model.objects.filter(order__shop=shop, order__status='completed', order__timestamp__gte=date_from,
+                                 order__timestamp__lt=date_to)
+    # Drop the default ordering so that it does not end up in the GROUP BY clauses
+    return items.order_by()
+
+
+def _money(value):
+    return str((value or Decimal(0)).quantize(CENTS))
+
+
+def shop_sales(shop, granularity, date_from, date_to):
+    """
+    Computes the sales figures of a shop's completed orders between two datetimes.
+    Every figure is a GROUP BY pushed to the database, run on the live and the archived
+    order items, so only one row per period, stock or subcategory is loaded.
+    """
+    trunc = GRANULARITIES[granularity]
+    periods = defaultdict(lambda: {'revenue': Decimal(0), 'units': Decimal(0), 'orders': 0})
+    stocks = defaultdict(lambda: {'name': None, 'revenue': Decimal(0), 'units': Decimal(0)})
+    subcategories = defaultdict(Decimal)
+
+    for model in (OrderItem, ArchivedOrderItem):
+        items = _items(model, shop, date_from, date_to)
+
+        for row in items.annotate(period=trunc('order__timestamp')).values('period').annotate(
+                revenue=Sum(LINE_TOTAL), units=Sum('quantity'), orders=Count('order', distinct=True)):
+            period = periods[row['period']]
+            period['revenue'] += row['revenue']
+            period['units'] += row['units']
+            period['orders'] += row['orders']
+
+        for row in items.values('stock_id', 'stock__name').annotate(revenue=Sum(LINE_TOTAL), units=Sum('quantity')):
+            stock = stocks[row['stock_id']]
+            stock['name'] = row['stock__name']
+            stock['revenue'] += row['revenue']
+            stock['units'] += row['units']
+
+        for row in items.values('stock__subcategory__name').annotate(revenue=Sum(LINE_TOTAL)):
+            subcategories[row['stock__subcategory__name']] += row['revenue']
+
+    revenue = sum(period['revenue'] for period in periods.values())
+    order_count = sum(period['orders'] for period in periods.values())
+
+    return {
+        'granularity': granularity,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'totals': {
+            'revenue': _money(revenue),
+            'orders': order_count,
+            'units': str(sum(period['units'] for period in periods.values())),
+            'average_basket': _money(revenue / order_count if order_count else 0),
+        },
+        'periods': [
+            {
+                'period': period.date().isoformat(),
+                'revenue': _money(values['revenue']),
+                'orders': values['orders'],
+                'units': str(values['units']),
+                'average_basket': _money(values['revenue'] / values['orders']),
+            }
+            for period, values in sorted(periods.items())
+        ],
+        'stocks': [
+            {'id': stock_id, 'name': values['name'], 'units': str(values['units']), 'revenue': _money(values['revenue'])}
+            for stock_id, values in sorted(stocks.items(), key=lambda stock: stock[1]['revenue'], reverse=True)
+        ],
+        'subcategories': [
+            {'name': name, 'revenue': _money(value), 'share': round(float(value / revenue), 4) if revenue else 0}
+            for name, value in sorted(subcategories.items(), key=lambda subcategory: subcategory[1], reverse=True)
+        ],
+    }
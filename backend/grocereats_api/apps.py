@@ -1,6 +1,16 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_save, post_delete
 
 
 class GrocereatsApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'grocereats_api'
+
+    def ready(self):
+        # Connect the receivers that keep the read models up to date
+        from . import regions, signals
+
+        for label in regions.MIRRORED_MODELS:
+            model = apps.get_model(label)
+            post_save.connect(signals.mirror_saved, sender=model, dispatch_uid=f'mirror_saved_{label}')
+            post_delete.connect(signals.mirror_deleted, sender=model, dispatch_uid=f'mirror_deleted_{label}')
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from rest_framework.renderers import JSONRenderer
+from .models import Category, SubCategory, PickupPoint, Shop
+from .serializers import CategorySerializer, SubCategorySerializer, PickupPointSerializer, ShopSerializer, \
+    UserSerializer
+
+logger = logging.getLogger(__name__)
+
+# Name of the file holding the version of the current bundle, replaced atomically on every build
+CURRENT = 'current'
+CHUNK_SIZE = 64 * 1024
+
+# Shops embed their seller, changes to these user fields change the catalog
+SELLER_FIELDS = frozenset(UserSerializer.Meta.fields)
+
+
+def _directory():
+    directory = Path(settings.CATALOG_BUNDLE['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def bundle_name(version):
+    return f'catalog-{version}.json.gz'
+
+
+def snapshot():
+    """
+    Returns the catalog as the four list endpoints serve it, rendered to JSON.
+    """
+    return JSONRenderer().render({
+        'categories': CategorySerializer(Category.objects.prefetch_related('subcategories__category'), many=True).data,
+        'subcategories': SubCategorySerializer(SubCategory.objects.select_related('category'), many=True).data,
+        'pickup_points': PickupPointSerializer(PickupPoint.objects.all(), many=True).data,
+        'shops': ShopSerializer(Shop.objects.select_related('seller', 'pickup_point'), many=True).data,
+    })
+
+
+def _write_atomically(path, data):
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+        file.write(data)
+    os.replace(file.name, path)
+
+
+def build():
+    """
+    Writes the gzipped snapshot under a name derived from its content and makes it the current
+    bundle. Returns its version. An unchanged catalog yields the same version and writes nothing.
+    """
+    data = snapshot()
+    version = hashlib.sha256(data).hexdigest()[:16]
+    directory = _directory()
+
+    path = directory / bundle_name(version)
+    if not path.exists():
+        # mtime=0 keeps the compressed bytes a function of the content
+        _write_atomically(path, gzip.compress(data, compresslevel=9, mtime=0))
+    current = directory / CURRENT
+    if not current.exists() or current.read_text().strip() != version:
+        _write_atomically(current, version.encode())
+
+    # Only the newest bundles are kept, a deleted bundle stays readable through the maps of the workers
+    bundles = sorted(directory.glob('catalog-*.json.gz'), key=lambda bundle: bundle.stat().st_mtime, reverse=True)
+    for bundle in bundles[settings.CATALOG_BUNDLE['KEEP']:]:
+        if bundle != path:
+            bundle.unlink(missing_ok=True)
+    return version
+
+
+class _Rebuild:
+    """
+    Rebuilds the bundle in a background thread CATALOG_BUNDLE['DEBOUNCE'] seconds after the first
+    change of the catalog, so that a burst of changes costs one build.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def schedule(self):
+        with self.lock:
+            if self.timer is not None:
+                return
+            self.timer = threading.Timer(settings.CATALOG_BUNDLE['DEBOUNCE'], self._run)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _run(self):
+        with self.lock:
+            self.timer = None
+        try:
+            build()
+        except Exception:
+            logger.exception('Could not rebuild the catalog bundle')
+        finally:
+            connections.close_all()
+
+
+_rebuild = _Rebuild()
+
+
+def schedule_rebuild():
+    transaction.on_commit(_rebuild.schedule)
+
+
+class Bundle:
+    """
+    The current bundle of a worker, memory-mapped so that every worker serves the same pages of the
+    page cache. Checking for a newer bundle costs one stat() of the CURRENT file per request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None  # (mtime of CURRENT, version, mapped bundle)
+
+    def _open(self, directory, mtime):
+        version = (directory / CURRENT).read_text().strip()
+        with open(directory / bundle_name(version), 'rb') as file:
+            # The map stays valid after the file is closed, and after it is deleted
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mtime, version, mapped
+
+    def current(self):
+        """
+        Returns the version and the mapped gzip of the current bundle, building one when there is none.
+        """
+        directory = Path(settings.CATALOG_BUNDLE['DIR'])
+        try:
+            mtime = (directory / CURRENT).stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        state = self.state
+        if state is None or state[0] != mtime:
+            with self.lock:
+                if self.state is None or self.state[0] != mtime:
+                    if mtime is None:
+                        build()
+                        mtime = (directory / CURRENT).stat().st_mtime_ns
+                    # The previous map is left to the garbage collector, a response may still stream it
+                    self.state = self._open(directory, mtime)
+                state = self.state
+        return state[1], state[2]
+
+
+bundle = Bundle()
+
+
+def stream(mapped):
+    view = memoryview(mapped)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE]
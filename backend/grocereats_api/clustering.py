@@ -0,0 +1,109 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+from . import geo
+from .models import PickupPoint, PickupPointCluster
+
+# Clusters are precomputed for zoom levels 0 to MAX_ZOOM, deeper zooms reuse MAX_ZOOM
+MAX_ZOOM = 16
+# Each 256px map tile is split into CELLS_PER_TILE x CELLS_PER_TILE cells of 64px
+CELLS_PER_TILE = 4
+
+COORDINATE_PRECISION = Decimal('0.000001')
+
+
+def cells(lat, long):
+    """
+    Returns the (zoom, cell_x, cell_y) of the cell containing the point at every zoom level.
+    """
+    return [
+        (zoom, geo.cell_x(long, zoom, CELLS_PER_TILE), geo.cell_y(lat, zoom, CELLS_PER_TILE))
+        for zoom in range(MAX_ZOOM + 1)
+    ]
+
+
+@transaction.atomic
+def _apply(lat, long, sign):
+    point_cells = cells(lat, long)
+    if sign > 0:
+        PickupPointCluster.objects.bulk_create(
+            [PickupPointCluster(zoom=zoom, cell_x=x, cell_y=y) for zoom, x, y in point_cells],
+            ignore_conflicts=True,
+        )
+    # The point changes all of its cells by the same amounts, so one UPDATE covers every zoom level
+    matching = reduce(or_, (Q(zoom=zoom, cell_x=x, cell_y=y) for zoom, x, y in point_cells))
+    PickupPointCluster.objects.filter(matching).update(
+        count=F('count') + sign,
+        lat_sum=F('lat_sum') + sign * Decimal(lat),
+        long_sum=F('long_sum') + sign * Decimal(long),
+    )
+    if sign < 0:
+        PickupPointCluster.objects.filter(matching, count__lte=0).delete()
+
+
+def add(pickup_point):
+    _apply(pickup_point.lat, pickup_point.long, 1)
+
+
+def remove(pickup_point):
+    _apply(pickup_point.lat, pickup_point.long, -1)
+
+
+@transaction.atomic
+def move(pickup_point, previous_lat, previous_long):
+    """
+    Moves a pickup point whose coordinates changed from the cells of its previous position to those of its new one.
+    """
+    _apply(previous_lat, previous_long, -1)
+    _apply(pickup_point.lat, pickup_point.long, 1)
+
+
+@transaction.atomic
+def rebuild():
+    """
+    Recomputes every cell from the pickup points table.
+    """
+    totals = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for lat, long in PickupPoint.objects.values_list('lat', 'long').iterator():
+        for key in cells(lat, long):
+            total = totals[key]
+            total[0] += 1
+            total[1] += lat
+            total[2] += long
+
+    PickupPointCluster.objects.all().delete()
+    PickupPointCluster.objects.bulk_create(
+        [
+            PickupPointCluster(zoom=zoom, cell_x=x, cell_y=y, count=count, lat_sum=lat_sum, long_sum=long_sum)
+            for (zoom, x, y), (count, lat_sum, long_sum) in totals.items()
+        ],
+        batch_size=5000,
+    )
+    return len(totals)
+
+
+def clusters_in_bbox(min_lat, min_long, max_lat, max_long, zoom):
+    """
+    Returns the clusters of the cells overlapping the bounding box, with their centroid and size.
+    """
+    zoom = max(0, min(zoom, MAX_ZOOM))
+    # Rows grow southwards, so the northern edge gives the smallest row
+    rows = (geo.cell_y(max_lat, zoom, CELLS_PER_TILE), geo.cell_y(min_lat, zoom, CELLS_PER_TILE))
+    matching = reduce(or_, (
+        Q(cell_x__range=(geo.cell_x(west, zoom, CELLS_PER_TILE), geo.cell_x(east, zoom, CELLS_PER_TILE)))
+        for west, east in geo.long_ranges(min_long, max_long)
+    ))
+    queryset = PickupPointCluster.objects.filter(matching, zoom=zoom, cell_y__range=rows, count__gt=0)
+
+    return zoom, [
+        {
+            'lat': str((lat_sum / count).quantize(COORDINATE_PRECISION)),
+            'long': str((long_sum / count).quantize(COORDINATE_PRECISION)),
+            'count': count,
+        }
+        for count, lat_sum, long_sum in queryset.values_list('count', 'lat_sum', 'long_sum')
+    ]
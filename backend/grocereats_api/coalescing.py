@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .regions import current_database
+
+
+class SingleFlight:
+    """
+    Runs a computation once for all the threads asking for the same key at the same time:
+    the first caller computes, the others wait for its result (or its exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, compute):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+
+        if leader:
+            try:
+                call.result = compute()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+stock_flights = SingleFlight()
+
+
+def _version_key(shop_id):
+    return f'stocks:version:{shop_id}'
+
+
+def stock_list_version(shop_id):
+    # Versions are timestamps rather than counters so that an evicted version never comes back
+    return cache.get_or_set(_version_key(shop_id), time.time_ns, timeout=None)
+
+
+def invalidate_stock_lists(*shop_ids, using=None):
+    """
+    Makes the cached stock lists of the shops stale once the current transaction of `using`
+    commits, the database of the current region by default.
+    """
+    def bump():
+        cache.set_many({_version_key(shop_id): time.time_ns() for shop_id in shop_ids}, timeout=None)
+
+    if shop_ids:
+        transaction.on_commit(bump, using=using or current_database())
+
+
+def cached_stock_list(shop_id, variant, compute):
+    """
+    Returns the stock list of a shop, computing it at most once per STOCK_LIST_CACHE_TTL and
+    stock version however many requests ask for it concurrently. `variant` distinguishes the
+    different listings of the same shop.
+    """
+    key = f'stocks:{shop_id}:{stock_list_version(shop_id)}:{variant}'
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    def compute_and_store():
+        result = compute()
+        cache.set(key, result, timeout=settings.STOCK_LIST_CACHE_TTL)
+        return result
+
+    return stock_flights.do(key, compute_and_store)
@@ -0,0 +1,113 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import chain, groupby
+from operator import itemgetter
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from . import regions
+from .models import Order, ArchivedOrder
+
+# Rows fetched from the server-side cursor at a time
+CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = ['order_id', 'timestamp', 'status', 'buyer', 'total_price']
+ITEM_COLUMNS = ['stock_id', 'stock', 'quantity', 'price_at_purchase']
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Only lets `?format=csv` through content negotiation, the export view streams the body itself.
+    What it renders are the errors of the view, as JSON labelled as such.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+
+class NDJSONRenderer(CSVRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def parse_bound(value, end=False):
+    """
+    Parses a `from`/`to` query parameter given as a date or an ISO datetime.
+    A date used as the upper bound includes the whole day.
+    """
+    if not value:
+        return None
+    # Dates first, parse_datetime() also reads a plain date as its midnight
+    try:
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        day = moment = None
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif moment is None:
+        raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def order_rows(seller, date_from=None, date_to=None):
+    """
+    Yields one tuple per order item of the seller's closed orders, archived ones included.
+    Orders and their items come from a single LEFT JOIN read through a server-side cursor,
+    so memory does not grow with the size of the history.
+    The rows are read lazily, after the request's region was reset: the database of the region
+    current at call time is bound to the querysets.
+    """
+    database = regions.current_database()
+    fields = ['id', 'timestamp', 'status', 'buyer__username', 'total_price',
+              'items__stock_id', 'items__stock__name', 'items__quantity', 'items__price_at_purchase']
+    querysets = [
+        ArchivedOrder.objects.using(database).filter(shop__seller=seller),
+        Order.objects.using(database).filter(shop__seller=seller).exclude(status='active'),
+    ]
+    for i, queryset in enumerate(querysets):
+        if date_from:
+            queryset = queryset.filter(timestamp__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(timestamp__lt=date_to)
+        querysets[i] = queryset.order_by('timestamp', 'id', 'items__id') \
+            .values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    return chain(*querysets)
+
+
+class _Echo:
+    """
+    File-like object handing back what csv.writer writes to it.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(ORDER_COLUMNS + ITEM_COLUMNS)
+    for row in rows:
+        order_id, timestamp, *rest = row
+        yield writer.writerow([order_id, timestamp.isoformat(), *('' if value is None else value for value in rest)])
+
+
+def stream_ndjson(rows):
+    # Rows of the same order are consecutive, fold them into one line per order
+    for order_id, order_rows in groupby(rows, key=itemgetter(0)):
+        items = []
+        for row in order_rows:
+            if row[5] is not None:
+                items.append(dict(zip(ITEM_COLUMNS, (row[5], row[6], str(row[7]), str(row[8])))))
+        _, timestamp, order_status, buyer, total_price = row[:5]
+        line = dict(zip(ORDER_COLUMNS, (order_id, timestamp.isoformat(), order_status, buyer, str(total_price))))
+        line['items'] = items
+        yield json.dumps(line) + '\n'
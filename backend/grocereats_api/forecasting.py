@@ -0,0 +1,105 @@
+from collections import defaultdict
+from decimal import Decimal
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from . import regions
+from .models import StockMovement, StockForecast
+
+# Weight of the latest day in the exponentially smoothed daily demand
+ALPHA = Decimal('0.3')
+# Days of ledger history replayed by rebuild()
+WINDOW_DAYS = 90
+
+DEMAND_PRECISION = Decimal('0.0001')
+
+
+def fold(daily_demand, day, day_demand, today):
+    """
+    Returns the smoothed daily demand as of today: the demand of `day` is folded in,
+    followed by a zero demand for every day between `day` and today. Restored stock counts
+    against the demand of the day it is given back, a day giving back more than it took
+    counts as no demand rather than a negative one.
+    """
+    gap = (today - day).days
+    if gap <= 0:
+        return daily_demand
+    daily_demand = ALPHA * max(day_demand, 0) + (1 - ALPHA) * daily_demand
+    return (daily_demand * (1 - ALPHA) ** (gap - 1)).quantize(DEMAND_PRECISION)
+
+
+def current_demand(forecast, today=None):
+    return fold(forecast.daily_demand, forecast.day, forecast.day_demand, today or timezone.localdate())
+
+
+def days_until_stockout(quantity, daily_demand):
+    if daily_demand <= 0:
+        return None
+    return round(float(max(quantity, 0) / daily_demand), 1)
+
+
+@regions.atomic
+def observe(movements):
+    """
+    Updates the forecasts of the stocks affected by freshly recorded movements.
+    Only one row per stock is read and written, however long the ledger is.
+    """
+    today = timezone.localdate()
+    demand = defaultdict(Decimal)
+    for movement in movements:
+        # Deductions are negative movements, so the demand is the opposite of their sum
+        demand[movement.stock_id] -= Decimal(movement.quantity)
+
+    forecasts = StockForecast.objects.select_for_update().in_bulk(list(demand))
+    created = []
+    for stock_id, quantity in demand.items():
+        forecast = forecasts.get(stock_id)
+        if forecast is None:
+            created.append(StockForecast(stock_id=stock_id, day=today, day_demand=quantity))
+        elif forecast.day < today:
+            forecast.daily_demand = current_demand(forecast, today)
+            forecast.day = today
+            forecast.day_demand = quantity
+        else:
+            forecast.day_demand += quantity
+
+    StockForecast.objects.bulk_create(created)
+    StockForecast.objects.bulk_update(forecasts.values(), ['daily_demand', 'day', 'day_demand'])
+
+
+@regions.atomic
+def rebuild(stocks):
+    """
+    Recomputes the forecasts of the given stocks from the last WINDOW_DAYS of the ledger.
+    The daily demand of all the stocks is read with a single GROUP BY.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=WINDOW_DAYS)
+    stock_ids = list(stocks.values_list('id', flat=True))
+
+    series = defaultdict(dict)
+    rows = StockMovement.objects.filter(stock_id__in=stock_ids, timestamp__date__gte=start).order_by() \
+        .values('stock_id', day=TruncDate('timestamp')).annotate(quantity=Sum('quantity'))
+    for row in rows:
+        series[row['stock_id']][row['day']] = -row['quantity']
+
+    forecasts = []
+    for stock_id in stock_ids:
+        daily_demand = Decimal(0)
+        day = start
+        for demand_day, quantity in sorted(series[stock_id].items()):
+            if demand_day == today:
+                break
+            # Days without movements count as zero demand
+            daily_demand = fold(daily_demand, day, Decimal(0), demand_day)
+            day = demand_day + timedelta(days=1)
+            daily_demand = fold(daily_demand, demand_day, quantity, day)
+        daily_demand = fold(daily_demand, day, Decimal(0), today)
+        forecasts.append(StockForecast(stock_id=stock_id, daily_demand=daily_demand, day=today,
+                                       day_demand=series[stock_id].get(today, Decimal(0))))
+
+    StockForecast.objects.bulk_create(forecasts, update_conflicts=True, unique_fields=['stock'],
+                                      update_fields=['daily_demand', 'day', 'day_demand'])
+    return len(forecasts)
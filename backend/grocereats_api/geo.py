@@ -0,0 +1,48 @@
+import math
+
+# Web Mercator cannot represent the poles, map tiles stop at this latitude
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def cells_per_axis(zoom, cells_per_tile):
+    return (2 ** zoom) * cells_per_tile
+
+
+def cell_x(long, zoom, cells_per_tile):
+    n = cells_per_axis(zoom, cells_per_tile)
+    return min(int((float(long) + 180) / 360 * n), n - 1)
+
+
+def cell_y(lat, zoom, cells_per_tile):
+    """
+    Row of the Web Mercator grid containing the latitude, rows grow southwards like map tiles do.
+    """
+    n = cells_per_axis(zoom, cells_per_tile)
+    lat = math.radians(max(min(float(lat), MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT))
+    return min(max(int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n), 0), n - 1)
+
+
+def parse_bbox(min_lat, min_long, max_lat, max_long):
+    """
+    Validates a bounding box. min_long may be greater than max_long when the box crosses
+    the antimeridian. Raises ValueError for malformed boxes.
+    """
+    try:
+        min_lat, min_long, max_lat, max_long = (float(value) for value in (min_lat, min_long, max_lat, max_long))
+    except (TypeError, ValueError):
+        raise ValueError('The bounding box coordinates must be numbers.')
+
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError('Latitudes must be between -90 and 90, with min_lat <= max_lat.')
+    if not (-180 <= min_long <= 180 and -180 <= max_long <= 180):
+        raise ValueError('Longitudes must be between -180 and 180.')
+    return min_lat, min_long, max_lat, max_long
+
+
+def long_ranges(min_long, max_long):
+    """
+    Splits the longitude span of a bounding box into one or two ranges that do not cross the antimeridian.
+    """
+    if min_long <= max_long:
+        return [(min_long, max_long)]
+    return [(min_long, 180), (-180, max_long)]
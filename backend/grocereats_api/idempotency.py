@@ -0,0 +1,72 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# How long a request may hold its key before a retry is allowed to run the handler again
+LOCK_TIMEOUT = 30
+
+
+def _store():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+def _fingerprint(request, args, kwargs):
+    payload = json.dumps([request.path, args, kwargs, request.data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def idempotent(view):
+    """
+    Replays the stored response of a mutating view when a client retries it with the same
+    Idempotency-Key header, instead of running the handler (and its stock updates) again.
+
+    Results are kept in the IDEMPOTENCY_CACHE cache for IDEMPOTENCY_KEY_TTL, scoped to the
+    user and the view. Requests without the header are handled as usual.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        store = _store()
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        cache_key = f'idempotency:{request.user.pk}:{view.__name__}:{digest}'
+        fingerprint = _fingerprint(request, args, kwargs)
+
+        stored = store.get(cache_key)
+        if stored is not None:
+            stored_fingerprint, status_code, data = stored
+            if stored_fingerprint != fingerprint:
+                return Response({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request.'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            response = Response(data, status=status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        # Only one request per key runs the handler at a time
+        lock_key = f'{cache_key}:lock'
+        if not store.add(lock_key, fingerprint, timeout=LOCK_TIMEOUT):
+            return Response({'error': 'A request with this Idempotency-Key is already being processed.'},
+                            status=status.HTTP_409_CONFLICT)
+        try:
+            response = view(request, *args, **kwargs)
+            # Server errors are not cached so that the client can retry them
+            if response.status_code < 500 and isinstance(response, Response):
+                ttl = settings.IDEMPOTENCY_KEY_TTL.total_seconds()
+                store.set(cache_key, (fingerprint, response.status_code, response.data), timeout=ttl)
+            return response
+        finally:
+            store.delete(lock_key)
+
+    return wrapper
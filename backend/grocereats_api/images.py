@@ -0,0 +1,110 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the accepted image formats -> file extension
+SIGNATURES = {
+    b'\xff\xd8\xff': 'jpg',
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+}
+
+THUMBNAIL_QUALITY = 85
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def sniff_extension(data):
+    """
+    Returns the extension of an uploaded image from its first bytes, None if it is not a supported image.
+    """
+    for signature, extension in SIGNATURES.items():
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def original_name(photo_hash):
+    # Kept to regenerate the thumbnails if the sizes change, never served to the app
+    return f'stocks/originals/{photo_hash}'
+
+
+def thumbnail_name(photo_hash, size):
+    # The name only depends on the content and the size, so a file never has to be rewritten
+    return f'stocks/thumbnails/{photo_hash}-{settings.STOCK_THUMBNAIL_SIZES[size]}.jpg'
+
+
+def thumbnail_urls(photo_hash):
+    if not photo_hash:
+        return None
+    return {size: default_storage.url(thumbnail_name(photo_hash, size)) for size in settings.STOCK_THUMBNAIL_SIZES}
+
+
+def render_thumbnails(data, widths):
+    """
+    Encodes one JPEG per width, never wider than the original. Runs in the worker processes.
+    """
+    from PIL import Image, ImageOps
+
+    thumbnails = {}
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for width in widths:
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+            buffer = io.BytesIO()
+            resized.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            thumbnails[width] = buffer.getvalue()
+    return thumbnails
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.STOCK_THUMBNAIL_WORKERS)
+        return _executor
+
+
+def _save_thumbnails(photo_hash, future):
+    try:
+        thumbnails = future.result()
+    except Exception:
+        logger.exception('Could not generate the thumbnails of photo %s', photo_hash)
+        return
+    for size, width in settings.STOCK_THUMBNAIL_SIZES.items():
+        name = thumbnail_name(photo_hash, size)
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(thumbnails[width]))
+
+
+def store_photo(upload):
+    """
+    Stores an uploaded photo, already checked with sniff_extension(), under the hash of its content
+    and returns the hash. The thumbnails are generated by a process pool after the request, until
+    they exist their URLs are not found. Uploading a photo that is already stored does no work.
+    """
+    data = upload.read()
+    photo_hash = hashlib.sha256(data).hexdigest()[:40]
+
+    if not default_storage.exists(original_name(photo_hash)):
+        default_storage.save(original_name(photo_hash), ContentFile(data))
+
+    missing = [size for size in settings.STOCK_THUMBNAIL_SIZES
+               if not default_storage.exists(thumbnail_name(photo_hash, size))]
+    if missing:
+        future = _get_executor().submit(render_thumbnails, data, sorted(set(settings.STOCK_THUMBNAIL_SIZES.values())))
+        future.add_done_callback(lambda done: _save_thumbnails(photo_hash, done))
+    return photo_hash
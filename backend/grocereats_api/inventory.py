@@ -0,0 +1,16 @@
+from . import forecasting
+from .models import StockMovement
+
+
+def record_movements(movements):
+    """
+    Writes stock movements to the ledger and feeds them to the demand forecasts.
+    """
+    if not movements:
+        return
+    StockMovement.objects.bulk_create(movements)
+    forecasting.observe(movements)
+
+
+def record_movement(stock, quantity, reason, order=None):
+    record_movements([StockMovement(stock=stock, quantity=quantity, reason=reason, order=order)])
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from grocereats_api import regions
+from grocereats_api.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+ARCHIVED_STATUSES = ['completed', 'cancelled']
+
+
+class Command(BaseCommand):
+    help = "Moves completed and cancelled orders older than a given age into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help='Archive closed orders placed more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of orders moved per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches (the next run resumes where this one stopped).')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        batch_size = options['batch_size']
+
+        total = 0
+        # Orders are archived in the database they live in, one region database after the other
+        for region in regions.database_regions():
+            batches = 0
+            with regions.use_region(region):
+                while options['max_batches'] is None or batches < options['max_batches']:
+                    moved = self.archive_batch(cutoff, batch_size)
+                    if not moved:
+                        break
+                    total += moved
+                    batches += 1
+                    self.stdout.write(f'Archived {total} orders so far...')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} orders placed before {cutoff:%Y-%m-%d %H:%M}.'))
+
+    @regions.atomic
+    def archive_batch(self, cutoff, batch_size):
+        """
+        Moves one batch of orders and their items. Every batch commits on its own, so an
+        interrupted run loses nothing and the next run picks up the remaining orders.
+        """
+        order_ids = list(
+            Order.objects.filter(status__in=ARCHIVED_STATUSES, timestamp__lt=cutoff)
+            .order_by('id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return 0
+
+        orders = Order.objects.filter(id__in=order_ids).values(
+            'id', 'buyer_id', 'shop_id', 'total_price', 'status', 'timestamp'
+        )
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+
+        items = OrderItem.objects.filter(order_id__in=order_ids).values(
+            'id', 'order_id', 'stock_id', 'quantity', 'price_at_purchase'
+        )
+        ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+        return len(order_ids)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from grocereats_api import catalog
+
+
+class Command(BaseCommand):
+    help = "Builds the offline catalog bundle served by /catalog/bundle/ and makes it the current one."
+
+    def handle(self, *args, **options):
+        version = catalog.build()
+        self.stdout.write(self.style.SUCCESS(f'Catalog bundle {version} is current.'))
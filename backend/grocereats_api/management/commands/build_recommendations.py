@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from grocereats_api import recommendations, regions
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the stock co-occurrence index behind the \"frequently bought together\" "
+            "recommendations from all completed orders, in every region database.")
+
+    def handle(self, *args, **options):
+        count = 0
+        for region in regions.database_regions():
+            with regions.use_region(region):
+                count += recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} pairs of stocks bought together.'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.db.models.functions import Round
+from grocereats_api import regions
+from grocereats_api.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from grocereats_api.money import derived_total
+
+# Drifted orders listed by the report
+SAMPLE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = ("Re-derives the total of every order from its items in SQL and reports the orders whose stored "
+            "total_price drifted from it. With --fix, the drifted totals are rewritten in bulk.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite the drifted totals with the derived ones.')
+
+    def handle(self, *args, **options):
+        drifted_count = 0
+        for region in regions.database_regions():
+            with regions.use_region(region):
+                drifted_count += self.check(options['fix'])
+
+        if not drifted_count:
+            self.stdout.write(self.style.SUCCESS('Every order total matches its items.'))
+
+    def check(self, fix):
+        drifted_count = 0
+        for model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            with regions.atomic():
+                # Rounding the stored side too keeps backends emulating decimals with floats (SQLite) exact
+                drifted = model.objects.annotate(derived=derived_total(item_model), stored=Round('total_price', 2)) \
+                    .exclude(stored=F('derived'))
+                count = drifted.count()
+                drifted_count += count
+                if not count:
+                    continue
+
+                self.stdout.write(f'{count} {model._meta.verbose_name_plural} with a drifted total:')
+                for order_id, stored, derived in drifted.order_by('id').values_list('id', 'total_price', 'derived')[:SAMPLE_SIZE]:
+                    self.stdout.write(f'  #{order_id}: stored {stored}, items add up to {derived:.2f}')
+
+                if fix:
+                    fixed = model.objects.filter(id__in=drifted.values('id')).update(total_price=derived_total(item_model))
+                    self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} {model._meta.verbose_name_plural}.'))
+        return drifted_count
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from grocereats_api import forecasting, regions
+from grocereats_api.models import Shop, Stock
+
+
+class Command(BaseCommand):
+    help = "Recomputes the demand forecasts of all stocks from the stock movement ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, action='append', dest='shops',
+                            help='Only recompute the stocks of this shop id (can be repeated).')
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.all()
+        if options['shops']:
+            shops = shops.filter(id__in=options['shops'])
+
+        count = 0
+        for shop_id, region in shops.values_list('id', 'region').iterator():
+            with regions.use_region(region):
+                count += forecasting.rebuild(Stock.objects.filter(shop_id=shop_id))
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed the forecasts of {count} stocks.'))
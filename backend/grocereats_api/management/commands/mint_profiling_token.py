@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from grocereats_api.models import User
+from grocereats_api.profiling import mint_token
+
+
+class Command(BaseCommand):
+    help = ("Prints a token that profiles the requests sending it in an X-Profile header, "
+            "optionally only the requests of one user.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username whose requests the token is limited to.')
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options['user']:
+            try:
+                user_id = User.objects.get(username=options['user']).id
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["user"]}.')
+
+        self.stdout.write(mint_token(user_id))
+        self.stderr.write(f'Valid for {settings.PROFILING["TOKEN_MAX_AGE"]} seconds.')
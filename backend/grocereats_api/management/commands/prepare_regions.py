@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max
+from grocereats_api import regions
+from grocereats_api.models import User, PickupPoint, Shop, Category, SubCategory, Stock, Order, OrderItem, \
+    StockMovement, StockCoOccurrence
+
+# Referenced models first, so that the foreign keys of the copies are satisfied
+MIRRORED = [Category, SubCategory, User, PickupPoint, Shop]
+# Sharded models whose ids come from a sequence
+SEQUENCED = [Stock, Order, OrderItem, StockMovement, StockCoOccurrence]
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ("Prepares the region databases after adding one: copies the users, pickup points, shops and "
+            "categories of the default database to the others, and on PostgreSQL interleaves the id "
+            "sequences of the sharded tables so that ids never collide between databases.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mirror-only', action='store_true', help='Only copy the mirrored rows.')
+        parser.add_argument('--sequences-only', action='store_true', help='Only interleave the id sequences.')
+
+    def handle(self, *args, **options):
+        databases = regions.databases()
+        if not options['sequences_only']:
+            for database in databases:
+                if database != DEFAULT_DB_ALIAS:
+                    self.copy_mirrored(database)
+        if regions.is_partitioned() and not options['mirror_only']:
+            # Every sequence restarts past the largest id of all the databases, rows inserted with
+            # their ids in one database (seed_perf) must not be handed out again by another
+            max_ids = {
+                model: max(model._base_manager.using(database).aggregate(Max('pk'))['pk__max'] or 0
+                           for database in databases)
+                for model in SEQUENCED
+            }
+            for index, database in enumerate(databases):
+                self.interleave_sequences(database, index, len(databases), max_ids)
+
+    def copy_mirrored(self, database):
+        for model in MIRRORED:
+            fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+            rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+            count = 0
+            batch = []
+            for row in rows.iterator(chunk_size=BATCH_SIZE):
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    count += self.upsert(model, database, batch, fields)
+                    batch = []
+            count += self.upsert(model, database, batch, fields)
+            self.stdout.write(f'Copied {count} {model._meta.verbose_name_plural} to {database}.')
+
+    def upsert(self, model, database, rows, fields):
+        if rows:
+            model._base_manager.using(database).bulk_create(
+                rows, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields)
+        return len(rows)
+
+    def interleave_sequences(self, database, index, count, max_ids):
+        """
+        Makes the sequences of the database hand out the ids equal to index + 1 modulo count,
+        starting after `max_ids[model]`.
+        """
+        connection = connections[database]
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'Skipped the sequences of {database}, only PostgreSQL ones are interleaved.')
+            return
+        with connection.cursor() as cursor:
+            for model in SEQUENCED:
+                table = model._meta.db_table
+                cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, model._meta.pk.column])
+                sequence = cursor.fetchone()[0]
+                if sequence is None:
+                    continue
+                max_id = max_ids[model]
+                start = max_id + 1 + (index - max_id) % count
+                cursor.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY {count} RESTART WITH {start}')
+        self.stdout.write(self.style.SUCCESS(f'Interleaved the id sequences of {database} ({index + 1} of {count}).'))
@@ -0,0 +1,74 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so that nothing is imported yet, prints the phase timings as JSON
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+application = get_wsgi_application()
+loaded = time.perf_counter()
+Client(HTTP_HOST='localhost').get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'app_ready': ready - started,
+    'wsgi_loaded': loaded - started,
+    'first_request': served - started,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = ("Measures the cold start of a worker: time until the apps are ready, until the WSGI application is "
+            "loaded and until the first request is served, plus the slowest imports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to measure, the median is reported.')
+        parser.add_argument('--top', type=int, default=15, help='Number of top-level imports to list.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        runs = []
+        imports = {}
+        for _ in range(max(options['runs'], 1)):
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT], cwd=settings.BASE_DIR,
+                                    env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise CommandError(f'The startup script failed:\n{result.stderr[-2000:]}')
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            for module, cumulative in _top_level_imports(result.stderr):
+                imports.setdefault(module, []).append(cumulative)
+
+        self.stdout.write(f'Cold start, median of {len(runs)} runs:')
+        for phase in ('app_ready', 'wsgi_loaded', 'first_request'):
+            self.stdout.write(f'  {phase:<15} {statistics.median(run[phase] for run in runs) * 1000:8.1f} ms')
+
+        self.stdout.write('Slowest top-level imports (cumulative):')
+        slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+        for module, timings in slowest[:options['top']]:
+            self.stdout.write(f'  {statistics.median(timings) / 1000:8.1f} ms  {module}')
+
+
+def _top_level_imports(importtime_output):
+    """
+    Yields (module, cumulative microseconds) for the imports done directly by the startup,
+    not by another module, from the output of `python -X importtime`.
+    """
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Nested imports are indented by two more spaces per level
+        if module.startswith('  ') or not cumulative.strip().isdigit():
+            continue
+        yield module.strip(), int(cumulative)
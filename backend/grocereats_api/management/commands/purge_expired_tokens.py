@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired outstanding and blacklisted refresh tokens in small batches. "
+            "Meant to be scheduled (e.g. hourly from cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of outstanding tokens deleted per transaction.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            with transaction.atomic():
+                token_ids = list(
+                    OutstandingToken.objects.filter(expires_at__lt=now).order_by()
+                    .values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not token_ids:
+                    break
+                BlacklistedToken.objects.filter(token_id__in=token_ids).delete()
+                OutstandingToken.objects.filter(id__in=token_ids).delete()
+            total += len(token_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {total} expired tokens.'))
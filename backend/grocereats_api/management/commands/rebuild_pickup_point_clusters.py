@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from grocereats_api import clustering
+
+
+class Command(BaseCommand):
+    help = "Recomputes the multi-zoom pickup point clusters used by the map."
+
+    def handle(self, *args, **options):
+        count = clustering.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} pickup point cluster cells.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from grocereats_api import regions
+from grocereats_api.models import Shop, ShopCard
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized ShopCard rows used by the home screen."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, action='append', dest='shops',
+                            help='Only rebuild the card of this shop id (can be repeated).')
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.select_related('pickup_point', 'seller')
+        if options['shops']:
+            shops = shops.filter(id__in=options['shops'])
+
+        count = 0
+        for shop in shops.iterator():
+            with regions.use_region(shop.region):
+                ShopCard.refresh(shop)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} shop cards.'))
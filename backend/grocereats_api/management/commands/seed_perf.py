@@ -0,0 +1,307 @@
+import io
+import math
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from grocereats_api import regions
+from grocereats_api.models import User, PickupPoint, Shop, Stock, Order, OrderItem, Category, SubCategory
+
+KM_PER_DEGREE = 111.32
+
+DEFAULT_CATEGORIES = {
+    'Fruits': ['Apples', 'Cherries', 'Grapes', 'Plums'],
+    'Vegetables': ['Tomatoes', 'Potatoes', 'Onions', 'Peppers'],
+    'Dairy': ['Milk', 'Cheese', 'Eggs'],
+    'Meat': ['Sausages', 'Cured meats'],
+    'Preserves': ['Jam', 'Honey', 'Pickles'],
+}
+
+UNITS = ['kg', 'g', 'l', 'pcs', 'jar']
+
+
+class Command(BaseCommand):
+    help = ("Generates a reproducible, large data set of users, pickup points, shops, stocks and orders "
+            "for performance testing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--shops', type=int, default=1000)
+        parser.add_argument('--pickup-points', type=int, default=500)
+        parser.add_argument('--stocks-per-shop', type=int, default=20)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--max-items-per-order', type=int, default=4)
+        parser.add_argument('--days', type=int, default=365, help='Spread the orders over this many past days.')
+        parser.add_argument('--center', default='44.4268,26.1025',
+                            help='lat,long around which the pickup point clusters are placed.')
+        parser.add_argument('--spread-km', type=float, default=30.0,
+                            help='Maximum distance of a cluster center from --center.')
+        parser.add_argument('--clusters', type=int, default=8, help='Number of pickup point clusters.')
+        parser.add_argument('--cluster-radius-km', type=float, default=2.0,
+                            help='Standard deviation of the pickup point distance to their cluster center.')
+        parser.add_argument('--order-skew', type=float, default=1.1,
+                            help='Exponent of the power law distribution of orders per shop (0 is uniform).')
+        parser.add_argument('--batch-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f"perf{options['seed']}"
+        try:
+            center_lat, center_long = (float(value) for value in options['center'].split(','))
+        except ValueError:
+            raise CommandError('--center must be given as lat,long.')
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'Data for seed {options["seed"]} already exists, use another --seed.')
+
+        started = timezone.now()
+        # The mirrored rows are written to the default database and copied to the others by
+        # prepare_regions, the stocks and orders of a shop to the database of its region
+        with transaction.atomic():
+            subcategories = self.seed_categories()
+            pickup_points = self.seed_pickup_points(options, center_lat, center_long)
+            point_ids = list(pickup_points)
+            shop_points = [self.rng.choice(point_ids) for _ in range(options['shops'])]
+            seller_regions = [pickup_points[point_id] for point_id in shop_points]
+            customers, sellers = self.seed_users(options['customers'], seller_regions)
+            shops = self.seed_shops(sellers, shop_points, pickup_points)
+            self.reset_sequences(DEFAULT_DB_ALIAS, [PickupPoint, User, Shop])
+        if regions.is_partitioned():
+            call_command('prepare_regions', '--mirror-only', stdout=io.StringIO())
+
+        stocks = self.seed_stocks(shops, subcategories, options['stocks_per_shop'])
+        self.seed_orders(options, customers, shops, stocks)
+        if regions.is_partitioned():
+            # Interleaves the sequences of every database past the ids given here
+            call_command('prepare_regions', '--sequences-only', stdout=io.StringIO())
+        else:
+            self.reset_sequences(DEFAULT_DB_ALIAS, [Stock, Order, OrderItem])
+
+        # The rows were inserted without the signals keeping the read models up to date
+        call_command('rebuild_shop_cards', stdout=io.StringIO())
+        call_command('rebuild_pickup_point_clusters', stdout=io.StringIO())
+        call_command('build_recommendations', stdout=io.StringIO())
+        call_command('build_catalog_bundle', stdout=io.StringIO())
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'Seeded the database in {elapsed:.1f}s.'))
+
+    def seed_categories(self):
+        if not SubCategory.objects.exists():
+            for category_name, subcategory_names in DEFAULT_CATEGORIES.items():
+                category = Category.objects.create(name=category_name)
+                SubCategory.objects.bulk_create([
+                    SubCategory(category=category, name=name) for name in subcategory_names
+                ])
+        return list(SubCategory.objects.values_list('id', flat=True))
+
+    def seed_pickup_points(self, options, center_lat, center_long):
+        """
+        Places the pickup points around a few cluster centers, like neighbourhood markets in a city.
+        Returns the region of every pickup point id.
+        """
+        rng = self.rng
+        centers = []
+        for _ in range(max(options['clusters'], 1)):
+            distance = rng.uniform(0, options['spread_km'])
+            bearing = rng.uniform(0, 2 * math.pi)
+            centers.append(_offset(center_lat, center_long, distance, bearing))
+
+        rows = []
+        first_id = _next_id(PickupPoint)
+        for i in range(options['pickup_points']):
+            cluster_lat, cluster_long = rng.choice(centers)
+            distance = abs(rng.gauss(0, options['cluster_radius_km']))
+            lat, long = _offset(cluster_lat, cluster_long, distance, rng.uniform(0, 2 * math.pi))
+            rows.append((first_id + i, f'{lat:.6f}', f'{long:.6f}', f'Pickup point {i}', f'Perf street {i}',
+                         regions.region_for(lat, long)))
+
+        self.insert(PickupPoint, ['id', 'lat', 'long', 'name', 'address', 'region'], rows)
+        self.stdout.write(f'Created {len(rows)} pickup points in {len(centers)} clusters.')
+        return {row[0]: row[-1] for row in rows}
+
+    def seed_users(self, customer_count, seller_regions):
+        """
+        Creates the customers in the default region and one seller per shop, in the region of their shop.
+        """
+        now = timezone.now()
+        first_id = _next_id(User)
+        seller_count = len(seller_regions)
+        columns = ['id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+                   'is_staff', 'is_active', 'date_joined', 'phone', 'role', 'rating', 'region']
+
+        def rows():
+            for i in range(customer_count + seller_count):
+                role = 'customer' if i < customer_count else 'seller'
+                region = regions.default_region() if i < customer_count else seller_regions[i - customer_count]
+                username = f'{self.prefix}_{role}_{i}'
+                # Seeded users cannot log in, which also skips the password hashing
+                yield (first_id + i, '!', None, False, username, 'Perf', role.title(), f'{username}@example.com',
+                       False, True, now, f'07{i:09d}'[:11], role, None, region)
+
+        self.insert(User, columns, rows())
+        self.stdout.write(f'Created {customer_count} customers and {seller_count} sellers.')
+        customers = list(range(first_id, first_id + customer_count))
+        sellers = list(range(first_id + customer_count, first_id + customer_count + seller_count))
+        return customers, sellers
+
+    def seed_shops(self, sellers, shop_points, pickup_points):
+        """
+        Returns the region of every shop id, the one of its pickup point.
+        """
+        first_id = _next_id(Shop)
+        rows = [
+            (first_id + i, f'Perf shop {i}', point_id, seller_id, pickup_points[point_id])
+            for i, (seller_id, point_id) in enumerate(zip(sellers, shop_points))
+        ]
+        self.insert(Shop, ['id', 'name', 'pickup_point', 'seller', 'region'], rows)
+        self.stdout.write(f'Created {len(rows)} shops.')
+        return {row[0]: row[-1] for row in rows}
+
+    def seed_stocks(self, shops, subcategories, per_shop):
+        """
+        Returns the (stock id, price) pairs of every shop.
+        """
+        rng = self.rng
+        now = timezone.now()
+        next_id = _next_id(Stock)
+        stocks = {}
+        rows = {database: [] for database in regions.databases()}
+        for shop_id, region in shops.items():
+            stocks[shop_id] = []
+            for i in range(per_shop):
+                price = Decimal(f'{rng.uniform(0.5, 60):.2f}')
+                rows[regions.database_for(region)].append((
+                    next_id, f'Product {i}', rng.choice(UNITS), price, rng.choice(subcategories), shop_id,
+                    None, None, rng.randint(0, 500), now,
+                ))
+                stocks[shop_id].append((next_id, price))
+                next_id += 1
+
+        columns = ['id', 'name', 'unit', 'price_per_unit', 'subcategory', 'shop', 'description', 'photo_url',
+                   'quantity', 'timestamp_last_modified']
+        for database, database_rows in rows.items():
+            with transaction.atomic(using=database):
+                self.insert(Stock, columns, database_rows, database)
+        self.stdout.write(f'Created {sum(map(len, rows.values()))} stocks.')
+        return stocks
+
+    def seed_orders(self, options, customers, shops, stocks):
+        """
+        Streams the orders and their items in batches. The number of orders per shop follows
+        a power law, so a few shops get most of the traffic.
+        """
+        rng = self.rng
+        now = timezone.now()
+        period = timedelta(days=options['days']).total_seconds()
+        shop_regions = shops
+        shops = [shop_id for shop_id in shops if stocks[shop_id]]
+        if not shops or not customers:
+            return
+        rng.shuffle(shops)
+        cum_weights = list(accumulate(1 / (rank + 1) ** options['order_skew'] for rank in range(len(shops))))
+
+        order_id = _next_id(Order)
+        item_id = _next_id(OrderItem)
+        order_columns = ['id', 'buyer', 'shop', 'total_price', 'status', 'timestamp']
+        item_columns = ['id', 'order', 'stock', 'quantity', 'price_at_purchase']
+
+        remaining = options['orders']
+        while remaining > 0:
+            count = min(remaining, self.batch_size)
+            orders = {database: [] for database in regions.databases()}
+            items = {database: [] for database in regions.databases()}
+            for shop_id in rng.choices(shops, cum_weights=cum_weights, k=count):
+                database = regions.database_for(shop_regions[shop_id])
+                shop_stocks = stocks[shop_id]
+                total = Decimal(0)
+                item_count = rng.randint(1, min(options['max_items_per_order'], len(shop_stocks)))
+                for stock_id, price in rng.sample(shop_stocks, item_count):
+                    quantity = rng.randint(1, 5)
+                    total += price * quantity
+                    items[database].append((item_id, order_id, stock_id, quantity, price))
+                    item_id += 1
+
+                status = rng.choices(['completed', 'cancelled', 'pending'], weights=[85, 10, 5])[0]
+                timestamp = now - timedelta(seconds=rng.uniform(0, period))
+                orders[database].append((order_id, rng.choice(customers), shop_id, total, status, timestamp))
+                order_id += 1
+
+            for database in orders:
+                with transaction.atomic(using=database):
+                    self.insert(Order, order_columns, orders[database], database)
+                    self.insert(OrderItem, item_columns, items[database], database)
+            remaining -= count
+            self.stdout.write(f'Created {options["orders"] - remaining} orders...')
+
+    def insert(self, model, fields, rows, database=DEFAULT_DB_ALIAS):
+        """
+        Inserts the rows in batches, with COPY on PostgreSQL and a multi-row INSERT elsewhere.
+        Rows are inserted as they are, bypassing auto_now fields, signals and the database router.
+        """
+        connection = connections[database]
+        table = model._meta.db_table
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+        batch = []
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._flush(connection, cursor, table, columns, batch)
+                    batch = []
+            if batch:
+                self._flush(connection, cursor, table, columns, batch)
+
+    def _flush(self, connection, cursor, table, columns, batch):
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            for row in batch:
+                buffer.write('\t'.join(_copy_value(value) for value in row))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(batch[0]))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', batch)
+
+    def reset_sequences(self, database, models):
+        # The ids were assigned here, move the sequences past them
+        connection = connections[database]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def _next_id(model):
+    """
+    Returns the id following the largest one of every database, ids of sharded rows are unique across regions.
+    """
+    databases = regions.databases() if regions.is_sharded(model) else [DEFAULT_DB_ALIAS]
+    return max(model._base_manager.using(database).aggregate(Max('id'))['id__max'] or 0 for database in databases) + 1
+
+
+def _offset(lat, long, distance_km, bearing):
+    """
+    Moves a point by distance_km in the bearing direction (flat earth approximation).
+    """
+    lat_offset = distance_km * math.cos(bearing) / KM_PER_DEGREE
+    long_offset = distance_km * math.sin(bearing) / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    return max(min(lat + lat_offset, 90), -90), (long + long_offset + 180) % 360 - 180
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
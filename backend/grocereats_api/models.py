@@ -1,5 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from .regions import default_region, region_for
 
 
 class User(AbstractUser):
@@ -12,6 +15,8 @@ class User(AbstractUser):
     phone = models.CharField(max_length=11)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    # Region the user's requests go to when they do not name one (see regions.py), a seller's is their shop's
+    region = models.CharField(max_length=32, default=default_region)
 
     def update_rating(self):
         """
@@ -47,25 +52,92 @@ class PickupPoint(models.Model):
     long = models.DecimalField(max_digits=9, decimal_places=6)
     name = models.CharField(max_length=255)
     address = models.TextField()
+    region = models.CharField(max_length=32, default=default_region)
 
     class Meta:
         verbose_name = "PickupPoint"
         verbose_name_plural = "PickupPoints"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        pickup_point = super().from_db(db, field_names, values)
+        # Lets pickup_point_saved() in signals.py move the point to its new map cells
+        pickup_point.loaded_coordinates = (pickup_point.__dict__.get('lat'), pickup_point.__dict__.get('long'))
+        return pickup_point
+
+    def save(self, *args, **kwargs):
+        # Fixed when the point is created, its shops' rows stay in that region's database
+        if self._state.adding:
+            self.region = region_for(self.lat, self.long)
+        super().save(*args, **kwargs)
+        self.loaded_coordinates = (self.lat, self.long)
+
+    def previous_coordinates(self):
+        """
+        The (lat, long) the point had when it was read from the database, None when it was not.
+        """
+        loaded = getattr(self, 'loaded_coordinates', None)
+        if loaded is None or None in loaded:
+            return None
+        return loaded
+
+    def coordinates_changed(self, update_fields=None):
+        """
+        Tells whether the save that is being handled moved the point, assuming it did when the point
+        was not read from the database.
+        """
+        if update_fields is not None and not {'lat', 'long'}.intersection(update_fields):
+            return False
+        previous = self.previous_coordinates()
+        if previous is None:
+            return True
+        return (Decimal(previous[0]), Decimal(previous[1])) != (Decimal(self.lat), Decimal(self.long))
+
     def __str__(self):
         return self.name
 
 
+class PickupPointCluster(models.Model):
+    """
+    Number of pickup points and the sum of their coordinates in one cell of the map grid of a zoom level.
+    Maintained by clustering.py.
+    """
+    id = models.BigAutoField(primary_key=True)
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.PositiveIntegerField()
+    cell_y = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    lat_sum = models.DecimalField(max_digits=18, decimal_places=6, default=0)
+    long_sum = models.DecimalField(max_digits=18, decimal_places=6, default=0)
+
+    class Meta:
+        verbose_name = "PickupPointCluster"
+        verbose_name_plural = "PickupPointClusters"
+        constraints = [
+            models.UniqueConstraint(fields=['zoom', 'cell_x', 'cell_y'], name='unique_cluster_cell'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} pickup points at zoom {self.zoom} ({self.cell_x}, {self.cell_y})"
+
+
 class Shop(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=255)
     pickup_point = models.ForeignKey(PickupPoint, on_delete=models.CASCADE, related_name='shops')
     seller = models.OneToOneField(User, on_delete=models.CASCADE, limit_choices_to={'role': 'seller'})
+    # Region of the pickup point, its stocks and orders live in the database of this region
+    region = models.CharField(max_length=32, default=default_region)
 
     class Meta:
         verbose_name = "Shop"
         verbose_name_plural = "Shops"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.region = self.pickup_point.region
+        super().save(*args, **kwargs)
+
     def update_rating(self):
         """
         Computes the average rating for the shop based on all its completed orders.
@@ -88,11 +160,39 @@ class Stock(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='stocks')
     description = models.TextField(blank=True, null=True)
     photo_url = models.URLField(blank=True, null=True)
+    # Content hash of the uploaded photo, names its thumbnails (see images.py)
+    photo_hash = models.CharField(max_length=40, blank=True, null=True)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp_last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-timestamp_last_modified']
+        indexes = [
+            # One per sort of the shop stock list, the filtered list is a range of the index
+            models.Index(fields=['shop', '-timestamp_last_modified', '-id'], name='stock_shop_recent_idx'),
+            models.Index(fields=['shop', 'price_per_unit', 'id'], name='stock_shop_price_idx'),
+            models.Index(fields=['shop', 'name', 'id'], name='stock_shop_name_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        stock = super().from_db(db, field_names, values)
+        # Lets stock_saved() in signals.py tell whether a save moved the stock to another subcategory
+        stock.loaded_subcategory_id = stock.__dict__.get('subcategory_id')
+        return stock
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.loaded_subcategory_id = self.subcategory_id
+
+    def subcategory_changed(self, update_fields=None):
+        """
+        Tells whether the save that is being handled changed the subcategory, assuming it did when
+        the stock was not read from the database.
+        """
+        if update_fields is not None:
+            return 'subcategory' in update_fields or 'subcategory_id' in update_fields
+        return getattr(self, 'loaded_subcategory_id', None) != self.subcategory_id
 
     def __str__(self):
         return self.name
@@ -115,6 +215,19 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Used by the archive_orders command to find old closed orders
+            models.Index(fields=['status', 'timestamp'], name='order_status_timestamp_idx'),
+            # Used by the shop analytics to read one shop's completed orders over a period
+            models.Index(fields=['shop', 'status', 'timestamp'], name='order_shop_status_ts_idx'),
+            # Used by the default ordering and the admin date hierarchy
+            models.Index(fields=['timestamp'], name='order_timestamp_idx'),
+        ]
+        constraints = [
+            # A customer has at most one cart per shop
+            models.UniqueConstraint(fields=['buyer', 'shop'], condition=models.Q(status='active'),
+                                    name='unique_active_order_per_shop'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} for {self.shop.name} (Status: {self.status})"
@@ -135,6 +248,119 @@ class OrderItem(models.Model):
         return f"{self.stock.name} - {self.quantity} units at {self.price_at_purchase} per unit"
 
 
+class StockMovement(models.Model):
+    """
+    Ledger entry for every change of a stock quantity made by the order views.
+    Deductions are negative, restorations positive.
+    """
+    REASON_CHOICES = [
+        ('order', 'Order'),
+        ('order_restore', 'Order restore'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='movements')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "StockMovement"
+        verbose_name_plural = "StockMovements"
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['stock', 'timestamp'], name='movement_stock_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity:+} {self.stock.name} ({self.reason})"
+
+
+class StockForecast(models.Model):
+    """
+    Exponentially smoothed daily demand of a stock, updated as movements are recorded.
+    The demand of the current day is accumulated in day_demand and folded into
+    daily_demand once the day is over.
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, primary_key=True, related_name='forecast')
+    daily_demand = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    day = models.DateField()
+    day_demand = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "StockForecast"
+        verbose_name_plural = "StockForecasts"
+
+    def __str__(self):
+        return f"{self.stock.name}: {self.daily_demand} per day"
+
+
+class StockCoOccurrence(models.Model):
+    """
+    Number of completed orders containing both `stock` and `other`, one row per ordered pair.
+    Backs the "frequently bought together" recommendations.
+    """
+    id = models.BigAutoField(primary_key=True)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='co_occurrences')
+    other = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "StockCoOccurrence"
+        verbose_name_plural = "StockCoOccurrences"
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'other'], name='unique_stock_co_occurrence'),
+        ]
+        indexes = [
+            models.Index(fields=['stock', '-count'], name='co_occurrence_stock_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.name} + {self.other.name}: {self.count}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Completed or cancelled order moved out of the Order table by the archive_orders command.
+    Keeps the id it had as an Order.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='archived_orders')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "ArchivedOrder"
+        verbose_name_plural = "ArchivedOrders"
+        ordering = ['-timestamp']
+        indexes = [
+            # Used by the default ordering and the admin date hierarchy
+            models.Index(fields=['timestamp'], name='archived_order_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id} for {self.shop.name} (Status: {self.status})"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='+')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = "ArchivedOrderItem"
+        verbose_name_plural = "ArchivedOrderItems"
+
+    def __str__(self):
+        return f"{self.stock.name} - {self.quantity} units at {self.price_at_purchase} per unit"
+
+
 class Category(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -159,3 +385,74 @@ class SubCategory(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ShopCard(models.Model):
+    """
+    Denormalized read model backing the home screen shop tiles and map pins.
+    Kept up to date by the receivers in signals.py.
+    """
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=255)
+    pickup_point = models.ForeignKey(PickupPoint, on_delete=models.CASCADE, related_name='shop_cards')
+    pickup_point_name = models.CharField(max_length=255)
+    lat = models.DecimalField(max_digits=9, decimal_places=6)
+    long = models.DecimalField(max_digits=9, decimal_places=6)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    stock_count = models.PositiveIntegerField(default=0)
+    completed_orders = models.PositiveIntegerField(default=0)
+    categories = models.JSONField(default=list)
+    timestamp_last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "ShopCard"
+        verbose_name_plural = "ShopCards"
+        ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='shopcard_name_idx'),
+            # Used by the map viewport query
+            models.Index(fields=['lat', 'long'], name='shopcard_lat_long_idx'),
+        ]
+
+    @classmethod
+    def refresh(cls, shop):
+        """
+        Rebuilds the card of a shop from scratch.
+        """
+        pickup_point = shop.pickup_point
+        card, _ = cls.objects.update_or_create(
+            shop=shop,
+            defaults={
+                'name': shop.name,
+                'pickup_point': pickup_point,
+                'pickup_point_name': pickup_point.name,
+                'lat': pickup_point.lat,
+                'long': pickup_point.long,
+                'rating': shop.seller.rating,
+                'stock_count': shop.stocks.count(),
+                'completed_orders': cls.completed_orders_for(shop.id),
+                'categories': cls.categories_for(shop.id),
+            }
+        )
+        return card
+
+    @staticmethod
+    def completed_orders_for(shop_id):
+        """
+        Counts the completed orders of a shop, including the archived ones.
+        """
+        return Order.objects.filter(shop_id=shop_id, status='completed').count() + \
+            ArchivedOrder.objects.filter(shop_id=shop_id, status='completed').count()
+
+    @staticmethod
+    def categories_for(shop_id):
+        """
+        Returns the sorted names of the categories carried by a shop.
+        """
+        # Without order_by() the default ordering of Stock would be selected too and defeat distinct()
+        names = Stock.objects.filter(shop_id=shop_id) \
+            .values_list('subcategory__category__name', flat=True).order_by().distinct()
+        return sorted(names)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,75 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+# Prices are stored as DecimalField(decimal_places=2) and quantities may have two decimals too
+# (e.g. 1.25 kg). In Python both are handled as integers of hundredths, so the arithmetic is
+# exact and cheap: no float, no Decimal context, no truncating int() casts.
+CENTS = Decimal('0.01')
+
+MONEY_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
+def to_cents(value):
+    """
+    Converts a price (Decimal, int or string) to an integer number of cents, rounding half up.
+    """
+    return int((value if isinstance(value, Decimal) else Decimal(str(value))).quantize(CENTS, ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def parse_quantity(value):
+    """
+    Parses a quantity sent by a client into a Decimal with two decimals, raises ValueError
+    when it is not a positive number.
+    """
+    try:
+        quantity = Decimal(str(value)).quantize(CENTS, ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f'Invalid quantity: {value}')
+    if not quantity.is_finite() or quantity <= 0:
+        raise ValueError(f'Invalid quantity: {value}')
+    return quantity
+
+
+def line_total(price, quantity):
+    """
+    Returns the total of an order line in cents, rounded half up to the cent.
+    """
+    product = to_cents(price) * to_cents(quantity)  # hundredths of cents
+    sign = -1 if product < 0 else 1
+    return sign * ((abs(product) + 50) // 100)
+
+
+def order_total(lines):
+    """
+    Returns the total in cents of (price, quantity) pairs, each line rounded like line_total().
+    """
+    return sum(line_total(price, quantity) for price, quantity in lines)
+
+
+def add_to_total(order, cents):
+    """
+    Adds `cents` to the stored total of an order with an UPDATE relative to the current value,
+    so concurrent changes to the same cart are not lost, and mirrors it on the instance.
+    """
+    if not cents:
+        return
+    delta = from_cents(cents)
+    type(order).objects.filter(pk=order.pk).update(total_price=F('total_price') + Value(delta, output_field=MONEY_FIELD))
+    order.total_price = from_cents(to_cents(order.total_price) + cents)
+
+
+def derived_total(item_model):
+    """
+    Subquery computing, in SQL, the total of an order from its items with the rounding of line_total().
+    """
+    lines = item_model.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(
+        total=Round(Sum(Round(ExpressionWrapper(F('price_at_purchase') * F('quantity'),
+                                                output_field=DecimalField(max_digits=20, decimal_places=4)), 2)), 2)
+    ).values('total')
+    return Coalesce(Subquery(lines, output_field=MONEY_FIELD), Value(Decimal(0), output_field=MONEY_FIELD))
@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Case, DecimalField, F, IntegerField, Value, When
+from django.utils import timezone
+from . import recommendations, regions
+from .coalescing import invalidate_stock_lists
+from .inventory import record_movements
+from .models import Order, OrderItem, Stock, StockMovement, ShopCard
+
+# Target status -> statuses an order may be in to move to it
+TRANSITIONS = {
+    'pending': ('active',),
+    'completed': ('pending',),
+    'cancelled': ('active', 'pending'),
+}
+
+# Most orders a single bulk transition may touch
+MAX_BATCH_SIZE = 1000
+
+
+@regions.atomic
+def apply(orders, target):
+    """
+    Moves the orders of a queryset that are allowed to reach `target` into it and returns how many moved.
+    Every batch is moved by one UPDATE guarded by the status, so orders changed concurrently are
+    skipped instead of being moved twice. Cancelled orders get their stock back in bulk.
+
+    Cancellations and completions also need the ids and shops of the moved orders for their side
+    effects, which Django's UPDATE does not return. They first lock the orders the guard lets through
+    with SELECT ... FOR UPDATE: a concurrent transition waits for the lock and then sees the new status,
+    so the locked orders are exactly the ones the UPDATE moves.
+    """
+    orders = orders.filter(status__in=TRANSITIONS[target])
+
+    if target == 'pending':
+        return orders.update(status=target)
+
+    moved = dict(orders.select_for_update().values_list('id', 'shop_id'))
+    if not moved:
+        return 0
+    updated = Order.objects.filter(id__in=list(moved), status__in=TRANSITIONS[target]).update(status=target)
+
+    if target == 'cancelled':
+        _restore_stock(list(moved))
+        invalidate_stock_lists(*set(moved.values()))
+    elif target == 'completed':
+        _count_completed(Counter(moved.values()))
+        recommendations.record_completed(list(moved))
+    return updated
+
+
+def _restore_stock(order_ids):
+    """
+    Gives the quantities of the cancelled orders back to their stocks with a single UPDATE.
+    """
+    restored = defaultdict(int)
+    movements = []
+    for order_id, stock_id, quantity in OrderItem.objects.filter(order_id__in=order_ids) \
+            .values_list('order_id', 'stock_id', 'quantity'):
+        restored[stock_id] += quantity
+        movements.append(StockMovement(stock_id=stock_id, order_id=order_id, quantity=quantity,
+                                       reason='order_restore'))
+    if not restored:
+        return
+
+    Stock.objects.filter(id__in=list(restored)).update(
+        quantity=F('quantity') + Case(
+            *(When(id=stock_id, then=Value(quantity)) for stock_id, quantity in restored.items()),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        timestamp_last_modified=timezone.now(),
+    )
+    record_movements(movements)
+
+
+def _count_completed(completed_per_shop):
+    ShopCard.objects.filter(shop_id__in=list(completed_per_shop)).update(
+        completed_orders=F('completed_orders') + Case(
+            *(When(shop_id=shop_id, then=Value(count)) for shop_id, count in completed_per_shop.items()),
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,213 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+SIGNING_SALT = 'grocereats_api.profiling'
+
+
+def mint_token(user_id=None):
+    """
+    Returns a token enabling the profiler through the X-Profile header, for the requests of
+    one user when `user_id` is given, for any request otherwise.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign_object({'user': user_id})
+
+
+def _token_scope(token):
+    """
+    Returns the scope of a valid token, {'user': id or None}, and None for an invalid or expired one.
+    """
+    try:
+        return signing.TimestampSigner(salt=SIGNING_SALT).unsign_object(
+            token, max_age=settings.PROFILING['TOKEN_MAX_AGE'])
+    except signing.BadSignature:
+        return None
+
+
+def _authenticated_user(request):
+    # DRF authenticates in the view, the middleware only needs it for the rare profiled request
+    from rest_framework.exceptions import APIException
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except APIException:
+        return None
+    return result[0] if result else None
+
+
+def should_profile(request):
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        scope = _token_scope(token)
+        if scope is None:
+            return False
+        if scope['user'] is None:
+            return True
+        user = _authenticated_user(request)
+        return user is not None and user.id == scope['user']
+
+    user = _authenticated_user(request)
+    return user is not None and user.is_staff
+
+
+class Sampler:
+    """
+    Samples the stack of one thread every PROFILING['INTERVAL'] seconds from a background
+    thread and counts the folded stacks ("outer;inner;leaf"), the input format of flamegraph.pl
+    and speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_file = __file__
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename != own_file:
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class SQLTimeline:
+    """
+    Records the start, duration and statement of every query, relative to the start of the request.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'start_ms': round((start - self.started) * 1000, 3),
+                'duration_ms': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+
+def _directory():
+    directory = Path(settings.PROFILING['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _save(profile_id, metadata, folded):
+    directory = _directory()
+    (directory / f'{profile_id}.folded').write_text(folded)
+    (directory / f'{profile_id}.json').write_text(json.dumps(metadata))
+
+    # Only the most recent profiles are kept
+    profiles = sorted(directory.glob('*.json'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in profiles[settings.PROFILING['KEEP']:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.folded').unlink(missing_ok=True)
+
+
+def list_profiles():
+    directory = Path(settings.PROFILING['DIR'])
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.json'), key=lambda path: path.stat().st_mtime, reverse=True):
+        metadata = json.loads(path.read_text())
+        metadata.pop('sql', None)
+        profiles.append(metadata)
+    return profiles
+
+
+def load_profile(profile_id):
+    """
+    Returns the metadata and the folded stacks of a stored profile, None when there is no such profile.
+    """
+    try:
+        uuid.UUID(profile_id)
+    except ValueError:
+        return None
+    directory = Path(settings.PROFILING['DIR'])
+    try:
+        metadata = json.loads((directory / f'{profile_id}.json').read_text())
+        folded = (directory / f'{profile_id}.folded').read_text()
+    except FileNotFoundError:
+        return None
+    return metadata, folded
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests carrying a valid X-Profile token (see `manage.py mint_profiling_token`)
+    or, for staff users, a `profile` query parameter. The stack samples and the SQL timeline are
+    stored under PROFILING['DIR'] and served by the profile endpoints, the response gets the
+    profile id in an X-Profile-Id header. Other requests only pay for a lookup and a substring test.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER not in request.META and PROFILE_PARAM not in request.META.get('QUERY_STRING', ''):
+            return self.get_response(request)
+        if PROFILE_HEADER not in request.META and PROFILE_PARAM not in request.GET:
+            return self.get_response(request)
+        if not should_profile(request):
+            return self.get_response(request)
+
+        profile_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        with Sampler(threading.get_ident(), settings.PROFILING['INTERVAL']) as sampler, \
+                connection.execute_wrapper(timeline):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        _save(profile_id, {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'timestamp': time.time(),
+            'duration_ms': round(duration * 1000, 3),
+            'samples': sum(sampler.stacks.values()),
+            'query_count': len(timeline.queries),
+            'query_ms': round(sum(query['duration_ms'] for query in timeline.queries), 3),
+            'sql': timeline.queries,
+        }, sampler.folded())
+        response['X-Profile-Id'] = profile_id
+        return response
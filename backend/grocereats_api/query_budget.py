@@ -0,0 +1,159 @@
+import contextvars
+import logging
+import traceback
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+# Transaction bookkeeping issued by atomic() blocks, not counted against a budget
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+# Budgets counting the queries of the current context. The worker threads of regions.scatter_gather()
+# run in copies of the caller's context, so their queries count against the caller's budgets
+_active_budgets = contextvars.ContextVar('query_budgets', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _count_queries(execute, sql, params, many, context):
+    for budget in _active_budgets.get():
+        budget.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    # First in the list, execute_wrapper() blocks pop the last wrapper when they exit
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_queries)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    # Connections are per thread, those of worker threads are opened while the budgets are active
+    if _active_budgets.get():
+        _install(connection)
+
+
+def _mode():
+    return settings.QUERY_BUDGET.get('MODE') or ('log' if settings.DEBUG else 'off')
+
+
+class query_budget(ContextDecorator):
+    """
+    Declares the most queries a block, a view or a test may run, on any database.
+
+    Going over the budget raises QueryBudgetExceeded when QUERY_BUDGET['MODE'] is 'raise' (the
+    test settings), logs a warning with the stack of the first query over the budget when it is
+    'log' (the default in DEBUG), and is not checked at all when it is 'off'. Pass `mode` to
+    force one, e.g. query_budget(3, mode='raise') in a test.
+    """
+
+    def __init__(self, max_queries, label=None, mode=None):
+        self.max_queries = max_queries
+        self.label = label
+        self.mode = mode
+        self.queries = []
+        self.overflow_stack = None
+
+    def __enter__(self):
+        self.queries = []
+        self.overflow_stack = None
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._stop()
+        if exc_type is None:
+            self.check()
+        return False
+
+    def _start(self):
+        self.active_mode = self.mode or _mode()
+        if self.active_mode == 'off':
+            return
+        for alias in connections:
+            _install(connections[alias])
+        self.token = _active_budgets.set(_active_budgets.get() + (self,))
+
+    def _stop(self):
+        if self.active_mode != 'off':
+            _active_budgets.reset(self.token)
+
+    def record(self, sql):
+        if not sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+            self.queries.append(sql)
+            if len(self.queries) == self.max_queries + 1:
+                # Only the stack of the first query over the budget is kept, it is the one to look at
+                self.overflow_stack = ''.join(traceback.format_stack()[:-2])
+
+    def check(self):
+        if self.active_mode == 'off' or len(self.queries) <= self.max_queries:
+            return
+
+        message = (f'{self.label or "Block"} ran {len(self.queries)} queries, its budget is {self.max_queries}.\n'
+                   + '\n'.join(f'  {i + 1}. {sql}' for i, sql in enumerate(self.queries)))
+        if self.active_mode == 'raise':
+            raise QueryBudgetExceeded(f'{message}\nFirst query over the budget:\n{self.overflow_stack}')
+        logger.warning('%s\nFirst query over the budget:\n%s', message, self.overflow_stack)
+
+    def stream(self, chunks):
+        """
+        Counts the queries run while `chunks`, the body of a streaming response, is produced, and
+        checks the budget once it is over.
+        """
+        iterator = iter(chunks)
+        while True:
+            self._start()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                self._stop()
+            yield chunk
+        self.check()
+
+
+def route_budget(url_name):
+    config = settings.QUERY_BUDGET
+    return config['ROUTES'].get(url_name, config['DEFAULT'])
+
+
+class QueryBudgetMiddleware:
+    """
+    Checks every request against the budget of its URL name in QUERY_BUDGET['ROUTES'], counting the
+    queries of a streaming response until its body is over.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if _mode() == 'off':
+            return self.get_response(request)
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return self.get_response(request)
+
+        budget = query_budget(route_budget(url_name), label=f'{request.method} {request.path} ({url_name})')
+        budget._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            budget._stop()
+        # Streamed bodies, like the order exports, read the database after the view returned
+        if response.streaming:
+            response.streaming_content = budget.stream(response.streaming_content)
+        else:
+            budget.check()
+        return response
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import Counter
+from functools import reduce
+from itertools import permutations
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When, Window
+from django.db.models.functions import RowNumber
+from . import regions
+from .models import OrderItem, ArchivedOrderItem, StockCoOccurrence
+
+# Neighbors kept per stock in the in-memory table
+TOP_K = 10
+
+BATCH_SIZE = 5000
+# Stocks whose pairs are incremented by one UPDATE
+UPDATE_BATCH_SIZE = 100
+
+
+def _pair_counts(model):
+    """
+    Counts, with a self-join on the order and a GROUP BY, the completed orders of `model`
+    that contain each ordered pair of different stocks.
+    """
+    pairs = model.objects.filter(order__status='completed') \
+        .annotate(other_id=F('order__items__stock_id')) \
+        .exclude(other_id=F('stock_id')) \
+        .order_by() \
+        .values('stock_id', 'other_id') \
+        .annotate(count=Count('order_id', distinct=True))
+    return pairs.values_list('stock_id', 'other_id', 'count').iterator(chunk_size=BATCH_SIZE)
+
+
+@regions.atomic
+def rebuild():
+    """
+    Recomputes the whole co-occurrence index from the live and the archived completed orders
+    and returns the number of pairs.
+    """
+    counts = Counter()
+    for model in (OrderItem, ArchivedOrderItem):
+        for stock_id, other_id, count in _pair_counts(model):
+            counts[stock_id, other_id] += count
+
+    StockCoOccurrence.objects.all().delete()
+    StockCoOccurrence.objects.bulk_create(
+        (StockCoOccurrence(stock_id=stock_id, other_id=other_id, count=count)
+         for (stock_id, other_id), count in counts.items()),
+        batch_size=BATCH_SIZE,
+    )
+    return len(counts)
+
+
+@regions.atomic
+def record_completed(order_ids):
+    """
+    Adds freshly completed orders to the co-occurrence index. Only the pairs of stocks
+    found in these orders are read and written.
+    """
+    baskets = {}
+    for order_id, stock_id in OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'stock_id'):
+        baskets.setdefault(order_id, set()).add(stock_id)
+
+    counts = Counter()
+    for stocks in baskets.values():
+        counts.update(permutations(stocks, 2))
+    if not counts:
+        return
+
+    # Missing pairs are inserted at zero first, the ones a concurrent completion inserted meanwhile are skipped
+    StockCoOccurrence.objects.bulk_create(
+        [StockCoOccurrence(stock_id=stock_id, other_id=other_id, count=0) for stock_id, other_id in counts],
+        ignore_conflicts=True, batch_size=BATCH_SIZE,
+    )
+
+    # Then every count is raised relative to its current value, so concurrent completions add up
+    others = {}
+    for stock_id, other_id in sorted(counts):
+        others.setdefault(stock_id, []).append(other_id)
+    stock_ids = list(others)
+    for start in range(0, len(stock_ids), UPDATE_BATCH_SIZE):
+        batch = stock_ids[start:start + UPDATE_BATCH_SIZE]
+        StockCoOccurrence.objects.filter(
+            reduce(or_, (Q(stock_id=stock_id, other_id__in=others[stock_id]) for stock_id in batch))
+        ).update(count=F('count') + Case(
+            *(When(stock_id=stock_id, other_id=other_id, then=Value(counts[stock_id, other_id]))
+              for stock_id in batch for other_id in others[stock_id]),
+            output_field=IntegerField(),
+        ))
+
+
+class RelatedTable:
+    """
+    Top TOP_K neighbors of every stock, held in memory so that the related stocks are served
+    without a query. Loaded on first use in each worker with a single windowed query and
+    reloaded every RECOMMENDATIONS_REFRESH_INTERVAL seconds. There is one table per region database.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.lock = threading.Lock()
+        self.table = None
+
+    def _load(self):
+        ranked = StockCoOccurrence.objects.using(self.database).filter(other__quantity__gt=0).annotate(
+            rank=Window(RowNumber(), partition_by=F('stock_id'), order_by=[F('count').desc(), F('other_id').asc()]),
+        ).filter(rank__lte=TOP_K).order_by('stock_id', 'rank')
+
+        table = {}
+        for stock_id, count, other_id, name, unit, price, shop_id in ranked.values_list(
+                'stock_id', 'count', 'other_id', 'other__name', 'other__unit', 'other__price_per_unit',
+                'other__shop_id').iterator(chunk_size=BATCH_SIZE):
+            table.setdefault(stock_id, []).append({
+                'id': other_id,
+                'name': name,
+                'unit': unit,
+                'price_per_unit': str(price),
+                'shop': shop_id,
+                'bought_together': count,
+            })
+        self.loaded_at = time.monotonic()
+        self.table = table
+
+    def _stale(self):
+        return self.table is None or time.monotonic() - self.loaded_at >= settings.RECOMMENDATIONS_REFRESH_INTERVAL
+
+    def related(self, stock_id, limit=TOP_K):
+        if self._stale():
+            # One thread reloads while the others keep reading the previous table, only the first load blocks
+            if self.lock.acquire(blocking=self.table is None):
+                try:
+                    if self._stale():
+                        self._load()
+                finally:
+                    self.lock.release()
+        return self.table.get(stock_id, [])[:limit]
+
+
+related_tables = {}
+related_tables_lock = threading.Lock()
+
+
+def related_stocks(stock_id, limit=TOP_K):
+    database = regions.current_database()
+    table = related_tables.get(database)
+    if table is None:
+        with related_tables_lock:
+            table = related_tables.setdefault(database, RelatedTable(database))
+    return table.related(stock_id, limit)
@@ -0,0 +1,261 @@
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Shops, stocks and orders are partitioned by the region of their pickup point (see settings.REGIONS).
+# Each region's rows live in the database of that region. Users, pickup points, shops and categories
+# are written to the default database and mirrored to every other one, so that the foreign keys and
+# joins of a shard stay local. The rest (auth tables, shop cards, map clusters) is only in default.
+SHARDED_MODELS = {
+    'grocereats_api.stock',
+    'grocereats_api.order',
+    'grocereats_api.orderitem',
+    'grocereats_api.stockmovement',
+    'grocereats_api.stockforecast',
+    'grocereats_api.stockcooccurrence',
+    'grocereats_api.archivedorder',
+    'grocereats_api.archivedorderitem',
+}
+MIRRORED_MODELS = {
+    'grocereats_api.user',
+    'grocereats_api.pickuppoint',
+    'grocereats_api.shop',
+    'grocereats_api.category',
+    'grocereats_api.subcategory',
+}
+
+REGION_HEADER = 'HTTP_X_REGION'
+
+_current_region = contextvars.ContextVar('region', default=None)
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def is_mirrored(model):
+    return model._meta.label_lower in MIRRORED_MODELS
+
+
+def default_region():
+    return settings.DEFAULT_REGION
+
+
+def region_for(lat, long):
+    """
+    Returns the region whose BBOX contains the point, DEFAULT_REGION when none does.
+    """
+    lat, long = float(lat), float(long)
+    for region, config in settings.REGIONS.items():
+        bbox = config.get('BBOX')
+        if bbox and bbox[0] <= lat <= bbox[2] and bbox[1] <= long <= bbox[3]:
+            return region
+    return settings.DEFAULT_REGION
+
+
+def database_for(region):
+    return settings.REGIONS[region]['DATABASE']
+
+
+def databases():
+    """
+    Returns the distinct databases of the regions.
+    """
+    return list(dict.fromkeys(config['DATABASE'] for config in settings.REGIONS.values()))
+
+
+def database_regions():
+    """
+    Returns one region per database, in the order of databases(): activating each of them in turn
+    visits every database once.
+    """
+    regions = {}
+    for region, config in settings.REGIONS.items():
+        regions.setdefault(config['DATABASE'], region)
+    return list(regions.values())
+
+
+def is_partitioned():
+    return databases() != [DEFAULT_DB_ALIAS]
+
+
+def current_region():
+    return _current_region.get() or settings.DEFAULT_REGION
+
+
+def current_database():
+    return database_for(current_region())
+
+
+def requested_region():
+    """
+    Returns the region chosen for the current request, None until one was.
+    """
+    return _current_region.get()
+
+
+def activate(region):
+    """
+    Routes the queries of the sharded models to `region` for the rest of the request
+    (RegionMiddleware restores the previous region when the request ends).
+    """
+    if region in settings.REGIONS:
+        _current_region.set(region)
+
+
+@contextmanager
+def use_region(region):
+    token = _current_region.set(region)
+    try:
+        yield
+    finally:
+        _current_region.reset(token)
+
+
+def atomic(func=None):
+    """
+    transaction.atomic() on the database of the current region, looked up when the block is
+    entered rather than when the function is decorated. Use it around writes of sharded models,
+    and select_for_update() on them.
+    """
+    if func is None:
+        return transaction.atomic(using=current_database())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(using=current_database()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _run_in_region(func, region):
+    database = database_for(region)
+    try:
+        with use_region(region):
+            return func()
+    finally:
+        # Connections opened by the worker threads are not closed at the end of a request
+        connections[database].close()
+
+
+def scatter_gather(func):
+    """
+    Calls `func()` once per database with the sharded models routed to it, concurrently when there
+    are several databases, and returns the results in the order of databases(). Meant for the
+    cross-region reads: admin reports, a customer's history across cities. With a single database,
+    or inside a transaction whose rows other threads could not see, `func` runs in the calling thread.
+    """
+    targets = database_regions()
+    if len(targets) == 1 or any(connections[database_for(region)].in_atomic_block for region in targets):
+        results = []
+        for region in targets:
+            with use_region(region):
+                results.append(func())
+        return results
+    # The workers run in copies of the caller's context, where the query budgets of the request are
+    contexts = [contextvars.copy_context() for _ in targets]
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(lambda context, region: context.run(_run_in_region, func, region), contexts, targets))
+
+
+def locate(queryset):
+    """
+    Activates the region whose database holds rows of `queryset` (of a sharded model), trying the
+    current region first, and returns it. Returns None, leaving the current region, when no database
+    does. A customer's carts and orders live in the region of their shop, which may not be the
+    customer's own. With a single database nothing is read.
+    """
+    current = current_region()
+    if not is_partitioned():
+        return current
+    others = [region for region in database_regions() if database_for(region) != database_for(current)]
+    for region in [current] + others:
+        with use_region(region):
+            found = queryset.exists()
+        if found:
+            activate(region)
+            return region
+    return None
+
+
+def mirror_save(instance, update_fields=None):
+    """
+    Copies a row of a mirrored model written to the default database to every other database.
+    """
+    model = type(instance)
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    if update_fields is not None:
+        fields = [field for field in fields if field.name in update_fields or field.attname in update_fields]
+    copy = model(**{field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields})
+    for database in databases():
+        if database == DEFAULT_DB_ALIAS:
+            continue
+        model._base_manager.using(database).bulk_create(
+            [copy], update_conflicts=bool(fields), ignore_conflicts=not fields,
+            unique_fields=[model._meta.pk.name] if fields else None,
+            update_fields=[field.name for field in fields] or None,
+        )
+
+
+def mirror_delete(instance):
+    """
+    Deletes a row of a mirrored model from every other database, with its sharded dependents.
+    """
+    model = type(instance)
+    for database in databases():
+        if database != DEFAULT_DB_ALIAS:
+            model._base_manager.using(database).filter(pk=instance.pk).delete()
+
+
+class RegionRouter:
+    """
+    Sends the sharded models to the database of the current region. Everything else is read from and
+    written to the default database, the mirror receivers in signals.py copy the writes of the
+    mirrored models to the other databases.
+    """
+
+    def _database(self, model, hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        # Related lookups from a sharded row stay in the database the row came from
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)) and instance._state.db:
+            return instance._state.db
+        return current_database()
+
+    def db_for_read(self, model, **hints):
+        return self._database(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mirrored rows exist in every database
+        if not is_sharded(type(obj1)) or not is_sharded(type(obj2)):
+            return True
+        return obj1._state.db == obj2._state.db
+
+
+class RegionMiddleware:
+    """
+    Routes the request to the region named by its X-Region header. Without one, the authentication
+    class falls back to the user's region and the views addressing a shop or an order switch to its region.
+    Admin pages, signed in with a session, show the region of the staff user.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        region = request.META.get(REGION_HEADER)
+        if region not in settings.REGIONS and settings.SESSION_COOKIE_NAME in request.COOKIES:
+            region = getattr(request.user, 'region', None)
+        token = _current_region.set(region if region in settings.REGIONS else None)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_region.reset(token)
@@ -0,0 +1,100 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# The filter is sized for at least this many revoked tokens
+MIN_CAPACITY = 10000
+FALSE_POSITIVE_RATE = 0.001
+# Rows are stamped when they are inserted but only seen once their transaction commits, each sync
+# reads back this far before the previous one so that a late commit is not skipped
+SYNC_MARGIN = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Set of strings answering "definitely absent" or "maybe present" in a fixed number of bits.
+    """
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: the k positions are derived from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationCache:
+    """
+    Bloom filter of the blacklisted token ids, kept in front of the blacklist table so that
+    tokens which were never revoked are accepted without a query.
+
+    The filter is built on first use in each worker, tokens blacklisted by this worker are
+    added right away, and the ones blacklisted by other workers are picked up at most every
+    TOKEN_REVOCATION_SYNC_INTERVAL seconds by reading the rows blacklisted since the previous
+    read, SYNC_MARGIN included. It is rebuilt from scratch every TOKEN_REVOCATION_REBUILD_INTERVAL
+    seconds to drop expired tokens.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+
+    def _build(self, now):
+        read_at = timezone.now()
+        revoked = BlacklistedToken.objects.filter(token__expires_at__gt=read_at).values_list('token__jti', flat=True)
+        revoked = list(revoked.iterator())
+        self.filter = BloomFilter(max(len(revoked) * 2, MIN_CAPACITY))
+        self._add_all(revoked)
+        self.read_at = read_at
+        self.built_at = self.synced_at = now
+
+    def _add_all(self, jtis):
+        for jti in jtis:
+            # Rows read again within the margin must not count twice against the capacity
+            if jti not in self.filter:
+                self.filter.add(jti)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if (self.filter is None or self.filter.count > self.filter.capacity
+                or now - self.built_at >= settings.TOKEN_REVOCATION_REBUILD_INTERVAL):
+            self._build(now)
+        elif now - self.synced_at >= settings.TOKEN_REVOCATION_SYNC_INTERVAL:
+            read_at = timezone.now()
+            self._add_all(BlacklistedToken.objects.filter(blacklisted_at__gte=self.read_at - SYNC_MARGIN)
+                          .values_list('token__jti', flat=True))
+            self.read_at = read_at
+            self.synced_at = now
+
+    def might_be_revoked(self, jti):
+        with self.lock:
+            self._refresh()
+            return jti in self.filter
+
+    def add(self, jti):
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(jti)
+
+
+revocation_cache = RevocationCache()
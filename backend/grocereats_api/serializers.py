@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, Shop, Stock, Order, OrderItem, PickupPoint, Category, SubCategory
+from . import images, regions
+from .models import User, Shop, Stock, Order, OrderItem, PickupPoint, Category, SubCategory, ShopCard, \
+    ArchivedOrder, ArchivedOrderItem
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -7,8 +10,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone', 'role', 'rating', 'password']
-        read_only_fields = ['id', 'rating']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone', 'role', 'rating', 'region', 'password']
+        read_only_fields = ['id', 'rating', 'region']
 
     def create(self, validated_data):
         # Ensure password is provided for new users
@@ -39,8 +42,8 @@ class UserSerializer(serializers.ModelSerializer):
 class PickupPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = PickupPoint
-        fields = ['id', 'name', 'lat', 'long', 'address']
-        read_only_fields = ['id']
+        fields = ['id', 'name', 'lat', 'long', 'address', 'region']
+        read_only_fields = ['id', 'region']
 
     def validate(self, data):
         # Validate latitude and longitude ranges
@@ -61,8 +64,8 @@ class ShopSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Shop
-        fields = ['id', 'name', 'pickup_point', 'seller']
-        read_only_fields = ['id', 'seller']
+        fields = ['id', 'name', 'pickup_point', 'seller', 'region']
+        read_only_fields = ['id', 'seller', 'region']
 
     def to_representation(self, instance):
         """Customize the representation for GET requests to include full pickup_point details."""
@@ -71,11 +74,24 @@ class ShopSerializer(serializers.ModelSerializer):
         return representation
 
 
+class ShopCardSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='shop_id', read_only=True)
+    pickup_point = serializers.IntegerField(source='pickup_point_id', read_only=True)
+
+    class Meta:
+        model = ShopCard
+        fields = ['id', 'name', 'pickup_point', 'pickup_point_name', 'lat', 'long', 'rating', 'stock_count',
+                  'completed_orders', 'categories']
+        read_only_fields = fields
+
+
 class RatingSerializer(serializers.Serializer):
     order_id = serializers.IntegerField()
     rating = serializers.DecimalField(max_digits=3, decimal_places=2)
 
     def validate_order_id(self, value):
+        # A customer's order lives in the region of its shop
+        regions.locate(Order.objects.filter(id=value))
         try:
             order = Order.objects.get(id=value)
         except Order.DoesNotExist:
@@ -87,6 +103,8 @@ class StockSerializer(serializers.ModelSerializer):
     shop = ShopSerializer(read_only=True)  # Read-only shop details
     subcategory = serializers.PrimaryKeyRelatedField(queryset=SubCategory.objects.all())  # Accept subcategory ID for writing
     category = serializers.SerializerMethodField()  # Dynamically include category details in response
+    photo = serializers.FileField(write_only=True, required=False)  # Uploaded photo, replaced by its thumbnails
+    thumbnails = serializers.SerializerMethodField()  # Size name -> thumbnail URL
 
     class Meta:
         model = Stock
@@ -100,10 +118,12 @@ class StockSerializer(serializers.ModelSerializer):
             'shop',
             'description',
             'photo_url',
+            'photo',
+            'thumbnails',
             'quantity',
             'timestamp_last_modified',
         ]
-        read_only_fields = ['id', 'timestamp_last_modified', 'shop', 'category']
+        read_only_fields = ['id', 'timestamp_last_modified', 'shop', 'category', 'thumbnails']
 
     def to_representation(self, instance):
         """Customize the representation for GET requests to include subcategory name."""
@@ -116,15 +136,45 @@ class StockSerializer(serializers.ModelSerializer):
         # Fetch the category via the related subcategory
         return obj.subcategory.category.name
 
+    def get_thumbnails(self, obj):
+        return images.thumbnail_urls(obj.photo_hash)
+
+    def validate_photo(self, value):
+        if value.size > settings.STOCK_PHOTO_MAX_SIZE:
+            raise serializers.ValidationError("The photo is too large.")
+        if images.sniff_extension(value.read(16)) is None:
+            raise serializers.ValidationError("Upload a JPEG, PNG, GIF or WebP image.")
+        value.seek(0)
+        return value
+
+    def _store_photo(self, validated_data):
+        photo = validated_data.pop('photo', None)
+        if photo is not None:
+            validated_data['photo_hash'] = images.store_photo(photo)
+
+    def create(self, validated_data):
+        self._store_photo(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._store_photo(validated_data)
+        return super().update(instance, validated_data)
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     stock = StockSerializer(read_only=True)  # Use StockSerializer to serialize the stock object
+    stock_id = serializers.IntegerField(write_only=True)  # Stock ID for writing, looked up by OrderSerializer
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'stock', 'quantity', 'price_at_purchase']
+        fields = ['id', 'stock', 'stock_id', 'quantity', 'price_at_purchase']
         read_only_fields = ['id', 'price_at_purchase']
 
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Quantity must be a positive number.")
+        return value
+
 class OrderItemSimpleSerializer(serializers.ModelSerializer):
     stock = serializers.PrimaryKeyRelatedField(queryset=Stock.objects.all())  # Allow referencing stock
 
@@ -144,6 +194,12 @@ class OrderSimpleSerializer(serializers.ModelSerializer):
         fields = ['id', 'buyer', 'shop', 'buyer', 'total_price', 'status', 'timestamp']
         read_only_fields = ['id', 'buyer', 'total_price', 'timestamp', 'status']
 
+
+class ArchivedOrderSimpleSerializer(OrderSimpleSerializer):
+    class Meta(OrderSimpleSerializer.Meta):
+        model = ArchivedOrder
+
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)  # Nested serializer for items
 
@@ -152,14 +208,45 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'buyer', 'shop', 'total_price', 'status', 'timestamp', 'items']
         read_only_fields = ['id', 'buyer', 'total_price', 'timestamp', 'status']
 
+    def validate(self, data):
+        items = data.get('items')
+        if items is not None:
+            if not items:
+                raise serializers.ValidationError({'items': 'An order needs at least one item.'})
+            # The stocks of all the items are read with one query
+            stocks = Stock.objects.filter(shop=data['shop']).in_bulk([item['stock_id'] for item in items])
+            for item in items:
+                stock = stocks.get(item.pop('stock_id'))
+                if stock is None:
+                    raise serializers.ValidationError({'items': 'All the items must be stocks of the shop of the order.'})
+                item['stock'] = stock
+        return data
+
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         order = Order.objects.create(**validated_data)
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        # Items are bought at the current price of their stock
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, price_at_purchase=item_data['stock'].price_per_unit, **item_data)
+            for item_data in items_data
+        ])
         return order
 
 
+class ArchivedOrderItemSerializer(OrderItemSerializer):
+    class Meta(OrderItemSerializer.Meta):
+        model = ArchivedOrderItem
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'buyer', 'shop', 'total_price', 'status', 'timestamp', 'items']
+        read_only_fields = fields
+
+
 class SubCategorySerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField(read_only=True)  # Include category name in response
 
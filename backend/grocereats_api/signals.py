@@ -0,0 +1,122 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import catalog, clustering, regions
+from .coalescing import invalidate_stock_lists
+from .models import User, PickupPoint, Shop, Stock, Order, ShopCard, Category, SubCategory
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved(sender, instance, created, using, **kwargs):
+    # Stock lists embed the shop
+    invalidate_stock_lists(instance.id, using=using)
+
+    # A seller's requests go to the region of their shop
+    if created and instance.seller.region != instance.region:
+        instance.seller.region = instance.region
+        instance.seller.save(update_fields=['region'])
+
+    # A new shop gets a full card, renames and pickup point moves only touch their own columns
+    if created or not ShopCard.objects.filter(shop=instance).exists():
+        with regions.use_region(instance.region):
+            ShopCard.refresh(instance)
+        return
+
+    pickup_point = instance.pickup_point
+    ShopCard.objects.filter(shop=instance).update(
+        name=instance.name,
+        pickup_point=pickup_point,
+        pickup_point_name=pickup_point.name,
+        lat=pickup_point.lat,
+        long=pickup_point.long,
+    )
+
+
+@receiver(post_save, sender=PickupPoint)
+def pickup_point_saved(sender, instance, created, using, **kwargs):
+    if created:
+        clustering.add(instance)
+    else:
+        # A moved point leaves the map cells of its previous position
+        if instance.coordinates_changed(kwargs['update_fields']):
+            previous = instance.previous_coordinates()
+            if previous is None:
+                # Saved without being read first, its previous cells are not known
+                clustering.rebuild()
+            else:
+                clustering.move(instance, *previous)
+        invalidate_stock_lists(*Shop.objects.filter(pickup_point=instance).values_list('id', flat=True), using=using)
+        ShopCard.objects.filter(pickup_point=instance).update(
+            pickup_point_name=instance.name,
+            lat=instance.lat,
+            long=instance.long,
+        )
+
+
+@receiver(post_delete, sender=PickupPoint)
+def pickup_point_deleted(sender, instance, using, **kwargs):
+    # Not again for the copies deleted by mirror_deleted()
+    if using == DEFAULT_DB_ALIAS:
+        clustering.remove(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, using, update_fields, **kwargs):
+    # The tile shows the seller's rating
+    if not created and instance.role == 'seller':
+        if using == DEFAULT_DB_ALIAS and (update_fields is None or catalog.SELLER_FIELDS.intersection(update_fields)):
+            catalog.schedule_rebuild()
+        invalidate_stock_lists(*Shop.objects.filter(seller=instance).values_list('id', flat=True), using=using)
+        ShopCard.objects.filter(shop__seller=instance).update(rating=instance.rating)
+
+
+@receiver(post_save, sender=Stock)
+def stock_saved(sender, instance, created, using, update_fields, **kwargs):
+    invalidate_stock_lists(instance.shop_id, using=using)
+    cards = ShopCard.objects.filter(shop_id=instance.shop_id)
+    if created:
+        cards.update(stock_count=F('stock_count') + 1, categories=ShopCard.categories_for(instance.shop_id))
+    elif instance.subcategory_changed(update_fields):
+        # Quantity and price changes, most of the saves, leave the categories as they are
+        cards.update(categories=ShopCard.categories_for(instance.shop_id))
+
+
+@receiver(post_delete, sender=Stock)
+def stock_deleted(sender, instance, using, **kwargs):
+    invalidate_stock_lists(instance.shop_id, using=using)
+    ShopCard.objects.filter(shop_id=instance.shop_id, stock_count__gt=0).update(
+        stock_count=F('stock_count') - 1,
+        categories=ShopCard.categories_for(instance.shop_id),
+    )
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        ShopCard.objects.filter(shop_id=instance.shop_id).update(
+            completed_orders=ShopCard.completed_orders_for(instance.shop_id)
+        )
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=PickupPoint)
+@receiver([post_save, post_delete], sender=Shop)
+def catalog_changed(sender, using, **kwargs):
+    # The offline catalog bundle embeds them, it is rebuilt shortly after the changes stop
+    if using == DEFAULT_DB_ALIAS:
+        catalog.schedule_rebuild()
+
+
+# Connected by GrocereatsApiConfig.ready() to the models of regions.MIRRORED_MODELS only, a post_delete
+# receiver of every model would turn off the fast deletes of all of them
+def mirror_saved(sender, instance, using, update_fields, **kwargs):
+    # Users, pickup points, shops and categories are copied to the database of every region
+    if using == DEFAULT_DB_ALIAS and regions.is_partitioned():
+        regions.mirror_save(instance, update_fields)
+
+
+def mirror_deleted(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS and regions.is_partitioned():
+        regions.mirror_delete(instance)
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.core.cache import caches
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from grocereats_api import recommendations, revocation
+from grocereats_api.models import User, PickupPoint, Shop, Stock, Category, SubCategory
+
+
+class GrocerEatsTestCase(APITestCase):
+    """
+    A seller with a shop of two stocks in two categories, and a customer. Clients authenticate
+    with a JWT access token, so requests go through the same authentication as the app's.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit')
+        cls.apples = SubCategory.objects.create(category=cls.fruit, name='Apples')
+        cls.vegetables = Category.objects.create(name='Vegetables')
+        cls.carrots = SubCategory.objects.create(category=cls.vegetables, name='Carrots')
+
+        cls.pickup_point = PickupPoint.objects.create(
+            lat=Decimal('44.435'), long=Decimal('26.102'), name='Piata Unirii', address='Piata Unirii 1')
+        cls.seller = cls.create_user('seller', 'seller')
+        cls.customer = cls.create_user('customer', 'customer')
+        cls.shop = Shop.objects.create(name='Green Grocer', pickup_point=cls.pickup_point, seller=cls.seller)
+        cls.apple = Stock.objects.create(name='Apple', unit='kg', price_per_unit=Decimal('2.50'),
+                                         subcategory=cls.apples, shop=cls.shop, quantity=Decimal('100'))
+        cls.carrot = Stock.objects.create(name='Carrot', unit='kg', price_per_unit=Decimal('1.99'),
+                                          subcategory=cls.carrots, shop=cls.shop, quantity=Decimal('50'))
+
+    @staticmethod
+    def create_user(username, role, **fields):
+        return User.objects.create_user(username=username, email=f'{username}@example.com', password='secret',
+                                        role=role, **fields)
+
+    def setUp(self):
+        # Process-wide state outlives the rolled back transaction of a test
+        for cache in caches.all():
+            cache.clear()
+        revocation.revocation_cache.filter = None
+        recommendations.related_tables.clear()
+
+        self.seller_client = self.client_for(self.seller)
+        self.customer_client = self.client_for(self.customer)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
@@ -0,0 +1,75 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from grocereats_api.admin import EstimatedCountPaginator
+from grocereats_api.models import Order, Stock, User
+from .base import GrocerEatsTestCase
+
+
+class AdminTests(GrocerEatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin', 'customer', is_staff=True, is_superuser=True)
+        self.admin_browser = Client()
+        self.admin_browser.force_login(self.admin)
+
+    def order(self):
+        return Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('2.50'), status='pending')
+
+    def changelist_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin_browser.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        for path, add_row in [
+            ('/admin/grocereats_api/order/', self.order),
+            ('/admin/grocereats_api/stock/', lambda: Stock.objects.create(
+                name='Pear', unit='kg', price_per_unit=Decimal('3'), subcategory=self.apples, shop=self.shop,
+                quantity=Decimal('10'))),
+            ('/admin/grocereats_api/user/', lambda: self.create_user(f'user{User.objects.count()}', 'customer')),
+        ]:
+            with self.subTest(path=path):
+                add_row()
+                queries = self.changelist_queries(path)
+                for _ in range(5):
+                    add_row()
+                self.assertEqual(self.changelist_queries(path), queries)
+
+    def test_search(self):
+        order = self.order()
+        response = self.admin_browser.get(f'/admin/grocereats_api/order/?q={order.id}')
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+        response = self.admin_browser.get('/admin/grocereats_api/order/?q=cust')
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+        response = self.admin_browser.get('/admin/grocereats_api/order/?q=seller')
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+        # Only the id lookups are skipped for words, the prefix ones still apply
+        request = RequestFactory().get('/', {'q': 'cust'})
+        self.assertEqual(site._registry[Order].get_search_fields(request), ['buyer__username__startswith'])
+
+    def test_sqlite_changelists_are_counted_exactly(self):
+        self.order()
+        self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 50).count, 1)
+
+    def test_big_postgresql_tables_use_the_planner_estimate(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.side_effect = [(2500000.0,), (10.0,)]
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor), \
+                mock.patch('django.core.paginator.Paginator.count', new_callable=mock.PropertyMock, return_value=7):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 50).count, 2500000)
+            # Small tables and filtered lists are counted
+            self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 50).count, 7)
+            self.assertEqual(EstimatedCountPaginator(Order.objects.filter(status='pending'), 50).count, 7)
+
+        cursor.__enter__.return_value.execute.assert_called_with(
+            'SELECT reltuples FROM pg_class WHERE relname = %s', ['grocereats_api_order'])
+        self.assertEqual(cursor.__enter__.return_value.execute.call_count, 2)
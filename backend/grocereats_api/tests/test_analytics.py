@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from grocereats_api.models import ArchivedOrder, ArchivedOrderItem, Order
+from .base import GrocerEatsTestCase
+
+
+class ShopAnalyticsTests(GrocerEatsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.order('completed', datetime(2024, 3, 4, 10, tzinfo=timezone.utc), [(cls.apple, '2'), (cls.carrot, '1')])
+        cls.order('completed', datetime(2024, 3, 5, 18, tzinfo=timezone.utc), [(cls.apple, '1')])
+        cls.order('cancelled', datetime(2024, 3, 5, 12, tzinfo=timezone.utc), [(cls.apple, '40')])
+        cls.order('completed', datetime(2024, 5, 1, 12, tzinfo=timezone.utc), [(cls.apple, '40')])
+
+        archived = ArchivedOrder.objects.create(id=1000, buyer=cls.customer, shop=cls.shop, total_price=Decimal('3.98'),
+                                                status='completed', timestamp=datetime(2024, 3, 4, 8, tzinfo=timezone.utc))
+        ArchivedOrderItem.objects.create(id=1000, order=archived, stock=cls.carrot, quantity=Decimal('2'),
+                                         price_at_purchase=Decimal('1.99'))
+
+    @classmethod
+    def order(cls, order_status, timestamp, items):
+        order = Order.objects.create(buyer=cls.customer, shop=cls.shop, total_price=Decimal('0'), status=order_status)
+        for stock, quantity in items:
+            order.items.create(stock=stock, quantity=Decimal(quantity), price_at_purchase=stock.price_per_unit)
+        Order.objects.filter(id=order.id).update(timestamp=timestamp)
+
+    def analytics(self, query):
+        response = self.seller_client.get(f'/shop/analytics/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_daily_sales_include_the_archive(self):
+        data = self.analytics('from=2024-03-01&to=2024-03-31')
+        # 6.99 and 2.50 of live orders, 3.98 archived
+        # The units are the sum of the quantities as the database returns it, compared as numbers
+        self.assertEqual(Decimal(data['totals'].pop('units')), 6)
+        self.assertEqual(data['totals'], {'revenue': '13.47', 'orders': 3, 'average_basket': '4.49'})
+        self.assertEqual([(period['period'], period['revenue'], period['orders']) for period in data['periods']],
+                         [('2024-03-04', '10.97', 2), ('2024-03-05', '2.50', 1)])
+        self.assertEqual([(stock['name'], Decimal(stock['units']), stock['revenue']) for stock in data['stocks']],
+                         [('Apple', 3, '7.50'), ('Carrot', 3, '5.97')])
+        self.assertEqual(data['subcategories'], [
+            {'name': 'Apples', 'revenue': '7.50', 'share': 0.5568},
+            {'name': 'Carrots', 'revenue': '5.97', 'share': 0.4432},
+        ])
+
+    def test_weekly_sales(self):
+        data = self.analytics('granularity=week&from=2024-03-01&to=2024-03-31')
+        self.assertEqual([(period['period'], period['orders']) for period in data['periods']], [('2024-03-04', 3)])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.seller_client.get('/shop/analytics/?granularity=year').status_code, 400)
+        self.assertEqual(self.seller_client.get('/shop/analytics/?from=March').status_code, 400)
+        self.assertEqual(self.customer_client.get('/shop/analytics/').status_code, 403)
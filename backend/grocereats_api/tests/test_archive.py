@@ -0,0 +1,67 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from grocereats_api.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .base import GrocerEatsTestCase
+
+
+class ArchiveOrdersTests(GrocerEatsTestCase):
+
+    def order(self, order_status, days_ago):
+        order = Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('2.50'),
+                                     status=order_status)
+        order.items.create(stock=self.apple, quantity=Decimal('1'), price_at_purchase=Decimal('2.50'))
+        Order.objects.filter(id=order.id).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def archive(self, *args):
+        call_command('archive_orders', '--older-than-days', '90', *args, stdout=StringIO())
+
+    def test_old_closed_orders_are_moved(self):
+        completed = self.order('completed', 200)
+        cancelled = self.order('cancelled', 100)
+        pending = self.order('pending', 200)
+        recent = self.order('completed', 10)
+
+        self.archive()
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {pending.id, recent.id})
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), {completed.id, cancelled.id})
+        self.assertFalse(OrderItem.objects.filter(order__in=[completed, cancelled]).exists())
+
+        archived = ArchivedOrder.objects.get(id=completed.id)
+        self.assertEqual((archived.status, archived.total_price, archived.buyer), ('completed', Decimal('2.50'), self.customer))
+        self.assertEqual(ArchivedOrderItem.objects.get(order=archived).stock, self.apple)
+
+        # The history still shows them, newest first
+        response = self.customer_client.get('/orders/')
+        self.assertEqual([order['id'] for order in response.data], [recent.id, cancelled.id, pending.id, completed.id])
+
+    def test_archived_order_detail(self):
+        completed = self.order('completed', 200)
+        self.archive()
+
+        for client in (self.customer_client, self.seller_client):
+            response = client.get(f'/orders/{completed.id}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.data['status'], response.data['total_price']), ('completed', '2.50'))
+            self.assertEqual([(item['stock']['name'], item['quantity']) for item in response.data['items']],
+                             [('Apple', '1.00')])
+
+        response = self.seller_client.patch(f'/orders/{completed.id}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        stranger = self.client_for(self.create_user('stranger', 'customer'))
+        self.assertEqual(stranger.get(f'/orders/{completed.id}/').status_code, 403)
+        self.assertEqual(self.customer_client.get('/orders/999/').status_code, 404)
+
+    def test_batches(self):
+        orders = [self.order('completed', 200) for _ in range(5)]
+        self.archive('--batch-size', '2', '--max-batches', '2')
+        self.assertEqual(ArchivedOrder.objects.count(), 4)
+
+        # The next run resumes with the remaining ones
+        self.archive('--batch-size', '2')
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), {order.id for order in orders})
+        self.assertFalse(Order.objects.exists())
@@ -0,0 +1,101 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db.models.query import QuerySet
+from grocereats_api.models import Order, Shop, Stock
+from .base import GrocerEatsTestCase
+
+
+class CartTests(GrocerEatsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_seller = cls.create_user('baker', 'seller')
+        cls.bakery = Shop.objects.create(name='Bakery', pickup_point=cls.pickup_point, seller=cls.other_seller)
+        cls.bread = Stock.objects.create(name='Bread', unit='pcs', price_per_unit=Decimal('4.20'),
+                                         subcategory=cls.apples, shop=cls.bakery, quantity=Decimal('10'))
+
+    def add_item(self, shop, stock, quantity):
+        response = self.customer_client.post('/orders/add-item/', {
+            'shop_id': shop.id, 'stock_id': stock.id, 'quantity': quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_one_cart_per_shop(self):
+        grocer_cart = self.add_item(self.shop, self.apple, '1')['order_id']
+        self.assertEqual(self.add_item(self.shop, self.carrot, '1')['order_id'], grocer_cart)
+        bakery_cart = self.add_item(self.bakery, self.bread, '2')['order_id']
+        self.assertNotEqual(bakery_cart, grocer_cart)
+
+        response = self.customer_client.get('/orders/carts/')
+        self.assertEqual({cart['id'] for cart in response.data}, {grocer_cart, bakery_cart})
+
+        response = self.customer_client.get(f'/orders/active/?shop_id={self.bakery.id}')
+        self.assertEqual(response.data['id'], bakery_cart)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('8.40'))
+
+    def test_adding_the_same_stock_twice_adds_up(self):
+        self.add_item(self.shop, self.apple, '1')
+        added = self.add_item(self.shop, self.apple, '1.5')
+        self.assertEqual(Decimal(added['quantity']), Decimal('2.5'))
+        self.assertEqual(Order.objects.get(id=added['order_id']).total_price, Decimal('6.25'))
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('97.5'))
+
+    def test_checkout_of_some_carts(self):
+        grocer_cart = self.add_item(self.shop, self.apple, '1')['order_id']
+        bakery_cart = self.add_item(self.bakery, self.bread, '1')['order_id']
+
+        response = self.customer_client.post('/orders/checkout/', {'order_ids': [bakery_cart]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_ids'], [bakery_cart])
+        self.assertEqual(response.data['total_price'], '4.20')
+        self.assertEqual(Order.objects.get(id=grocer_cart).status, 'active')
+        self.assertEqual(Order.objects.get(id=bakery_cart).status, 'pending')
+
+        # Empty carts are not submitted
+        Order.objects.get(id=grocer_cart).items.all().delete()
+        response = self.customer_client.post('/orders/checkout/', {}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cart_created_by_a_concurrent_add(self):
+        # The first lookup misses the cart that a concurrent request is inserting meanwhile
+        existing = Order.objects.create(buyer=self.customer, shop=self.shop, status='active', total_price=0)
+        get = QuerySet.get
+        missed = []
+
+        def get_missing_the_cart_once(queryset, *args, **kwargs):
+            if queryset.model is Order and not missed:
+                missed.append(True)
+                raise Order.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'get', get_missing_the_cart_once):
+            added = self.add_item(self.shop, self.apple, '1')
+
+        self.assertEqual(missed, [True])
+        self.assertEqual(added['order_id'], existing.id)
+        self.assertEqual(Order.objects.filter(buyer=self.customer, status='active').count(), 1)
+
+    def test_failed_item_changes_leave_the_cart_as_it_was(self):
+        added = self.add_item(self.shop, self.apple, '2')
+        item_id = added['order_item_id']
+
+        with mock.patch('grocereats_api.views.record_movement', side_effect=RuntimeError('Ledger unavailable')):
+            with self.assertRaises(RuntimeError):
+                self.customer_client.patch(f'/orders/item/edit/{item_id}/', {'quantity': '5'}, format='json')
+            with self.assertRaises(RuntimeError):
+                self.customer_client.delete(f'/orders/item/delete/{item_id}/')
+
+        order = Order.objects.get(id=added['order_id'])
+        self.assertEqual(order.items.get().quantity, Decimal('2'))
+        self.assertEqual(order.total_price, Decimal('5.00'))
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('98'))
+
+        response = self.customer_client.patch(f'/orders/item/edit/{item_id}/', {'quantity': '5'}, format='json')
+        self.assertEqual(response.data['order_item']['stock'], 'Apple')
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('95'))
+        self.customer_client.delete(f'/orders/item/delete/{item_id}/')
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('100'))
+        self.assertEqual(Order.objects.get(id=added['order_id']).total_price, Decimal('0'))
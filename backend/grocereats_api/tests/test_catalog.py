@@ -0,0 +1,76 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from grocereats_api import catalog
+from grocereats_api.models import Category
+from .base import GrocerEatsTestCase
+
+
+class CatalogBundleTests(GrocerEatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(CATALOG_BUNDLE=dict(settings.CATALOG_BUNDLE, DIR=directory.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        # The mapped bundle of the worker outlives the directory of the previous test
+        catalog.bundle.state = None
+
+    def test_bundle_matches_the_list_endpoints(self):
+        response = self.customer_client.get('/catalog/bundle/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        bundle = json.loads(response.content)
+
+        for key, path in [('categories', '/categories/'), ('subcategories', '/subcategories/'),
+                          ('pickup_points', '/pickup-points/'), ('shops', '/shops/')]:
+            with self.subTest(path=path):
+                listed = json.loads(self.customer_client.get(path).content)
+                self.assertEqual(sorted(bundle[key], key=lambda row: row['id']),
+                                 sorted(listed, key=lambda row: row['id']))
+
+        response = self.customer_client.get('/catalog/bundle/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        compressed = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(compressed))
+        self.assertEqual(json.loads(gzip.decompress(compressed)), bundle)
+
+    def test_not_modified_until_the_catalog_changes(self):
+        etag = self.customer_client.get('/catalog/bundle/')['ETag']
+        response = self.customer_client.get('/catalog/bundle/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Category.objects.create(name='Dairy')
+        catalog.build()
+        response = self.customer_client.get('/catalog/bundle/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Dairy', [category['name'] for category in json.loads(response.content)['categories']])
+
+    def test_build_command(self):
+        stdout = StringIO()
+        call_command('build_catalog_bundle', stdout=stdout)
+        version = catalog.build()
+        self.assertEqual(stdout.getvalue().strip(), f'Catalog bundle {version} is current.')
+        # An unchanged catalog keeps its version
+        self.assertEqual(catalog.build(), version)
+
+        with self.settings(CATALOG_BUNDLE=dict(settings.CATALOG_BUNDLE, KEEP=1)):
+            Category.objects.create(name='Dairy')
+            catalog.build()
+        self.assertEqual(len(list(catalog._directory().glob('catalog-*.json.gz'))), 1)
+
+    def test_changes_schedule_a_rebuild_after_the_commit(self):
+        with mock.patch.object(catalog._rebuild, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name='Dairy')
+                schedule.assert_not_called()
+            schedule.assert_called()
@@ -0,0 +1,120 @@
+import threading
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from grocereats_api.coalescing import SingleFlight
+from grocereats_api.models import Stock
+from .base import GrocerEatsTestCase
+
+
+class WaiterCountingEvent(threading.Event):
+    """
+    Event telling how many threads started waiting on it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.waiters = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiters.release()
+        return super().wait(timeout)
+
+
+class CountingSingleFlight(SingleFlight):
+
+    class _Call(SingleFlight._Call):
+        def __init__(self):
+            super().__init__()
+            self.done = WaiterCountingEvent()
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def run_concurrently(self, flight, compute, count=5):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(flight.do('key', compute))
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_computation(self):
+        flight = CountingSingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'stocks'
+
+        threads, results, errors = self.run_concurrently(flight, compute)
+        started.wait(5)
+        call = flight.calls['key']
+        # The four followers wait for the leader's call rather than computing
+        for _ in range(4):
+            self.assertTrue(call.done.waiters.acquire(timeout=5))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['stocks'] * 5)
+        self.assertEqual(flight.calls, {})
+        # Later callers compute again
+        self.assertEqual(flight.do('key', lambda: 'fresh'), 'fresh')
+
+    def test_errors_reach_every_caller(self):
+        flight = CountingSingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            raise ValueError('database down')
+
+        threads, results, errors = self.run_concurrently(flight, compute, count=3)
+        started.wait(5)
+        for _ in range(2):
+            self.assertTrue(flight.calls['key'].done.waiters.acquire(timeout=5))
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [])
+        self.assertEqual([str(error) for error in errors], ['database down'] * 3)
+
+
+class StockListCacheTests(GrocerEatsTestCase):
+
+    def names(self, query=''):
+        response = self.customer_client.get(f'/stocks/{self.shop.id}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(stock['name'], stock['quantity']) for stock in response.data]
+
+    def test_lists_are_cached_until_the_stock_changes(self):
+        self.assertEqual(self.names('?sort=name'), [('Apple', '100.00'), ('Carrot', '50.00')])
+        # Not seen through the cache, a write bypassing the models does not invalidate it
+        Stock.objects.filter(id=self.apple.id).update(quantity=Decimal('1'))
+        self.assertEqual(self.names('?sort=name'), [('Apple', '100.00'), ('Carrot', '50.00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.seller_client.patch(f'/stocks/edit/{self.carrot.id}/', {'quantity': '40'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names('?sort=name'), [('Apple', '1.00'), ('Carrot', '40.00')])
+
+    def test_unknown_shop(self):
+        self.assertEqual(self.customer_client.get('/stocks/999/').status_code, 404)
@@ -0,0 +1,73 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.utils import timezone
+from grocereats_api.exports import parse_bound
+from grocereats_api.models import ArchivedOrder, Order, Shop
+from .base import GrocerEatsTestCase
+
+
+class ExportBoundsAndOwnershipTests(GrocerEatsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_seller = cls.create_user('baker', 'seller')
+        cls.bakery = Shop.objects.create(name='Bakery', pickup_point=cls.pickup_point, seller=cls.other_seller)
+
+    def order(self, day, shop=None, status='completed'):
+        order = Order.objects.create(buyer=self.customer, shop=shop or self.shop, total_price=Decimal('2.50'),
+                                     status=status)
+        Order.objects.filter(id=order.id).update(timestamp=timezone.make_aware(datetime(2024, 5, day, 12)))
+        return order.id
+
+    def exported(self, query='', client=None):
+        response = (client or self.seller_client).get(f'/orders/export/?format=ndjson{query}')
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line)['order_id'] for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_parse_bound(self):
+        self.assertIsNone(parse_bound(''))
+        self.assertEqual(parse_bound('2024-05-02'), timezone.make_aware(datetime(2024, 5, 2)))
+        # A day given as the upper bound is included
+        self.assertEqual(parse_bound('2024-05-02', end=True), timezone.make_aware(datetime(2024, 5, 3)))
+        self.assertEqual(parse_bound('2024-05-02T10:30:00+00:00'),
+                         datetime(2024, 5, 2, 10, 30, tzinfo=dt_timezone.utc))
+        with self.assertRaisesMessage(ValueError, 'Invalid date: 2024-13-01'):
+            parse_bound('2024-13-01')
+
+    def test_date_bounds(self):
+        first, second, third = self.order(1), self.order(2), self.order(3)
+        self.assertEqual(self.exported(), [first, second, third])
+        self.assertEqual(self.exported('&from=2024-05-02'), [second, third])
+        self.assertEqual(self.exported('&to=2024-05-02'), [first, second])
+        self.assertEqual(self.exported('&from=2024-05-02&to=2024-05-02'), [second])
+        self.assertEqual(self.exported('&from=2024-05-01T13:00:00'), [second, third])
+
+    def test_only_the_sellers_closed_orders(self):
+        own = self.order(1)
+        cancelled = self.order(2, status='cancelled')
+        self.order(2, status='active')
+        bakery_order = self.order(3, shop=self.bakery)
+        ArchivedOrder.objects.create(id=10 ** 6, buyer=self.customer, shop=self.shop, total_price=Decimal('1'),
+                                     status='completed', timestamp=timezone.make_aware(datetime(2023, 1, 1)))
+
+        self.assertEqual(self.exported(), [10 ** 6, own, cancelled])
+        self.assertEqual(self.exported(client=self.client_for(self.other_seller)), [bakery_order])
+
+    def test_errors_are_json(self):
+        for client, path, expected_status in [
+            (self.seller_client, '/orders/export/?format=csv&from=yesterday', 400),
+            (self.customer_client, '/orders/export/?format=csv', 403),
+            (self.seller_client, '/orders/export/?format=xml', 404),
+        ]:
+            with self.subTest(path=path, status=expected_status):
+                response = client.get(path)
+                self.assertEqual(response.status_code, expected_status)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('error' if expected_status == 400 else 'detail', json.loads(response.content))
+
+        response = self.seller_client.get('/orders/export/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(response['Content-Type'], 'application/json')
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.utils import timezone
+from grocereats_api import forecasting
+from grocereats_api.models import OrderItem, StockForecast, StockMovement
+from .base import GrocerEatsTestCase
+
+
+class SmoothingTests(SimpleTestCase):
+
+    def test_fold(self):
+        monday = date(2024, 3, 4)
+        self.assertEqual(forecasting.fold(Decimal(10), monday, Decimal(20), monday + timedelta(days=1)), Decimal('13'))
+        # Days without demand decay the average
+        self.assertEqual(forecasting.fold(Decimal(10), monday, Decimal(20), monday + timedelta(days=3)),
+                         Decimal('6.37'))
+        # The demand of today is not folded in before the day is over
+        self.assertEqual(forecasting.fold(Decimal(10), monday, Decimal(20), monday), Decimal(10))
+        # A day restoring more than it took, a cart emptied the day after it was filled, is no demand
+        self.assertEqual(forecasting.fold(Decimal(10), monday, Decimal(-20), monday + timedelta(days=1)), Decimal('7'))
+
+    def test_days_until_stockout(self):
+        self.assertEqual(forecasting.days_until_stockout(Decimal(10), Decimal(3)), 3.3)
+        self.assertEqual(forecasting.days_until_stockout(Decimal(-1), Decimal(3)), 0)
+        self.assertIsNone(forecasting.days_until_stockout(Decimal(10), Decimal(0)))
+
+
+class ForecastTests(GrocerEatsTestCase):
+
+    def movement(self, stock, quantity, days_ago):
+        reason = 'order' if Decimal(quantity) < 0 else 'order_restore'
+        movement = StockMovement.objects.create(stock=stock, quantity=Decimal(quantity), reason=reason)
+        StockMovement.objects.filter(id=movement.id).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        return movement
+
+    def forecasts(self, today):
+        return {
+            forecast.stock_id: (forecasting.current_demand(forecast, today),
+                                forecast.day_demand if forecast.day == today else Decimal(0))
+            for forecast in StockForecast.objects.all()
+        }
+
+    def test_carts_feed_the_forecast(self):
+        for quantity in ('2', '3'):
+            self.customer_client.post('/orders/add-item/', {
+                'shop_id': self.shop.id, 'stock_id': self.apple.id, 'quantity': quantity,
+            }, format='json')
+        forecast = StockForecast.objects.get(stock=self.apple)
+        self.assertEqual((forecast.day, forecast.day_demand, forecast.daily_demand),
+                         (timezone.localdate(), Decimal('5'), Decimal('0')))
+
+        # The next day, the demand of the previous one is folded into the average
+        StockForecast.objects.filter(stock=self.apple).update(day=timezone.localdate() - timedelta(days=1))
+        self.customer_client.delete(f'/orders/item/delete/{OrderItem.objects.get(stock=self.apple).id}/')
+        forecast.refresh_from_db()
+        self.assertEqual((forecast.day, forecast.day_demand, forecast.daily_demand),
+                         (timezone.localdate(), Decimal('-5'), Decimal('1.5')))
+
+    def test_rebuild_matches_the_incremental_forecast(self):
+        today = timezone.localdate()
+        # The ledger of four days, the carrot's cart of two days ago was emptied yesterday
+        for stock, quantity, days_ago in [(self.apple, '-10', 3), (self.carrot, '-2', 2), (self.apple, '-4', 1),
+                                          (self.apple, '3', 1), (self.carrot, '2', 1), (self.carrot, '-1', 0)]:
+            movement = self.movement(stock, quantity, days_ago)
+            with mock.patch('django.utils.timezone.localdate', return_value=today - timedelta(days=days_ago)):
+                forecasting.observe([movement])
+        incremental = self.forecasts(today)
+
+        StockForecast.objects.all().delete()
+        call_command('forecast_stock_demand', '--shop', str(self.shop.id), stdout=StringIO())
+        self.assertEqual(self.forecasts(today), incremental)
+        self.assertEqual(incremental, {
+            self.apple.id: (Decimal('1.77'), Decimal('0')),
+            self.carrot.id: (Decimal('0.42'), Decimal('1')),
+        })
+
+    def test_forecast_endpoint(self):
+        self.movement(self.apple, '-10', 3)
+        self.movement(self.apple, '-4', 1)
+        call_command('forecast_stock_demand', '--shop', str(self.shop.id), stdout=StringIO())
+
+        response = self.seller_client.get('/stocks/forecast/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(stock['name'], stock['daily_demand'], stock['days_until_stockout']) for stock in response.data],
+                         [('Apple', '2.67', 37.5), ('Carrot', '0.00', None)])
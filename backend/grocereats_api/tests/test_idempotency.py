@@ -0,0 +1,62 @@
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from grocereats_api.models import Order, Stock
+from .base import GrocerEatsTestCase
+
+
+class IdempotencyTests(GrocerEatsTestCase):
+
+    def add_item(self, key, quantity='2', client=None):
+        return (client or self.customer_client).post('/orders/add-item/', {
+            'shop_id': self.shop.id, 'stock_id': self.apple.id, 'quantity': quantity,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_are_replayed(self):
+        first = self.add_item('retry-1')
+        self.assertEqual(first.status_code, 200, first.data)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        retry = self.add_item('retry-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        # The stock was reserved once
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('98'))
+        self.assertEqual(Order.objects.get().total_price, Decimal('5.00'))
+
+        # Without a key or with another one the handler runs again
+        self.add_item('retry-2')
+        self.customer_client.post('/orders/add-item/', {
+            'shop_id': self.shop.id, 'stock_id': self.apple.id, 'quantity': '2',
+        }, format='json')
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('94'))
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = self.client_for(self.create_user('other', 'customer'))
+        self.add_item('shared')
+        response = self.add_item('shared', client=other)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('96'))
+
+    def test_reusing_a_key_for_another_request(self):
+        self.add_item('reused')
+        response = self.add_item('reused', quantity='3')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('98'))
+
+    def test_invalid_keys_and_concurrent_requests(self):
+        self.assertEqual(self.add_item('k' * 256).status_code, 400)
+
+        # Another request holds the key
+        digest = hashlib.sha256(b'busy').hexdigest()[:32]
+        cache.add(f'idempotency:{self.customer.pk}:add_item_to_order:{digest}:lock', 'fingerprint')
+        self.assertEqual(self.add_item('busy').status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_client_errors_are_replayed(self):
+        response = self.add_item('too-many', quantity='101')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.add_item('too-many', quantity='101')['Idempotent-Replayed'], 'true')
+
@@ -0,0 +1,83 @@
+import io
+from concurrent.futures import Future
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from PIL import Image
+from grocereats_api import images
+from grocereats_api.models import Stock
+from .base import GrocerEatsTestCase
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'green').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class SynchronousExecutor:
+    """
+    Runs the submitted thumbnail jobs right away, in the calling thread.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ThumbnailTests(SimpleTestCase):
+
+    def test_sniff_extension(self):
+        self.assertEqual(images.sniff_extension(png(1, 1)), 'png')
+        self.assertEqual(images.sniff_extension(b'\xff\xd8\xff\xe0rest'), 'jpg')
+        self.assertEqual(images.sniff_extension(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'webp')
+        self.assertIsNone(images.sniff_extension(b'<svg xmlns="http://www.w3.org/2000/svg"/>'))
+
+    def test_thumbnails_are_never_wider_than_the_original(self):
+        thumbnails = images.render_thumbnails(png(400, 200), [160, 640])
+        self.assertEqual(Image.open(io.BytesIO(thumbnails[160])).size, (160, 80))
+        self.assertEqual(Image.open(io.BytesIO(thumbnails[640])).size, (400, 200))
+        self.assertEqual(Image.open(io.BytesIO(thumbnails[160])).format, 'JPEG')
+
+
+class StockPhotoTests(GrocerEatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = SynchronousExecutor()
+        patcher = mock.patch('grocereats_api.images._get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, stock, data, name='photo.png'):
+        return self.seller_client.patch(f'/stocks/edit/{stock.id}/', {
+            'photo': SimpleUploadedFile(name, data),
+        }, format='multipart')
+
+    def test_upload_stores_the_thumbnails_once(self):
+        data = png(800, 600)
+        response = self.upload(self.apple, data)
+        self.assertEqual(response.status_code, 200, response.data)
+        photo_hash = Stock.objects.get(id=self.apple.id).photo_hash
+        self.assertEqual(set(response.data['thumbnails']), {'small', 'medium', 'large'})
+        self.assertTrue(default_storage.exists(images.original_name(photo_hash)))
+        for size in ('small', 'medium', 'large'):
+            self.assertTrue(default_storage.exists(images.thumbnail_name(photo_hash, size)))
+
+        # The same photo for another stock is stored under the same hash, without rendering again
+        response = self.upload(self.carrot, data, name='other.png')
+        self.assertEqual(Stock.objects.get(id=self.carrot.id).photo_hash, photo_hash)
+        self.assertEqual(self.executor.submitted, 1)
+
+    def test_only_images_are_accepted(self):
+        response = self.upload(self.apple, b'#!/bin/sh\necho hello\n', name='photo.png')
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(Stock.objects.get(id=self.apple.id).photo_hash)
+        self.assertIsNone(self.customer_client.get(f'/stocks/{self.shop.id}/').data[0]['thumbnails'])
@@ -0,0 +1,115 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from grocereats_api import clustering, geo
+from grocereats_api.models import PickupPoint, PickupPointCluster, Shop
+from .base import GrocerEatsTestCase
+
+
+class GeoTests(SimpleTestCase):
+
+    def test_cells(self):
+        self.assertEqual((geo.cell_x(-180, 0, 4), geo.cell_x(0, 0, 4), geo.cell_x(180, 0, 4)), (0, 2, 3))
+        self.assertEqual((geo.cell_y(85.1, 0, 4), geo.cell_y(0, 0, 4), geo.cell_y(-90, 0, 4)), (0, 2, 3))
+        self.assertEqual(geo.cell_x(26.102, 10, 4), 2344)
+
+    def test_parse_bbox(self):
+        self.assertEqual(geo.parse_bbox('44', '26', '45', '27'), (44.0, 26.0, 45.0, 27.0))
+        for bbox in (('45', '26', '44', '27'), ('44', '26', '91', '27'), ('44', '-181', '45', '27'), ('a', 0, 1, 1),
+                     (None, 0, 1, 1)):
+            with self.assertRaises(ValueError):
+                geo.parse_bbox(*bbox)
+
+    def test_long_ranges(self):
+        self.assertEqual(geo.long_ranges(26, 27), [(26, 27)])
+        self.assertEqual(geo.long_ranges(170, -170), [(170, 180), (-180, -170)])
+
+
+class PickupPointClusterTests(GrocerEatsTestCase):
+
+    def clusters(self, bbox, zoom):
+        response = self.customer_client.get(f'/pickup-points/clusters/?bbox={bbox}&zoom={zoom}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def cells(self):
+        return set(PickupPointCluster.objects.values_list('zoom', 'cell_x', 'cell_y', 'count', 'lat_sum', 'long_sum'))
+
+    def test_clusters_follow_the_pickup_points(self):
+        obor = PickupPoint.objects.create(lat=Decimal('44.450'), long=Decimal('26.126'), name='Obor', address='Obor 1')
+        PickupPoint.objects.create(lat=Decimal('46.770'), long=Decimal('23.590'), name='Cluj', address='Cluj 1')
+
+        # Far out, Bucharest's points share a cluster
+        data = self.clusters('20,40,30,48', 6)
+        self.assertEqual(data['zoom'], 6)
+        self.assertEqual(sorted((cluster['count'], cluster['lat'], cluster['long']) for cluster in data['clusters']),
+                         [(1, '46.770000', '23.590000'), (2, '44.442500', '26.114000')])
+        # Up close, each point is a cluster of its own, zooms past MAX_ZOOM use MAX_ZOOM
+        data = self.clusters('26,44,27,45', 30)
+        self.assertEqual(data['zoom'], clustering.MAX_ZOOM)
+        self.assertEqual(sorted(cluster['count'] for cluster in data['clusters']), [1, 1])
+
+        obor.delete()
+        self.assertEqual([cluster['count'] for cluster in self.clusters('26,44,27,45', 6)['clusters']], [1])
+        self.assertFalse(PickupPointCluster.objects.filter(count__lte=0).exists())
+
+        incremental = self.cells()
+        self.assertEqual(clustering.rebuild(), len(incremental))
+        self.assertEqual(self.cells(), incremental)
+
+    def test_moved_points_change_cells(self):
+        obor = PickupPoint.objects.create(lat=Decimal('44.450'), long=Decimal('26.126'), name='Obor', address='Obor 1')
+
+        # Moved from Bucharest to Cluj, read from the database like the admin does
+        obor = PickupPoint.objects.get(id=obor.id)
+        obor.lat, obor.long = Decimal('46.770'), Decimal('23.590')
+        obor.save()
+        data = self.clusters('20,40,30,48', 6)
+        self.assertEqual(sorted((cluster['count'], cluster['lat']) for cluster in data['clusters']),
+                         [(1, '44.435000'), (1, '46.770000')])
+        incremental = self.cells()
+        clustering.rebuild()
+        self.assertEqual(self.cells(), incremental)
+
+        # Renames keep the cells, saves of an instance not read from the database rebuild them
+        obor.name = 'Piata Mihai Viteazu'
+        obor.save(update_fields=['name'])
+        self.assertEqual(self.cells(), incremental)
+        PickupPoint(id=obor.id, lat=Decimal('44.450'), long=Decimal('26.126'), name='Obor', address='Obor 1',
+                    region=obor.region).save()
+        self.assertEqual([cluster['count'] for cluster in self.clusters('20,40,30,48', 6)['clusters']], [2])
+
+    def test_invalid_parameters(self):
+        for query in ('bbox=26,44,27', 'bbox=26,44,27,45&zoom=x', 'bbox=26,45,27,44'):
+            self.assertEqual(self.customer_client.get(f'/pickup-points/clusters/?{query}').status_code, 400)
+
+
+class ShopsInBboxTests(GrocerEatsTestCase):
+
+    def shop_at(self, name, lat, long):
+        seller = self.create_user(name.lower(), 'seller')
+        point = PickupPoint.objects.create(lat=Decimal(lat), long=Decimal(long), name=name, address=name)
+        return Shop.objects.create(name=name, pickup_point=point, seller=seller)
+
+    def shops(self, min_lat, min_long, max_lat, max_long):
+        response = self.customer_client.get(
+            f'/shops/in-bbox/?min_lat={min_lat}&min_long={min_long}&max_lat={max_lat}&max_long={max_long}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_shops_of_the_viewport(self):
+        self.shop_at('Cluj', '46.770', '23.590')
+        self.assertEqual(self.shops(44, 26, 45, 27), [{
+            'id': self.shop.id, 'name': 'Green Grocer', 'lat': '44.435000', 'long': '26.102000', 'rating': None,
+        }])
+        self.assertEqual({shop['name'] for shop in self.shops(40, 20, 48, 30)}, {'Green Grocer', 'Cluj'})
+
+    def test_viewport_across_the_antimeridian(self):
+        suva = self.shop_at('Suva', '-18.141', '178.441')
+        apia = self.shop_at('Apia', '-13.833', '-171.761')
+        self.assertEqual({shop['id'] for shop in self.shops(-20, 170, -10, -170)}, {suva.id, apia.id})
+        self.assertEqual({shop['id'] for shop in self.shops(-20, 175, -10, 180)}, {suva.id})
+
+    def test_invalid_viewport(self):
+        response = self.customer_client.get('/shops/in-bbox/?min_lat=45&min_long=26&max_lat=44&max_long=27')
+        self.assertEqual(response.status_code, 400)
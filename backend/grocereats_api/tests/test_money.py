@@ -0,0 +1,101 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from grocereats_api import money
+from grocereats_api.models import Order, OrderItem, Shop, Stock, StockMovement
+from .base import GrocerEatsTestCase
+
+
+class MoneyTests(SimpleTestCase):
+
+    def test_cents(self):
+        self.assertEqual(money.to_cents('1.99'), 199)
+        self.assertEqual(money.to_cents(Decimal('0.125')), 13)
+        self.assertEqual(money.to_cents(3), 300)
+        self.assertEqual(money.from_cents(1999), Decimal('19.99'))
+
+    def test_line_totals_round_half_up(self):
+        self.assertEqual(money.line_total(Decimal('1.99'), Decimal('2')), 398)
+        self.assertEqual(money.line_total(Decimal('2.50'), Decimal('1.25')), 313)  # 3.125
+        self.assertEqual(money.line_total(Decimal('0.33'), Decimal('0.5')), 17)  # 0.165
+        self.assertEqual(money.line_total(Decimal('0.33'), Decimal('-0.5')), -17)
+        self.assertEqual(money.order_total([(Decimal('0.33'), Decimal('0.5'))] * 3), 51)
+
+    def test_parse_quantity(self):
+        self.assertEqual(money.parse_quantity('1.255'), Decimal('1.26'))
+        self.assertEqual(money.parse_quantity(2), Decimal('2.00'))
+        for invalid in ('0', '-1', 'abc', 'NaN', 'Infinity', None):
+            with self.assertRaises(ValueError):
+                money.parse_quantity(invalid)
+
+
+class OrderTotalTests(GrocerEatsTestCase):
+
+    def test_cart_totals_are_exact(self):
+        for quantity in ('1.5', '0.25', '1'):
+            self.customer_client.post('/orders/add-item/', {
+                'shop_id': self.shop.id, 'stock_id': self.carrot.id, 'quantity': quantity,
+            }, format='json')
+        order = Order.objects.get(buyer=self.customer)
+        self.assertEqual(order.total_price, Decimal('5.47'))  # 2.75 x 1.99
+
+        item = order.items.get()
+        response = self.customer_client.patch(f'/orders/item/edit/{item.id}/', {'quantity': '0.5'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('1.00'))  # 0.995 rounded
+
+        self.customer_client.delete(f'/orders/item/delete/{item.id}/')
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('0'))
+        self.assertEqual(Stock.objects.get(id=self.carrot.id).quantity, Decimal('50'))
+
+    def test_check_order_totals(self):
+        order = Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('9'), status='completed')
+        order.items.create(stock=self.carrot, quantity=Decimal('2'), price_at_purchase=Decimal('1.99'))
+
+        call_command('check_order_totals', '--fix', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('3.98'))
+
+
+class PlaceOrderTests(GrocerEatsTestCase):
+
+    def place(self, items, shop=None):
+        return self.customer_client.post('/orders/new/', {
+            'shop': (shop or self.shop).id,
+            'items': [{'stock_id': stock.id, 'quantity': quantity} for stock, quantity in items],
+        }, format='json')
+
+    def test_place_order(self):
+        response = self.place([(self.apple, '2'), (self.carrot, '1.5'), (self.apple, '1')])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['total_price'], '10.49')
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual([item['stock']['name'] for item in response.data['items']], ['Apple', 'Carrot', 'Apple'])
+
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(order.buyer, self.customer)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertEqual(order.items.filter(stock=self.carrot).get().price_at_purchase, Decimal('1.99'))
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('97'))
+        self.assertEqual(Stock.objects.get(id=self.carrot.id).quantity, Decimal('48.5'))
+        self.assertEqual(StockMovement.objects.filter(order=order).count(), 3)
+
+    def test_not_enough_stock_changes_nothing(self):
+        response = self.place([(self.apple, '60'), (self.apple, '60')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('100'))
+
+    def test_invalid_orders(self):
+        other_seller = self.create_user('baker', 'seller')
+        bakery = Shop.objects.create(name='Bakery', pickup_point=self.pickup_point, seller=other_seller)
+
+        self.assertEqual(self.place([(self.apple, '1')], shop=bakery).status_code, 400)
+        self.assertEqual(self.place([(self.apple, '0')]).status_code, 400)
+        self.assertEqual(self.place([]).status_code, 400)
+        self.assertEqual(self.seller_client.post('/orders/new/', {}, format='json').status_code, 403)
+        self.assertFalse(Order.objects.exists())
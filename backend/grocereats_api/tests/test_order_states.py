@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from grocereats_api import order_states
+from grocereats_api.models import Order, Shop, ShopCard, Stock, StockMovement
+from .base import GrocerEatsTestCase
+
+
+class OrderStateTests(GrocerEatsTestCase):
+
+    def order(self, order_status, shop=None, stock=None):
+        order = Order.objects.create(buyer=self.customer, shop=shop or self.shop, total_price=Decimal('5'),
+                                     status=order_status)
+        order.items.create(stock=stock or self.apple, quantity=Decimal('2'), price_at_purchase=Decimal('2.50'))
+        return order
+
+    def statuses(self, *orders):
+        return [Order.objects.get(id=order.id).status for order in orders]
+
+    def test_allowed_transitions(self):
+        active, pending, completed = self.order('active'), self.order('pending'), self.order('completed')
+        completed_orders = ShopCard.objects.get(shop=self.shop).completed_orders
+        orders = Order.objects.filter(id__in=[active.id, pending.id, completed.id])
+
+        self.assertEqual(order_states.apply(orders, 'pending'), 1)
+        self.assertEqual(self.statuses(active, pending, completed), ['pending', 'pending', 'completed'])
+        self.assertEqual(order_states.apply(orders, 'completed'), 2)
+        self.assertEqual(order_states.apply(orders, 'cancelled'), 0)
+        self.assertEqual(order_states.apply(orders, 'pending'), 0)
+        self.assertEqual(ShopCard.objects.get(shop=self.shop).completed_orders, completed_orders + 2)
+
+    def test_cancelling_restores_the_stock(self):
+        orders = [self.order('pending'), self.order('pending'), self.order('active', stock=self.carrot)]
+        self.assertEqual(order_states.apply(Order.objects.filter(id__in=[order.id for order in orders]), 'cancelled'), 3)
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('104'))
+        self.assertEqual(Stock.objects.get(id=self.carrot.id).quantity, Decimal('52'))
+        self.assertEqual(StockMovement.objects.filter(reason='order_restore').count(), 3)
+
+    def test_seller_bulk_transition(self):
+        baker = self.create_user('baker', 'seller')
+        bakery = Shop.objects.create(name='Bakery', pickup_point=self.pickup_point, seller=baker)
+        bread = Stock.objects.create(name='Bread', unit='pcs', price_per_unit=Decimal('3'), subcategory=self.apples,
+                                     shop=bakery, quantity=Decimal('10'))
+        pending, active, other_shop = self.order('pending'), self.order('active'), self.order('pending', bakery, bread)
+
+        response = self.seller_client.post('/orders/bulk-transition/', {
+            'order_ids': [pending.id, active.id, other_shop.id], 'status': 'completed',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['requested'], response.data['updated']), (3, 1))
+        self.assertEqual(self.statuses(pending, active, other_shop), ['completed', 'active', 'pending'])
+
+    def test_customer_bulk_transition(self):
+        first, second = self.order('active'), self.order('pending')
+        response = self.customer_client.post('/orders/bulk-transition/', {
+            'order_ids': [first.id, second.id], 'status': 'pending',
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        response = self.customer_client.post('/orders/bulk-transition/', {
+            'order_ids': [first.id, second.id], 'status': 'cancelled',
+        }, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        # Customers cannot complete their orders, sellers cannot submit them
+        response = self.customer_client.post('/orders/bulk-transition/', {
+            'order_ids': [first.id], 'status': 'completed',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.seller_client.post('/orders/bulk-transition/', {
+            'order_ids': [first.id], 'status': 'pending',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_batches(self):
+        for order_ids in ([], 'all', list(range(order_states.MAX_BATCH_SIZE + 1)), ['x']):
+            response = self.seller_client.post('/orders/bulk-transition/', {
+                'order_ids': order_ids, 'status': 'completed',
+            }, format='json')
+            self.assertEqual(response.status_code, 400, order_ids)
+
+    def test_order_detail_transitions(self):
+        order = self.order('active')
+        response = self.seller_client.patch(f'/orders/{order.id}/', {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'A active order cannot be completed.')
+
+        # Customers only cancel pending orders
+        self.assertEqual(self.customer_client.patch(f'/orders/{order.id}/', {}, format='json').status_code, 403)
+        Order.objects.filter(id=order.id).update(status='pending')
+        response = self.customer_client.patch(f'/orders/{order.id}/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'cancelled')
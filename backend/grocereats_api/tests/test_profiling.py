@@ -0,0 +1,74 @@
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from grocereats_api import profiling
+from .base import GrocerEatsTestCase
+
+
+class ProfilingTests(GrocerEatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(PROFILING=dict(settings.PROFILING, DIR=directory.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = self.create_user('admin', 'customer', is_staff=True)
+        self.admin_client = self.client_for(self.admin)
+
+    def test_staff_profile_with_the_query_parameter(self):
+        response = self.admin_client.get(f'/stocks/{self.shop.id}/?profile=1')
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+
+        response = self.admin_client.get('/profiles/')
+        self.assertEqual([profile['id'] for profile in response.data], [profile_id])
+        self.assertNotIn('sql', response.data[0])
+
+        response = self.admin_client.get(f'/profiles/{profile_id}/')
+        self.assertEqual(response.data['path'], f'/stocks/{self.shop.id}/?profile=1')
+        self.assertEqual(response.data['status'], 200)
+        self.assertEqual(response.data['query_count'], len(response.data['sql']))
+        self.assertGreater(response.data['query_count'], 0)
+
+        response = self.admin_client.get(f'/profiles/{profile_id}/?folded=1')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{profile_id}.folded"')
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.admin_client.get('/categories/'))
+        self.assertNotIn('X-Profile-Id', self.customer_client.get('/categories/?profile=1'))
+        self.assertNotIn('X-Profile-Id', self.customer_client.get('/categories/', HTTP_X_PROFILE='forged'))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_tokens(self):
+        anyone = profiling.mint_token()
+        self.assertIn('X-Profile-Id', self.customer_client.get('/categories/', HTTP_X_PROFILE=anyone))
+
+        # A token of one user does not profile the requests of another
+        customer_only = profiling.mint_token(self.customer.id)
+        self.assertIn('X-Profile-Id', self.customer_client.get('/categories/', HTTP_X_PROFILE=customer_only))
+        self.assertNotIn('X-Profile-Id', self.seller_client.get('/categories/', HTTP_X_PROFILE=customer_only))
+
+        with self.settings(PROFILING=dict(settings.PROFILING, TOKEN_MAX_AGE=-1)):
+            self.assertNotIn('X-Profile-Id', self.customer_client.get('/categories/', HTTP_X_PROFILE=anyone))
+
+    def test_mint_profiling_token_command(self):
+        stdout = StringIO()
+        call_command('mint_profiling_token', '--user', 'customer', stdout=stdout, stderr=StringIO())
+        self.assertEqual(profiling._token_scope(stdout.getvalue().strip()), {'user': self.customer.id})
+
+    def test_only_the_newest_profiles_are_kept(self):
+        with self.settings(PROFILING=dict(settings.PROFILING, KEEP=2)):
+            for _ in range(3):
+                self.admin_client.get('/categories/?profile=1')
+            self.assertEqual(len(profiling.list_profiles()), 2)
+
+    def test_missing_profiles(self):
+        self.assertEqual(self.admin_client.get('/profiles/missing/').status_code, 404)
+        self.assertEqual(self.admin_client.get('/profiles/00000000-0000-0000-0000-000000000000/').status_code, 404)
+        self.assertEqual(self.customer_client.get('/profiles/').status_code, 403)
@@ -0,0 +1,262 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import get_resolver, resolve
+from rest_framework.test import APIClient
+from grocereats_api import recommendations, regions
+from grocereats_api.models import ArchivedOrder, Order, OrderItem, PickupPoint, Shop, Stock
+from grocereats_api.query_budget import QueryBudgetExceeded, query_budget
+from .base import GrocerEatsTestCase
+from .test_regions import TWO_REGIONS
+
+
+class QueryBudgetTests(TestCase):
+
+    def test_raise_mode(self):
+        with query_budget(1, mode='raise'):
+            connection.cursor().execute('SELECT 1')
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'Block ran 2 queries, its budget is 1.'):
+            with query_budget(1, mode='raise'):
+                for _ in range(2):
+                    connection.cursor().execute('SELECT 1')
+
+    def test_savepoints_are_not_counted(self):
+        with query_budget(1, mode='raise') as budget:
+            with transaction.atomic():
+                connection.cursor().execute('SELECT 1')
+        self.assertEqual(budget.queries, ['SELECT 1'])
+
+    def test_log_and_off_modes(self):
+        with self.assertLogs('grocereats_api.query_budget', logging.WARNING) as logs:
+            with query_budget(0, label='Listing', mode='log'):
+                connection.cursor().execute('SELECT 1')
+        self.assertIn('Listing ran 1 queries, its budget is 0.', logs.output[0])
+        with query_budget(0, mode='off'):
+            connection.cursor().execute('SELECT 1')
+
+
+    def test_streamed_bodies_are_counted(self):
+        def rows():
+            for _ in range(2):
+                connection.cursor().execute('SELECT 1')
+                yield b'row'
+
+        budget = query_budget(1, mode='raise')
+        chunks = budget.stream(rows())
+        self.assertEqual(next(chunks), b'row')
+        with self.assertRaises(QueryBudgetExceeded):
+            list(chunks)
+        self.assertEqual(len(budget.queries), 2)
+
+
+@override_settings(REGIONS=TWO_REGIONS)
+class RegionalQueryBudgetTests(TransactionTestCase):
+    databases = {'default', 'cluj'}
+
+    def test_queries_of_every_database_and_worker_thread_are_counted(self):
+        def select():
+            connections[regions.current_database()].cursor().execute('SELECT 1')
+            return regions.current_database()
+
+        with query_budget(10, mode='raise') as budget:
+            connections['cluj'].cursor().execute('SELECT 1')
+            # Not in a transaction, each database is read by a thread of its own
+            self.assertEqual(regions.scatter_gather(select), ['default', 'cluj'])
+        self.assertEqual(budget.queries, ['SELECT 1'] * 3)
+
+
+class RouteBudgetCoverageTests(SimpleTestCase):
+
+    def test_every_route_has_a_budget(self):
+        url_names = {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+        self.assertEqual(url_names - set(settings.QUERY_BUDGET['ROUTES']), set())
+
+
+@override_settings(REGIONS=TWO_REGIONS)
+class MeasuredRouteBudgetTests(GrocerEatsTestCase):
+    """
+    Runs the heaviest path of every route and counts its queries, on every database and until
+    streamed bodies are over, the way QueryBudgetMiddleware does. The budgets of
+    settings.QUERY_BUDGET['ROUTES'] were set from these counts, they must not be below them.
+    With several regions the views first look up the region of the shop, order or stock they
+    address, the heaviest path is the one to a row of the customer's carts in another region.
+    """
+    databases = {'default', 'cluj'}
+
+    def setUp(self):
+        super().setUp()
+        self.measured = {}
+        self.admin = self.create_user('admin', 'customer', is_staff=True)
+        self.admin_client = self.client_for(self.admin)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cluj_point = PickupPoint.objects.create(lat=Decimal('46.770'), long=Decimal('23.590'),
+                                                name='Piata Mihai Viteazu', address='Cluj-Napoca')
+        cls.cluj_seller = cls.create_user('cluj_seller', 'seller')
+        cls.cluj_shop = Shop.objects.create(name='Cluj Dairy', pickup_point=cluj_point, seller=cls.cluj_seller)
+        with regions.use_region('cluj'):
+            # Ids apart from the default database's, see RegionTests
+            cls.cheese = Stock.objects.create(id=1000, name='Cheese', unit='kg', price_per_unit=Decimal('30'),
+                                              subcategory=cls.apples, shop=cls.cluj_shop, quantity=Decimal('10'))
+            cls.milk = Stock.objects.create(id=1001, name='Milk', unit='l', price_per_unit=Decimal('6'),
+                                            subcategory=cls.apples, shop=cls.cluj_shop, quantity=Decimal('10'))
+            order = Order.objects.create(id=1000, buyer=cls.cluj_seller, shop=cls.cluj_shop, total_price=0,
+                                         status='completed')
+            OrderItem.objects.create(id=1000, order=order, stock=cls.cheese, quantity=1, price_at_purchase=0)
+            OrderItem.objects.create(id=1001, order=order, stock=cls.milk, quantity=1, price_at_purchase=0)
+            recommendations.rebuild()
+
+    def request(self, client, method, path, data=None, status=200, **extra):
+        url_name = resolve(path.split('?')[0]).url_name
+        with query_budget(10 ** 6, mode='raise') as counter:
+            response = getattr(client, method)(path, data, format='json', **extra)
+            if response.streaming:
+                # The body is read from the database while it is streamed
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status, getattr(response, 'data', None))
+        self.measured[url_name] = max(self.measured.get(url_name, 0), len(counter.queries))
+        return response
+
+    def add_item(self, stock, quantity='1'):
+        return self.request(self.customer_client, 'post', '/orders/add-item/', {
+            'shop_id': self.shop.id, 'stock_id': stock.id, 'quantity': quantity,
+        }).data
+
+    def pending_order(self):
+        order = Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('6.49'), status='pending')
+        order.items.create(stock=self.apple, quantity=Decimal('1'), price_at_purchase=Decimal('2.50'))
+        order.items.create(stock=self.carrot, quantity=Decimal('2'), price_at_purchase=Decimal('1.99'))
+        return order
+
+    def test_routes_stay_within_their_budget(self):
+        anonymous = APIClient()
+        self.request(anonymous, 'get', '/')
+        self.request(anonymous, 'post', '/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'secret', 'phone': '0712345678',
+            'role': 'customer',
+        }, status=201)
+        refresh = self.request(anonymous, 'post', '/token/', {'username': 'customer', 'password': 'secret'}).data['refresh']
+        refresh = self.request(anonymous, 'post', '/token/refresh/', {'refresh': refresh}).data['refresh']
+        self.request(self.customer_client, 'post', '/logout/', {'refresh': refresh})
+
+        # Carts: a new cart, then an item already in it
+        self.add_item(self.apple)
+        added = self.add_item(self.carrot)
+        self.add_item(self.carrot)
+        self.request(self.customer_client, 'patch', f'/orders/item/edit/{added["order_item_id"]}/', {'quantity': '3'})
+        self.request(self.customer_client, 'get', '/orders/active/')
+        self.request(self.customer_client, 'get', f'/orders/active/?shop_id={self.shop.id}')
+        self.request(self.customer_client, 'get', '/orders/carts/')
+        self.request(self.customer_client, 'delete', f'/orders/item/delete/{added["order_item_id"]}/')
+        self.request(self.customer_client, 'post', '/orders/checkout/', {})
+
+        self.request(self.customer_client, 'post', '/orders/new/', {
+            'shop': self.shop.id,
+            'items': [{'stock_id': self.apple.id, 'quantity': '2'}, {'stock_id': self.carrot.id, 'quantity': '1'}],
+        }, status=201)
+
+        # Every transition, of orders of two items to restock or to count as bought together
+        order = self.pending_order()
+        self.request(self.customer_client, 'get', f'/orders/{order.id}/')
+        self.request(self.customer_client, 'patch', f'/orders/{order.id}/', {})
+        order = self.pending_order()
+        self.request(self.seller_client, 'patch', f'/orders/{order.id}/', {'status': 'completed'})
+        cart = self.pending_order()
+        cart.status = 'active'
+        cart.save()
+        self.request(self.customer_client, 'patch', f'/orders/{cart.id}/submit/')
+        self.request(self.seller_client, 'patch', f'/orders/{cart.id}/confirm/')
+        self.request(self.customer_client, 'patch', f'/orders/{self.pending_order().id}/cancel/')
+        order_ids = [self.pending_order().id, self.pending_order().id]
+        self.request(self.seller_client, 'post', '/orders/bulk-transition/',
+                     {'order_ids': order_ids, 'status': 'completed'})
+        order_ids = [self.pending_order().id, self.pending_order().id]
+        self.request(self.customer_client, 'post', '/orders/bulk-transition/',
+                     {'order_ids': order_ids, 'status': 'cancelled'})
+
+        ArchivedOrder.objects.create(id=10 ** 6, buyer=self.customer, shop=self.shop, total_price=Decimal('1'),
+                                     status='completed', timestamp=order.timestamp)
+        self.request(self.customer_client, 'get', f'/orders/{10 ** 6}/')
+        self.request(self.customer_client, 'get', '/orders/')
+        self.request(self.seller_client, 'get', '/orders/')
+        self.request(self.seller_client, 'get', '/orders/export/?format=csv')
+        self.request(self.seller_client, 'get', '/shop/analytics/')
+        # Rating a completed order fails on the missing rating fields of Order, the refusal of a pending one is measured
+        order = self.pending_order()
+        self.request(self.customer_client, 'post', '/rate/', {'order_id': order.id, 'rating': 4}, status=400)
+
+        # Carts and orders at a shop of another region, found after a miss in the customer's
+        def add_cluj_item(stock):
+            return self.request(self.customer_client, 'post', '/orders/add-item/', {
+                'shop_id': self.cluj_shop.id, 'stock_id': stock.id, 'quantity': '1',
+            }).data
+
+        add_cluj_item(self.cheese)
+        added = add_cluj_item(self.milk)
+        self.request(self.customer_client, 'patch', f'/orders/item/edit/{added["order_item_id"]}/', {'quantity': '2'})
+        self.request(self.customer_client, 'get', '/orders/carts/')
+        self.request(self.customer_client, 'get', f'/orders/active/?shop_id={self.cluj_shop.id}')
+        self.request(self.customer_client, 'delete', f'/orders/item/delete/{added["order_item_id"]}/')
+        self.request(self.customer_client, 'get', f'/orders/{added["order_id"]}/')
+        self.request(self.customer_client, 'patch', f'/orders/{added["order_id"]}/submit/')
+        self.request(self.customer_client, 'patch', f'/orders/{added["order_id"]}/cancel/')
+        add_cluj_item(self.cheese)
+        add_cluj_item(self.milk)
+        cluj_order = self.request(self.customer_client, 'post', '/orders/checkout/', {}).data['order_ids'][0]
+        # Carts in both regions
+        add_cluj_item(self.cheese)
+        self.add_item(self.apple)
+        self.add_item(self.carrot)
+        self.request(self.customer_client, 'get', '/orders/carts/')
+        order_ids = self.request(self.customer_client, 'post', '/orders/checkout/', {}).data['order_ids']
+        self.request(self.customer_client, 'post', '/orders/bulk-transition/',
+                     {'order_ids': order_ids, 'status': 'cancelled'})
+        self.request(self.customer_client, 'get', '/orders/')
+        self.request(self.customer_client, 'get', f'/stocks/{self.cheese.id}/related/')
+        self.request(self.client_for(self.cluj_seller), 'patch', f'/orders/{cluj_order}/confirm/')
+
+        # Stocks
+        self.request(self.customer_client, 'get', f'/stocks/{self.shop.id}/?in_stock=true&sort=price')
+        self.request(self.seller_client, 'get', '/stocks/forecast/')
+        self.request(self.customer_client, 'get', f'/stocks/{self.apple.id}/related/')
+        self.request(self.customer_client, 'get', '/stocks/999/related/', status=404)
+        stock = self.request(self.seller_client, 'post', '/stocks/add/', {
+            'name': 'Pear', 'unit': 'kg', 'price_per_unit': '3.00', 'quantity': '10', 'subcategory': self.apples.id,
+        }, status=201).data
+        self.request(self.seller_client, 'patch', f'/stocks/edit/{stock["id"]}/', {'subcategory': self.carrots.id})
+        self.request(self.seller_client, 'delete', f'/stocks/remove/{self.apple.id}/')
+
+        # Shops, categories and pickup points
+        self.request(self.customer_client, 'get', '/shops/')
+        baker = self.create_user('baker', 'seller')
+        self.request(self.client_for(baker), 'post', '/shops/', {'name': 'Bakery', 'pickup_point': self.pickup_point.id},
+                     status=201)
+        self.request(self.customer_client, 'get', '/shops/cards/')
+        self.request(self.customer_client, 'get', '/shops/in-bbox/?min_lat=44&min_long=26&max_lat=45&max_long=27')
+        self.request(self.seller_client, 'get', '/shop/manage/')
+        self.request(self.seller_client, 'patch', '/shop/manage/', {'name': 'Greener Grocer'})
+        self.request(self.customer_client, 'get', '/subcategories/')
+        self.request(self.customer_client, 'get', '/categories/')
+        self.request(self.customer_client, 'get', '/catalog/bundle/')
+        self.request(self.seller_client, 'post', '/pickup-points/create/', {
+            'name': 'Obor', 'lat': '44.450', 'long': '26.125', 'address': 'Obor 1',
+        }, status=201)
+        self.request(self.customer_client, 'get', '/pickup-points/')
+        self.request(self.customer_client, 'get', '/pickup-points/clusters/?bbox=26,44,27,45&zoom=12')
+
+        # Profiles
+        self.request(self.customer_client, 'get', '/profile/')
+        self.request(self.customer_client, 'patch', '/profile/', {'first_name': 'Ana'})
+        self.request(self.admin_client, 'get', '/profiles/')
+        self.request(self.admin_client, 'get', '/profiles/missing/', status=404)
+        self.request(self.admin_client, 'get', '/regions/')
+
+        budgets = settings.QUERY_BUDGET['ROUTES']
+        self.assertEqual(set(self.measured), set(budgets))
+        over = {name: (queries, budgets[name]) for name, queries in self.measured.items() if queries > budgets[name]}
+        self.assertEqual(over, {})
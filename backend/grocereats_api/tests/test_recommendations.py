@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+from grocereats_api import order_states, recommendations
+from grocereats_api.models import Order, Stock, StockCoOccurrence
+from .base import GrocerEatsTestCase
+
+
+class RecommendationTests(GrocerEatsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pear = Stock.objects.create(name='Pear', unit='kg', price_per_unit=Decimal('3'), subcategory=cls.apples,
+                                        shop=cls.shop, quantity=Decimal('10'))
+
+    def order(self, stocks, status='completed'):
+        order = Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('1'), status=status)
+        for stock in stocks:
+            order.items.create(stock=stock, quantity=Decimal('1'), price_at_purchase=Decimal('1'))
+        return order
+
+    def pairs(self):
+        return {(stock_id, other_id): count
+                for stock_id, other_id, count in StockCoOccurrence.objects.values_list('stock_id', 'other_id', 'count')}
+
+    def test_rebuild_counts_completed_orders(self):
+        self.order([self.apple, self.carrot])
+        self.order([self.apple, self.carrot, self.pear])
+        self.order([self.apple, self.pear], status='cancelled')
+
+        self.assertEqual(recommendations.rebuild(), 6)
+        pairs = self.pairs()
+        self.assertEqual(pairs[self.apple.id, self.carrot.id], 2)
+        self.assertEqual(pairs[self.carrot.id, self.apple.id], 2)
+        self.assertEqual(pairs[self.apple.id, self.pear.id], 1)
+
+    def test_completing_orders_updates_the_index(self):
+        self.order([self.apple, self.carrot])
+        recommendations.rebuild()
+        # Inserted by a concurrent completion, it is incremented rather than inserted again
+        StockCoOccurrence.objects.create(stock=self.pear, other=self.apple, count=4)
+
+        orders = [self.order([self.apple, self.carrot, self.pear], status='pending') for _ in range(2)]
+        order_states.apply(Order.objects.filter(id__in=[order.id for order in orders]), 'completed')
+
+        pairs = self.pairs()
+        self.assertEqual(pairs[self.apple.id, self.carrot.id], 3)
+        self.assertEqual(pairs[self.apple.id, self.pear.id], 2)
+        self.assertEqual(pairs[self.pear.id, self.apple.id], 6)
+        self.assertEqual(len(pairs), 6)
+
+    def test_related_stocks_endpoint(self):
+        self.order([self.apple, self.carrot])
+        self.order([self.apple, self.carrot])
+        self.order([self.apple, self.pear])
+        recommendations.rebuild()
+
+        response = self.customer_client.get(f'/stocks/{self.apple.id}/related/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(stock['id'], stock['bought_together']) for stock in response.data],
+                         [(self.carrot.id, 2), (self.pear.id, 1)])
+
+        response = self.customer_client.get(f'/stocks/{self.apple.id}/related/?limit=1')
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(self.customer_client.get('/stocks/999/related/').status_code, 404)
+        self.assertEqual(self.customer_client.get(f'/stocks/{self.apple.id}/related/?limit=x').status_code, 400)
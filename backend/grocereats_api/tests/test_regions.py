@@ -0,0 +1,201 @@
+import json
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from grocereats_api import recommendations, regions
+from grocereats_api.models import User, PickupPoint, PickupPointCluster, Shop, Stock, StockCoOccurrence, Order, \
+    OrderItem
+from .base import GrocerEatsTestCase
+
+CLUJ_BBOX = (46.6, 23.4, 46.9, 23.8)
+TWO_REGIONS = {
+    'default': {'DATABASE': 'default'},
+    'cluj': {'DATABASE': 'cluj', 'BBOX': CLUJ_BBOX},
+}
+
+
+@override_settings(REGIONS=TWO_REGIONS)
+class RegionTests(GrocerEatsTestCase):
+    """
+    The customer lives in the default region and shops at a Cluj shop as well, whose stocks and
+    orders are in the cluj database.
+    """
+    databases = {'default', 'cluj'}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cluj_point = PickupPoint.objects.create(lat=Decimal('46.770'), long=Decimal('23.590'),
+                                                    name='Piata Mihai Viteazu', address='Cluj-Napoca')
+        cls.cluj_seller = cls.create_user('cluj_seller', 'seller')
+        cls.cluj_shop = Shop.objects.create(name='Cluj Dairy', pickup_point=cls.cluj_point, seller=cls.cluj_seller)
+
+        with regions.use_region('cluj'):
+            # SQLite cannot interleave the id sequences like prepare_regions does on PostgreSQL,
+            # the ids of the cluj database start at 1000 instead so that they differ from the default ones
+            cls.cheese = Stock.objects.create(id=1000, name='Cheese', unit='kg', price_per_unit=Decimal('30'),
+                                              subcategory=cls.apples, shop=cls.cluj_shop, quantity=Decimal('10'))
+            placeholder = Order.objects.create(id=1000, buyer=cls.cluj_seller, shop=cls.cluj_shop,
+                                               total_price=0, status='cancelled')
+            OrderItem.objects.create(id=1000, order=placeholder, stock=cls.cheese, quantity=1, price_at_purchase=0)
+
+    def test_only_mirrored_models_have_the_mirror_receivers(self):
+        # Django deletes the rows of models without post_delete receivers without loading them
+        for model in (Order, StockCoOccurrence, PickupPointCluster):
+            self.assertFalse(post_delete.has_listeners(model), model)
+
+        Shop.objects.filter(id=self.cluj_shop.id).update(name='Cluj Dairy Farm')
+        self.cluj_shop.refresh_from_db()
+        self.cluj_shop.save()
+        self.assertEqual(Shop.objects.using('cluj').get(id=self.cluj_shop.id).name, 'Cluj Dairy Farm')
+
+    def add_item(self, shop, stock, quantity):
+        response = self.customer_client.post('/orders/add-item/', {
+            'shop_id': shop.id, 'stock_id': stock.id, 'quantity': quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_regions_of_the_rows(self):
+        self.assertEqual(self.cluj_point.region, 'cluj')
+        self.assertEqual(self.cluj_shop.region, 'cluj')
+        self.assertEqual(User.objects.get(id=self.cluj_seller.id).region, 'cluj')
+        self.assertEqual(self.customer.region, 'default')
+        # Shops are mirrored to every database, stocks are only in their region's
+        self.assertTrue(Shop.objects.using('cluj').filter(id=self.shop.id).exists())
+        self.assertFalse(Stock.objects.using('default').filter(id=self.cheese.id).exists())
+
+    def test_cart_at_a_shop_of_another_region(self):
+        added = self.add_item(self.cluj_shop, self.cheese, '2')
+        order_id = added['order_id']
+        self.assertTrue(Order.objects.using('cluj').filter(id=order_id, status='active').exists())
+        self.assertFalse(Order.objects.using('default').filter(buyer=self.customer).exists())
+
+        response = self.customer_client.get('/orders/carts/')
+        self.assertEqual([cart['id'] for cart in response.data], [order_id])
+        response = self.customer_client.get('/orders/active/')
+        self.assertEqual(response.data['id'], order_id)
+        response = self.customer_client.get(f'/orders/active/?shop_id={self.cluj_shop.id}')
+        self.assertEqual(response.data['id'], order_id)
+
+        response = self.customer_client.patch(f'/orders/item/edit/{added["order_item_id"]}/', {'quantity': '3'},
+                                              format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Stock.objects.using('cluj').get(id=self.cheese.id).quantity, Decimal('7'))
+
+        response = self.customer_client.post('/orders/checkout/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'message': 'Orders submitted successfully!', 'order_ids': [order_id],
+                                         'total_price': '90.00'})
+
+        response = self.customer_client.get(f'/orders/{order_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'pending')
+
+        response = self.customer_client.patch(f'/orders/{order_id}/cancel/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Stock.objects.using('cluj').get(id=self.cheese.id).quantity, Decimal('10'))
+
+        response = self.customer_client.get('/orders/')
+        self.assertEqual([(order['id'], order['status']) for order in response.data], [(order_id, 'cancelled')])
+
+    def test_carts_in_two_regions(self):
+        cluj_cart = self.add_item(self.cluj_shop, self.cheese, '1')['order_id']
+        added = self.add_item(self.shop, self.apple, '1')
+        default_cart = added['order_id']
+        self.add_item(self.shop, self.carrot, '1')
+
+        response = self.customer_client.get('/orders/carts/')
+        self.assertEqual({cart['id'] for cart in response.data}, {cluj_cart, default_cart})
+
+        response = self.customer_client.delete(f'/orders/item/delete/{added["order_item_id"]}/')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.customer_client.post('/orders/checkout/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['order_ids'], sorted([cluj_cart, default_cart]))
+        self.assertEqual(response.data['total_price'], '31.99')
+
+        response = self.customer_client.post('/orders/bulk-transition/', {
+            'order_ids': [cluj_cart, default_cart], 'status': 'cancelled',
+        }, format='json')
+        self.assertEqual(response.data['updated'], 2)
+
+    def test_submit_and_confirm(self):
+        order_id = self.add_item(self.cluj_shop, self.cheese, '1')['order_id']
+        response = self.customer_client.patch(f'/orders/{order_id}/submit/')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        # The seller's requests go to the region of their shop
+        response = self.client_for(self.cluj_seller).patch(f'/orders/{order_id}/confirm/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Order.objects.using('cluj').get(id=order_id).status, 'completed')
+
+        # Other sellers are not shown it
+        self.assertEqual(self.seller_client.get(f'/orders/{order_id}/').status_code, 403)
+
+    def test_related_stocks_of_another_region(self):
+        with regions.use_region('cluj'):
+            milk = Stock.objects.create(id=1001, name='Milk', unit='l', price_per_unit=Decimal('6'),
+                                        subcategory=self.apples, shop=self.cluj_shop, quantity=Decimal('10'))
+            order = Order.objects.create(id=1001, buyer=self.customer, shop=self.cluj_shop, total_price=0,
+                                         status='completed')
+            OrderItem.objects.create(id=1001, order=order, stock=self.cheese, quantity=1, price_at_purchase=0)
+            OrderItem.objects.create(id=1002, order=order, stock=milk, quantity=1, price_at_purchase=0)
+            recommendations.rebuild()
+
+        response = self.customer_client.get(f'/stocks/{self.cheese.id}/related/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([stock['id'] for stock in response.data], [milk.id])
+        self.assertEqual(self.customer_client.get('/stocks/999/related/').status_code, 404)
+
+    def test_region_summary(self):
+        self.add_item(self.cluj_shop, self.cheese, '1')
+        admin = self.create_user('admin', 'customer', is_staff=True)
+
+        response = self.client_for(admin).get('/regions/')
+        self.assertEqual(response.status_code, 200)
+        summary = {database['database']: database for database in response.data}
+        self.assertEqual(summary['default']['stocks'], 2)
+        self.assertEqual(summary['cluj']['stocks'], 1)
+        self.assertEqual(summary['cluj']['orders'], {'active': 1, 'cancelled': 1})
+
+    def test_export_reads_the_region_of_the_seller(self):
+        # The rows are streamed after the middleware reset the request's region
+        response = self.client_for(self.cluj_seller).get('/orders/export/?format=ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['order_id'] for line in lines], [1000])
+        self.assertEqual(lines[0]['items'][0]['stock'], 'Cheese')
+
+
+@override_settings(REGIONS=TWO_REGIONS)
+class SeedPerfTests(TestCase):
+    databases = {'default', 'cluj'}
+
+    def test_rows_are_seeded_in_the_database_of_their_region(self):
+        # Around Cluj, the pickup points far enough from the center fall outside its bounding box
+        call_command('seed_perf', '--customers', '5', '--shops', '12', '--pickup-points', '30', '--stocks-per-shop', '3',
+                     '--orders', '40', '--center', '46.77,23.59', '--spread-km', '40', stdout=StringIO())
+
+        shops = dict(Shop.objects.values_list('id', 'region'))
+        self.assertEqual(set(shops.values()), {'default', 'cluj'})
+        for shop in Shop.objects.select_related('pickup_point', 'seller'):
+            self.assertEqual(shop.region, regions.region_for(shop.pickup_point.lat, shop.pickup_point.long))
+            self.assertEqual(shop.seller.region, shop.region)
+        # The mirrored rows were copied to the cluj database
+        self.assertEqual(Shop.objects.using('cluj').count(), 12)
+
+        stock_ids = []
+        order_ids = []
+        for database in ('default', 'cluj'):
+            for shop_id in Stock.objects.using(database).values_list('shop_id', flat=True):
+                self.assertEqual(regions.database_for(shops[shop_id]), database)
+            for shop_id in Order.objects.using(database).values_list('shop_id', flat=True):
+                self.assertEqual(regions.database_for(shops[shop_id]), database)
+            stock_ids += Stock.objects.using(database).values_list('id', flat=True)
+            order_ids += Order.objects.using(database).values_list('id', flat=True)
+        self.assertEqual(len(set(stock_ids)), 36)
+        self.assertEqual(len(set(order_ids)), 40)
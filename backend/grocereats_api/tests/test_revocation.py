@@ -0,0 +1,63 @@
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from grocereats_api.models import User
+from grocereats_api.revocation import BloomFilter, RevocationCache
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000)
+        added = [str(uuid.uuid4()) for _ in range(1000)]
+        for item in added:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in added))
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+@override_settings(TOKEN_REVOCATION_SYNC_INTERVAL=1, TOKEN_REVOCATION_REBUILD_INTERVAL=3600)
+class RevocationCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', email='customer@example.com', role='customer')
+
+    def blacklist(self, id=None, blacklisted_at=None):
+        jti = uuid.uuid4().hex
+        token = OutstandingToken.objects.create(user=self.user, jti=jti, token=jti,
+                                                expires_at=timezone.now() + timedelta(days=1))
+        blacklisted = BlacklistedToken.objects.create(id=id, token=token)
+        if blacklisted_at is not None:
+            BlacklistedToken.objects.filter(id=blacklisted.id).update(blacklisted_at=blacklisted_at)
+        return jti
+
+    def test_tokens_blacklisted_by_other_workers_are_synced(self):
+        revoked = self.blacklist(id=100)
+        cache = RevocationCache()
+        with mock.patch('time.monotonic', return_value=1000):
+            self.assertTrue(cache.might_be_revoked(revoked))
+            self.assertFalse(cache.might_be_revoked(uuid.uuid4().hex))
+
+        # Committed after the filter was built, with an id and a timestamp older than the newest row it read
+        late = self.blacklist(id=50, blacklisted_at=timezone.now() - timedelta(seconds=5))
+        with mock.patch('time.monotonic', return_value=1000.5):
+            # Not synced again before the interval is over
+            self.assertFalse(cache.might_be_revoked(late))
+        with mock.patch('time.monotonic', return_value=1002):
+            self.assertTrue(cache.might_be_revoked(late))
+
+    def test_rows_read_twice_count_once(self):
+        self.blacklist()
+        cache = RevocationCache()
+        with mock.patch('time.monotonic', return_value=1000):
+            cache.might_be_revoked('')
+        with mock.patch('time.monotonic', return_value=1002):
+            cache.might_be_revoked('')
+        self.assertEqual(cache.filter.count, 1)
@@ -0,0 +1,52 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase
+from grocereats_api import catalog
+from grocereats_api.models import Order, OrderItem, PickupPoint, PickupPointCluster, Shop, ShopCard, Stock, \
+    StockCoOccurrence, User
+
+SMALL = ['--customers', '20', '--shops', '5', '--pickup-points', '8', '--stocks-per-shop', '4', '--orders', '50',
+         '--batch-size', '16']
+
+
+class SeedPerfTests(TestCase):
+
+    def seed(self, *args):
+        call_command('seed_perf', *SMALL, *args, stdout=StringIO())
+
+    def test_seeds_the_requested_rows(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(role='customer').count(), 20)
+        self.assertEqual(PickupPoint.objects.count(), 8)
+        self.assertEqual(Shop.objects.count(), 5)
+        self.assertEqual(Stock.objects.count(), 20)
+        self.assertEqual(Order.objects.count(), 50)
+        self.assertEqual(ShopCard.objects.count(), 5)
+        # Items belong to the shop of their order
+        self.assertTrue(OrderItem.objects.exists())
+        self.assertFalse(OrderItem.objects.exclude(stock__shop_id=F('order__shop_id')).exists())
+
+        # The read models of the rows inserted without signals are rebuilt
+        self.assertEqual(PickupPointCluster.objects.get(zoom=0).count, 8)
+        self.assertTrue(StockCoOccurrence.objects.exists())
+        current = (catalog._directory() / catalog.CURRENT).read_text()
+        self.assertEqual(catalog.build(), current)
+
+        # The sequences continue after the seeded ids
+        seller = User.objects.create_user(username='later', email='later@example.com', role='seller')
+        shop = Shop.objects.create(name='Later', pickup_point=PickupPoint.objects.first(), seller=seller)
+        self.assertEqual((seller.id, shop.id), (26, 6))
+
+    def test_same_seed_same_data(self):
+        self.seed('--seed', '7')
+        first = list(Order.objects.order_by('id').values_list('shop_id', 'total_price', 'status'))
+        with self.assertRaises(CommandError):
+            self.seed('--seed', '7')
+
+        # Removing the users removes their shops, stocks and orders
+        User.objects.filter(username__startswith='perf7_').delete()
+        self.seed('--seed', '7')
+        second = list(Order.objects.order_by('id').values_list('shop_id', 'total_price', 'status'))
+        self.assertEqual([order[1:] for order in first], [order[1:] for order in second])
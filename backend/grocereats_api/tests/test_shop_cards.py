@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from grocereats_api.models import Order, ShopCard, Stock
+from .base import GrocerEatsTestCase
+
+
+class ShopCardTests(GrocerEatsTestCase):
+
+    def card(self):
+        return ShopCard.objects.get(shop=self.shop)
+
+    def test_card_follows_the_stocks(self):
+        card = self.card()
+        self.assertEqual(card.stock_count, 2)
+        self.assertEqual(card.categories, ['Fruit', 'Vegetables'])
+
+        self.carrot.delete()
+        card = self.card()
+        self.assertEqual(card.stock_count, 1)
+        self.assertEqual(card.categories, ['Fruit'])
+
+    def test_categories_are_distinct(self):
+        Stock.objects.create(name='Pear', unit='kg', price_per_unit=Decimal('3'), subcategory=self.apples,
+                             shop=self.shop, quantity=Decimal('5'))
+        self.assertEqual(ShopCard.categories_for(self.shop.id), ['Fruit', 'Vegetables'])
+        self.assertEqual(self.card().categories, ['Fruit', 'Vegetables'])
+
+    def test_moving_a_stock_to_another_subcategory(self):
+        stock = Stock.objects.get(id=self.carrot.id)
+        stock.subcategory = self.apples
+        stock.save()
+        self.assertEqual(self.card().categories, ['Fruit'])
+
+        stock.subcategory = self.carrots
+        stock.save(update_fields=['subcategory'])
+        self.assertEqual(self.card().categories, ['Fruit', 'Vegetables'])
+
+    def test_quantity_changes_leave_the_categories_alone(self):
+        stock = Stock.objects.get(id=self.apple.id)
+        stock.quantity -= 1
+        # Only the UPDATE of the stock
+        with self.assertNumQueries(1):
+            stock.save()
+
+    def test_completed_orders_and_endpoint(self):
+        Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('1'), status='completed')
+
+        response = self.customer_client.get('/shops/cards/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['name'], 'Green Grocer')
+        self.assertEqual(response.data[0]['completed_orders'], 1)
+        self.assertEqual(response.data[0]['stock_count'], 2)
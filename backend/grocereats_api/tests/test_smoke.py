@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from rest_framework.test import APIClient
+from grocereats_api.models import Order, Stock
+from .base import GrocerEatsTestCase
+
+
+class AuthenticationTests(GrocerEatsTestCase):
+
+    def test_register_obtain_token_and_logout(self):
+        client = APIClient()
+        response = client.post('/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'secret',
+            'phone': '0712345678', 'role': 'customer',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        response = client.post('/token/', {'username': 'newcomer', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        tokens = response.data
+
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        response = client.get('/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'newcomer')
+
+        response = client.post('/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        tokens = dict(tokens, **response.data)
+
+        response = client.post('/logout/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The revoked refresh token no longer gets access tokens
+        response = client.post('/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_wrong_password_and_missing_token_are_rejected(self):
+        response = APIClient().post('/token/', {'username': 'customer', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(APIClient().get('/orders/').status_code, 401)
+
+
+class OrderFlowTests(GrocerEatsTestCase):
+
+    def add_item(self, stock, quantity):
+        response = self.customer_client.post('/orders/add-item/', {
+            'shop_id': self.shop.id, 'stock_id': stock.id, 'quantity': quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_cart_checkout_and_confirm(self):
+        self.add_item(self.apple, '2')
+        added = self.add_item(self.carrot, '1.5')
+        order_id = added['order_id']
+
+        response = self.customer_client.get('/orders/carts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([cart['id'] for cart in response.data], [order_id])
+        self.assertEqual(Decimal(response.data[0]['total_price']), Decimal('7.99'))
+
+        response = self.customer_client.post('/orders/checkout/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['order_ids'], [order_id])
+        self.assertEqual(Order.objects.get(id=order_id).status, 'pending')
+
+        response = self.seller_client.patch(f'/orders/{order_id}/confirm/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'completed')
+
+        # The stock was reserved when the items were added, confirming does not deduct it again
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('98'))
+        self.assertEqual(Stock.objects.get(id=self.carrot.id).quantity, Decimal('48.5'))
+
+        response = self.customer_client.get('/orders/')
+        self.assertEqual([order['id'] for order in response.data], [order_id])
+
+    def test_cancelling_restores_the_stock(self):
+        order_id = self.add_item(self.apple, '3')['order_id']
+        self.customer_client.post('/orders/checkout/', {}, format='json')
+
+        response = self.customer_client.patch(f'/orders/{order_id}/cancel/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Stock.objects.get(id=self.apple.id).quantity, Decimal('100'))
+        # Cancelled orders cannot be confirmed
+        self.assertEqual(self.seller_client.patch(f'/orders/{order_id}/confirm/').status_code, 404)
+
+    def test_not_enough_stock(self):
+        response = self.customer_client.post('/orders/add-item/', {
+            'shop_id': self.shop.id, 'stock_id': self.carrot.id, 'quantity': '51',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class ExportTests(GrocerEatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        order = Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('6.99'),
+                                     status='completed')
+        order.items.create(stock=self.apple, quantity=Decimal('2'), price_at_purchase=Decimal('2.50'))
+        order.items.create(stock=self.carrot, quantity=Decimal('1'), price_at_purchase=Decimal('1.99'))
+        # Carts are not exported
+        Order.objects.create(buyer=self.customer, shop=self.shop, total_price=Decimal('0'), status='active')
+        self.order = order
+
+    def export(self, query):
+        response = self.seller_client.get(f'/orders/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export('format=csv'))))
+        self.assertEqual(rows[0][:3], ['order_id', 'timestamp', 'status'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[6] for row in rows[1:]}, {'Apple', 'Carrot'})
+
+    def test_ndjson(self):
+        lines = [json.loads(line) for line in self.export('format=ndjson').splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['order_id'], self.order.id)
+        self.assertEqual(len(lines[0]['items']), 2)
+
+    def test_date_range(self):
+        self.assertEqual(len(self.export('format=ndjson&to=2000-01-01').splitlines()), 0)
+        response = self.seller_client.get('/orders/export/?format=csv&from=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_customers_cannot_export(self):
+        self.assertEqual(self.customer_client.get('/orders/export/?format=csv').status_code, 403)
@@ -0,0 +1,16 @@
+from django.test import SimpleTestCase
+from grocereats_api.management.commands.profile_startup import _top_level_imports
+
+IMPORTTIME = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        900 | django
+import time:        80 |         80 |     django.utils
+import time:        50 |       2500 | rest_framework
+some other line
+'''
+
+
+class StartupProfileTests(SimpleTestCase):
+
+    def test_only_top_level_imports_are_listed(self):
+        self.assertEqual(list(_top_level_imports(IMPORTTIME)), [('django', 900), ('rest_framework', 2500)])
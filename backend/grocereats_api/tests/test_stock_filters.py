@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from grocereats_api.models import Stock
+from grocereats_api.views import parse_stock_filters
+from .base import GrocerEatsTestCase
+
+
+class ParseStockFiltersTests(SimpleTestCase):
+
+    def test_defaults_and_normalization(self):
+        self.assertEqual(parse_stock_filters({}), {
+            'sort': 'recent', 'in_stock': False, 'min_price': None, 'max_price': None, 'subcategory': None,
+        })
+        self.assertEqual(parse_stock_filters({
+            'sort': '-price', 'in_stock': 'YES', 'min_price': '1.5', 'max_price': '3', 'subcategory': '7',
+        }), {'sort': '-price', 'in_stock': True, 'min_price': 150, 'max_price': 300, 'subcategory': 7})
+
+    def test_invalid_filters(self):
+        for params, message in [
+            ({'sort': 'cheapest'}, 'sort must be one of: recent, price, -price, name.'),
+            ({'in_stock': 'maybe'}, 'in_stock must be true or false.'),
+            ({'min_price': 'cheap'}, 'min_price must be a number.'),
+            ({'max_price': '-1'}, 'max_price must not be negative.'),
+            ({'subcategory': 'apples'}, 'subcategory must be an id.'),
+        ]:
+            with self.subTest(params=params), self.assertRaisesMessage(ValueError, message):
+                parse_stock_filters(params)
+
+
+class StockFilterTests(GrocerEatsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pear = Stock.objects.create(name='Pear', unit='kg', price_per_unit=Decimal('3.20'), subcategory=cls.apples,
+                                        shop=cls.shop, quantity=Decimal('0'))
+
+    def names(self, query):
+        response = self.customer_client.get(f'/stocks/{self.shop.id}/{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [stock['name'] for stock in response.data]
+
+    def test_sorts(self):
+        self.assertEqual(self.names(''), ['Pear', 'Carrot', 'Apple'])
+        self.assertEqual(self.names('?sort=price'), ['Carrot', 'Apple', 'Pear'])
+        self.assertEqual(self.names('?sort=-price'), ['Pear', 'Apple', 'Carrot'])
+        self.assertEqual(self.names('?sort=name'), ['Apple', 'Carrot', 'Pear'])
+
+    def test_filters(self):
+        self.assertEqual(self.names('?in_stock=true&sort=name'), ['Apple', 'Carrot'])
+        self.assertEqual(self.names('?min_price=2.50&sort=name'), ['Apple', 'Pear'])
+        self.assertEqual(self.names('?max_price=2.50&sort=name'), ['Apple', 'Carrot'])
+        self.assertEqual(self.names(f'?subcategory={self.apples.id}&in_stock=1'), ['Apple'])
+
+    def test_invalid_filters(self):
+        response = self.customer_client.get(f'/stocks/{self.shop.id}/?min_price=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'min_price must be a number.'})
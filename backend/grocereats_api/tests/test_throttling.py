@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from grocereats_api.throttling import CacheBucketBackend, InProcessBucketBackend, TokenBucketThrottle, get_backend
+
+THROTTLE_BUCKET = {
+    'BACKEND': 'grocereats_api.throttling.InProcessBucketBackend',
+    'CAPACITY': 10,
+    'REFILL_RATE': 2.0,
+    'COSTS': {'list_orders': 4, 'export_orders': 50},
+}
+
+
+class BucketBackendTests(SimpleTestCase):
+
+    def test_in_process_bucket_refills_over_time(self):
+        backend = InProcessBucketBackend()
+        with mock.patch('time.monotonic', return_value=100):
+            self.assertEqual(backend.consume('user:1', 6, 10, 2.0), 0)
+            self.assertEqual(backend.consume('user:1', 4, 10, 2.0), 0)
+            # Empty, the wait is the time the bucket needs to refill the missing tokens
+            self.assertEqual(backend.consume('user:1', 3, 10, 2.0), 1.5)
+            # Buckets are per key
+            self.assertEqual(backend.consume('user:2', 10, 10, 2.0), 0)
+        with mock.patch('time.monotonic', return_value=101.5):
+            self.assertEqual(backend.consume('user:1', 3, 10, 2.0), 0)
+        with mock.patch('time.monotonic', return_value=1000):
+            # Never more than the capacity
+            self.assertEqual(backend.consume('user:1', 10, 10, 2.0), 0)
+            self.assertEqual(backend.consume('user:1', 1, 10, 2.0), 0.5)
+
+    def test_full_buckets_are_evicted(self):
+        backend = InProcessBucketBackend()
+        backend.MAX_BUCKETS = 2
+        with mock.patch('time.monotonic', return_value=100):
+            backend.consume('user:1', 10, 10, 2.0)
+            backend.consume('user:2', 1, 10, 2.0)
+        with mock.patch('time.monotonic', return_value=101):
+            backend.consume('user:3', 1, 10, 2.0)
+        # user:2 refilled in the meantime, user:1 (still short of tokens) and user:3 are kept
+        self.assertEqual(set(backend.buckets), {'user:1', 'user:3'})
+
+    def test_cache_bucket_is_shared(self):
+        cache.clear()
+        with mock.patch('time.time', return_value=100):
+            self.assertEqual(CacheBucketBackend().consume('user:1', 8, 10, 2.0), 0)
+            self.assertEqual(CacheBucketBackend().consume('user:1', 4, 10, 2.0), 1.0)
+
+
+@override_settings(THROTTLE_BUCKET=THROTTLE_BUCKET)
+class TokenBucketThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+
+    def allow(self, url_name, user=None):
+        request = APIRequestFactory().get('/')
+        request.resolver_match = SimpleNamespace(url_name=url_name)
+        request.user = user or AnonymousUser()
+        throttle = TokenBucketThrottle()
+        return throttle.allow_request(request, None), throttle.wait()
+
+    @mock.patch('time.monotonic', return_value=100)
+    def test_requests_cost_the_weight_of_their_route(self, monotonic):
+        user = SimpleNamespace(pk=1, is_authenticated=True)
+        self.assertEqual(self.allow('list_orders', user), (True, 0))
+        self.assertEqual(self.allow('list_orders', user), (True, 0))
+        self.assertEqual(self.allow('list_orders', user), (False, 1.0))
+        self.assertEqual(self.allow('profile', user), (True, 0))
+        # Anonymous clients have a bucket per address, costs are capped at the capacity
+        self.assertEqual(self.allow('export_orders'), (True, 0))
+        self.assertEqual(self.allow('profile'), (False, 0.5))
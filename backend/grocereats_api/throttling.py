@@ -0,0 +1,98 @@
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+class InProcessBucketBackend:
+    """
+    Keeps the token buckets in a dict of the current process. Limits are per worker.
+    """
+    # Above this many buckets, the ones that have refilled completely are dropped
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens, wait = _take(tokens, now - last, cost, capacity, rate)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.MAX_BUCKETS:
+                self._evict_full(now, capacity, rate)
+        return wait
+
+    def _evict_full(self, now, capacity, rate):
+        self.buckets = {
+            key: (tokens, last) for key, (tokens, last) in self.buckets.items()
+            if tokens + (now - last) * rate < capacity
+        }
+
+
+class CacheBucketBackend:
+    """
+    Keeps the token buckets in a Django cache so that all workers share the same budget.
+    The read-modify-write is not atomic, so concurrent requests may slightly overrun a bucket.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def consume(self, key, cost, capacity, rate):
+        cache = caches[self.alias]
+        now = time.time()
+        tokens, last = cache.get(f'throttle:{key}', (capacity, now))
+        tokens, wait = _take(tokens, now - last, cost, capacity, rate)
+        # A bucket left alone for capacity / rate seconds is full again, so it can expire
+        cache.set(f'throttle:{key}', (tokens, now), timeout=capacity / rate)
+        return wait
+
+
+def _take(tokens, elapsed, cost, capacity, rate):
+    """
+    Refills the bucket for the elapsed time and takes cost tokens out of it.
+    Returns the new token count and how long to wait when there were not enough tokens.
+    """
+    tokens = min(capacity, tokens + max(elapsed, 0) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / rate
+
+
+@lru_cache(maxsize=None)
+def get_backend(path, **options):
+    return import_string(path)(**options)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Per-user token bucket. Each request costs the weight configured for its URL name in
+    THROTTLE_BUCKET['COSTS'] (1 by default), so unbounded listings drain the budget faster
+    than cheap reads. Rejected requests get a Retry-After header from DRF.
+    """
+
+    def allow_request(self, request, view):
+        config = settings.THROTTLE_BUCKET
+        capacity = config['CAPACITY']
+        rate = config['REFILL_RATE']
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        cost = min(config['COSTS'].get(url_name, 1), capacity)
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'anon:{self.get_ident(request)}'
+
+        backend = get_backend(config['BACKEND'], **config.get('OPTIONS', {}))
+        self.wait_time = backend.consume(ident, cost, capacity, rate)
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time
@@ -0,0 +1,36 @@
+from rest_framework_simplejwt import authentication, serializers, tokens
+from rest_framework_simplejwt.settings import api_settings
+from . import regions
+from .revocation import revocation_cache
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token checking the revocation Bloom filter before the blacklist table.
+    """
+
+    def check_blacklist(self):
+        # Only tokens the filter may contain need the indexed lookup
+        if revocation_cache.might_be_revoked(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        revocation_cache.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    JWT authentication routing the requests that do not name a region (X-Region header) to the user's region.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and regions.requested_region() is None:
+            regions.activate(result[0].region)
+        return result
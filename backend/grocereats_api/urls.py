@@ -9,6 +9,7 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('logout/', views.logout_user, name='logout'),
     path('orders/', views.list_orders, name='list_orders'),
+    path('orders/export/', views.export_orders, name='export_orders'),
     path('orders/new/', views.place_order, name='place_order'),
     path('orders/<int:id>/', views.order_detail, name='order_detail'),
     path('orders/add-item/', views.add_item_to_order, name='add_item_to_order'),
@@ -18,16 +19,29 @@ urlpatterns = [
     path('orders/item/delete/<int:order_item_id>/', views.delete_item_from_order, name='delete_item_from_order'),
     path('orders/item/edit/<int:order_item_id>/', views.edit_item_quantity, name='edit_item_quantity'),
     path('orders/active/', views.get_active_order, name='get_active_order'),
+    path('orders/carts/', views.list_carts, name='list_carts'),
+    path('orders/checkout/', views.checkout, name='checkout'),
+    path('orders/bulk-transition/', views.bulk_transition_orders, name='bulk_transition_orders'),
     path('stocks/<int:id>/', views.view_stocks, name='view_stocks'),
+    path('stocks/forecast/', views.stock_forecast, name='stock_forecast'),
+    path('stocks/<int:id>/related/', views.related_stock_list, name='related_stocks'),
     path('stocks/add/', views.add_stock, name='add_stock'),
     path('stocks/remove/<int:id>/', views.remove_stock, name='remove_stock'),
     path('stocks/edit/<int:id>/', views.edit_stock, name='edit_stock'),
     path('shops/', views.shops, name='shops'),
+    path('shops/cards/', views.shop_cards, name='shop_cards'),
+    path('shops/in-bbox/', views.shops_in_bbox, name='shops_in_bbox'),
     path('shop/manage/', views.manage_shop, name='manage_shop'),
+    path('shop/analytics/', views.shop_analytics, name='shop_analytics'),
     path('rate/', views.rate_user_or_shop, name='rate_user_or_shop'),
     path('subcategories/', views.list_subcategories, name='list_subcategories'),
     path('categories/', views.list_categories, name='list_categories'),
     path('pickup-points/create/', views.create_pickup_point, name='create_pickup_point'),
     path('pickup-points/', views.list_pickup_points, name='list_pickup_points'),
+    path('pickup-points/clusters/', views.pickup_point_clusters, name='pickup_point_clusters'),
     path('profile/', views.profile, name='profile'),
+    path('profiles/', views.list_profiles, name='list_profiles'),
+    path('profiles/<str:id>/', views.profile_detail, name='profile_detail'),
+    path('regions/', views.region_summary, name='region_summary'),
+    path('catalog/bundle/', views.catalog_bundle, name='catalog_bundle'),
 ]
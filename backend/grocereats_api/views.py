@@ -1,13 +1,34 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+import gzip
+import heapq
+from datetime import timedelta
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import JsonResponse
-from .models import Shop, Stock, Order, OrderItem, SubCategory, Category, PickupPoint
+from django.db.models import Case, Count, DecimalField, F, Prefetch, Q, Value, When, prefetch_related_objects
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from .models import Shop, Stock, Order, OrderItem, SubCategory, Category, PickupPoint, ShopCard, \
+    ArchivedOrder, ArchivedOrderItem, StockMovement
 from .serializers import ShopSerializer, StockSerializer, OrderSerializer, UserSerializer, SubCategorySerializer, \
-    CategorySerializer, RatingSerializer, PickupPointSerializer, OrderSimpleSerializer
+    CategorySerializer, RatingSerializer, PickupPointSerializer, OrderSimpleSerializer, ShopCardSerializer, \
+    ArchivedOrderSimpleSerializer, ArchivedOrderSerializer
 from .permissions import IsSeller, IsBuyer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
+from .idempotency import idempotent
+from .coalescing import cached_stock_list, invalidate_stock_lists
+from . import catalog, money, order_states, profiling, regions
+from .inventory import record_movement, record_movements
+from .forecasting import current_demand, days_until_stockout
+from .recommendations import TOP_K, related_stocks
+from .clustering import clusters_in_bbox
+from .geo import parse_bbox, long_ranges
+from .analytics import GRANULARITIES, shop_sales
+from .exports import CSVRenderer, NDJSONRenderer, parse_bound, order_rows, stream_csv, stream_ndjson
 from rest_framework_simplejwt.exceptions import TokenError
 
 
@@ -48,61 +69,138 @@ def logout_user(request):
         return Response({'error': 'An error occurred while logging out'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Everything OrderSerializer reads from the items of an order, fetched with one query
+ORDER_ITEMS = Prefetch('items', queryset=OrderItem.objects.select_related(
+    'stock__subcategory__category', 'stock__shop__seller', 'stock__shop__pickup_point'))
+
+# Statuses each role may move an order to
+SELLER_TARGETS = ('completed', 'cancelled')
+CUSTOMER_TARGETS = ('pending', 'cancelled')
+
+
+def _activate_shop_region(shop_id):
+    """
+    Routes the request to the region of the shop with the given id. Only looks the shop up when
+    the data is split between several databases.
+    """
+    if shop_id and regions.is_partitioned():
+        region = Shop.objects.filter(id=shop_id).values_list('region', flat=True).first()
+        if region is not None:
+            regions.activate(region)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # Both sellers and customers
 def list_orders(request):
     if request.user.role == 'customer':  # Customers
         orders_list = Order.objects.filter(buyer=request.user).exclude(status='active')
+        archived_list = ArchivedOrder.objects.filter(buyer=request.user)
     elif request.user.role == 'seller':  # Sellers
         orders_list = Order.objects.filter(shop__seller=request.user).exclude(status='active')
+        archived_list = ArchivedOrder.objects.filter(shop__seller=request.user)
     else:
         return Response({'error': 'Invalid user role'}, status=status.HTTP_403_FORBIDDEN)
 
-    serializer = OrderSimpleSerializer(orders_list, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    # The serializers show the buyer and the shop with its seller and pickup point
+    related = ('buyer', 'shop__seller', 'shop__pickup_point')
+
+    def read_history():
+        orders = list(orders_list.select_related(*related))
+        archived = list(archived_list.select_related(*related))
+        return [
+            list(zip([order.timestamp for order in orders], OrderSimpleSerializer(orders, many=True).data)),
+            list(zip([order.timestamp for order in archived], ArchivedOrderSimpleSerializer(archived, many=True).data)),
+        ]
+
+    if request.user.role == 'customer':
+        # Customers may have ordered in several regions, their orders are read from every region at once
+        parts = [part for region_parts in regions.scatter_gather(read_history) for part in region_parts]
+    else:
+        parts = read_history()
+
+    # Every part is already sorted by newest first, merge them into one history
+    history = heapq.merge(*parts, key=itemgetter(0), reverse=True)
+    return Response([data for _, data in history], status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSeller])  # Sellers only
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def export_orders(request):
+    """
+    Stream the seller's whole order history, one row per order item (csv) or one line per order (ndjson).
+    """
+    try:
+        date_from = parse_bound(request.query_params.get('from'))
+        date_to = parse_bound(request.query_params.get('to'), end=True)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = order_rows(request.user, date_from, date_to)
+    if request.accepted_renderer.format == 'ndjson':
+        response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+        filename = 'orders.ndjson'
+    else:
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        filename = 'orders.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsBuyer])  # Customers only
+@idempotent
 def place_order(request):
     if request.user.role != 'customer':
         return Response({'error': 'Only customers can place orders.'}, status=status.HTTP_403_FORBIDDEN)
 
+    # The stocks are validated in the region of the shop
+    _activate_shop_region(request.data.get('shop'))
+
     serializer = OrderSerializer(data=request.data)
     if serializer.is_valid():
         items_data = serializer.validated_data['items']
-        total_price = 0
 
-        # Process each order item
-        for item_data in items_data:
-            stock = item_data['stock']
-            quantity = item_data['quantity']
-
-            # Check stock availability
-            if stock.quantity < quantity:
-                return Response(
-                    {'error': f'Not enough stock for {stock.name}. Available: {stock.quantity}.'},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Deduct stock
-            stock.quantity -= quantity
-            stock.save()
-            price_at_purchase = stock.unit_price  # Assuming Stock has a `unit_price` field
-            total_price += price_at_purchase * quantity
-
-        # Create the order and order items
-        order = serializer.save(buyer=request.user, total_price=total_price)
-
-        # Save each order item
-        for item_data in items_data:
-            OrderItem.objects.create(
-                order=order,
-                stock=item_data['stock'],
-                quantity=item_data['quantity'],
-                price_at_purchase=item_data['stock'].unit_price
+        with regions.atomic():
+            # Locked until the order is saved, so that concurrent orders cannot oversell a stock.
+            # Items of the same stock share one instance and deduct from it in turn.
+            stocks = Stock.objects.select_for_update().in_bulk([item_data['stock'].id for item_data in items_data])
+            total_price = 0  # In cents
+
+            # Process each order item
+            for item_data in items_data:
+                stock = item_data['stock'] = stocks[item_data['stock'].id]
+                quantity = item_data['quantity']
+
+                # Check stock availability
+                if stock.quantity < quantity:
+                    return Response(
+                        {'error': f'Not enough stock for {stock.name}. Available: {stock.quantity}.'},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                # Deduct stock
+                stock.quantity -= quantity
+                total_price += money.line_total(stock.price_per_unit, quantity)
+
+            # One UPDATE for all the stocks, their lists are invalidated like after a save
+            Stock.objects.filter(id__in=list(stocks)).update(
+                quantity=Case(
+                    *(When(id=stock.id, then=Value(stock.quantity)) for stock in stocks.values()),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                timestamp_last_modified=timezone.now(),
             )
+            invalidate_stock_lists(serializer.validated_data['shop'].id)
+
+            # Create the order and its items
+            order = serializer.save(buyer=request.user, total_price=money.from_cents(total_price))
+            record_movements([
+                StockMovement(stock=item_data['stock'], quantity=-item_data['quantity'], reason='order', order=order)
+                for item_data in items_data
+            ])
 
+        prefetch_related_objects([order], ORDER_ITEMS)
         return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -112,69 +210,151 @@ def place_order(request):
 @permission_classes([IsAuthenticated, IsBuyer])  # Customers only
 def get_active_order(request):
     """
-    Retrieve the active order for the authenticated customer.
+    Retrieve the active order of the authenticated customer at the shop given by `shop_id`,
+    or their most recently started one when no shop is given.
     """
+    shop_id = request.query_params.get('shop_id')
+
+    def read_active_order():
+        orders = Order.objects.filter(buyer=request.user, status='active')
+        if shop_id:
+            orders = orders.filter(shop_id=shop_id)
+        return orders.prefetch_related(ORDER_ITEMS).first()
+
+    if shop_id:
+        # The cart at a shop lives in the region of the shop
+        _activate_shop_region(shop_id)
+        order = read_active_order()
+    else:
+        # Carts may be at shops of several regions, the most recently started one of all of them is returned
+        carts = [cart for cart in regions.scatter_gather(read_active_order) if cart is not None]
+        order = max(carts, key=attrgetter('timestamp'), default=None)
+    if order is None:
+        return Response({'error': 'No active order found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = OrderSerializer(order)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsBuyer])  # Customers only
+def list_carts(request):
+    """
+    Retrieve all the active orders of the authenticated customer, one per shop.
+    """
+    def read_carts():
+        return list(Order.objects.filter(buyer=request.user, status='active').prefetch_related(ORDER_ITEMS))
+
+    # Carts at shops of other regions live in the databases of those regions
+    orders = [order for carts in regions.scatter_gather(read_carts) for order in carts]
+    orders.sort(key=attrgetter('timestamp'), reverse=True)
+    serializer = OrderSerializer(orders, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsBuyer])  # Customers only
+@idempotent
+def checkout(request):
+    """
+    Submit all the active orders of the authenticated customer at once, or only those listed in `order_ids`.
+    The stock of their items was already reserved when the items were added, so the carts only change status.
+    """
+    order_ids = request.data.get('order_ids')
+    if order_ids is not None and not isinstance(order_ids, list):
+        return Response({'error': 'order_ids must be a list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    carts = {}
+    # Carts at shops of other regions live in the databases of those regions, each database is
+    # submitted in a transaction of its own
+    for region in regions.database_regions():
+        with regions.use_region(region), regions.atomic():
+            region_carts = Order.objects.select_for_update().filter(buyer=request.user, status='active', items__isnull=False)
+            if order_ids is not None:
+                region_carts = region_carts.filter(id__in=order_ids)
+            region_carts = {order_id: total_price for order_id, total_price in region_carts.values_list('id', 'total_price')}
+            if region_carts:
+                order_states.apply(Order.objects.filter(id__in=list(region_carts)), 'pending')
+                carts.update(region_carts)
+
+    if not carts:
+        return Response({'error': 'No active order with items found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'message': 'Orders submitted successfully!',
+        'order_ids': sorted(carts),
+        'total_price': str(sum(carts.values())),
+    }, status=status.HTTP_200_OK)
+
+
+ARCHIVED_ORDER_ITEMS = Prefetch('items', queryset=ArchivedOrderItem.objects.select_related(
+    'stock__subcategory__category', 'stock__shop__seller', 'stock__shop__pickup_point'))
+
+
+def _archived_order_detail(request, id):
+    regions.locate(ArchivedOrder.objects.filter(id=id))
     try:
-        # Retrieve the active order for the customer
-        order = Order.objects.get(buyer=request.user, status='active')
-        serializer = OrderSerializer(order)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        order = ArchivedOrder.objects.select_related('shop').get(id=id)
+    except ArchivedOrder.DoesNotExist:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    except Order.DoesNotExist:
-        return Response({'error': 'No active order found.'}, status=status.HTTP_404_NOT_FOUND)
+    if request.user.id not in (order.buyer_id, order.shop.seller_id):
+        return Response({'error': 'You are not authorized to view this order.'}, status=status.HTTP_403_FORBIDDEN)
+    if request.method == 'PATCH':
+        return Response({'error': f'A {order.status} order cannot be changed.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    prefetch_related_objects([order], ARCHIVED_ORDER_ITEMS)
+    return Response(ArchivedOrderSerializer(order).data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])  # Both sellers and customers
 def order_detail(request, id):
+    # Customers order at shops of other regions than theirs, the order lives in the region of its shop
+    regions.locate(Order.objects.filter(id=id))
     try:
-        order = Order.objects.get(id=id)
+        order = Order.objects.select_related('shop').get(id=id)
     except Order.DoesNotExist:
-        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        # Old completed and cancelled orders were moved to the archive by archive_orders
+        return _archived_order_detail(request, id)
 
     if request.method == 'GET':  # View order details
-        if request.user != order.buyer and request.user != order.shop.seller:
+        if request.user.id not in (order.buyer_id, order.shop.seller_id):
             return Response({'error': 'You are not authorized to view this order.'}, status=status.HTTP_403_FORBIDDEN)
 
+        prefetch_related_objects([order], ORDER_ITEMS)
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     elif request.method == 'PATCH':  # Update order status
-        if request.user.role == 'seller' and request.user == order.shop.seller:
-            serializer = OrderSerializer(order, data=request.data, partial=True)
-            if serializer.is_valid():
-                new_status = serializer.validated_data.get('status')
-                if new_status == 'cancelled' and order.status == 'pending':
-                    # Restore stock for cancelled orders
-                    for item in order.items.all():
-                        item.stock.quantity += item.quantity
-                        item.stock.save()
-
-                order = serializer.save()
-                return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        elif request.user.role == 'customer' and request.user == order.buyer:
+        if request.user.role == 'seller' and request.user.id == order.shop.seller_id:
+            new_status = request.data.get('status')
+            if new_status not in SELLER_TARGETS:
+                return Response({'error': f'status must be one of: {", ".join(SELLER_TARGETS)}.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not order_states.apply(Order.objects.filter(id=order.id), new_status):
+                return Response({'error': f'A {order.status} order cannot be {new_status}.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            order.refresh_from_db()
+            prefetch_related_objects([order], ORDER_ITEMS)
+            return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
+
+        elif request.user.role == 'customer' and request.user.id == order.buyer_id:
             # Customers can cancel only pending orders
-            if order.status != 'pending':
+            if not order_states.apply(Order.objects.filter(id=order.id, status='pending'), 'cancelled'):
                 return Response({'error': 'You can only cancel orders in pending status.'}, status=status.HTTP_403_FORBIDDEN)
 
-            serializer = OrderSerializer(order, data={'status': 'cancelled'}, partial=True)
-            if serializer.is_valid():
-                # Restore stock for cancelled orders
-                for item in order.items.all():
-                    item.stock.quantity += item.quantity
-                    item.stock.save()
-
-                order = serializer.save()
-                return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            order.refresh_from_db()
+            prefetch_related_objects([order], ORDER_ITEMS)
+            return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
 
     return Response({'error': 'Unauthorized action.'}, status=status.HTTP_403_FORBIDDEN)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsBuyer])  # Customers only
+@idempotent
 def add_item_to_order(request):
     """
     Add a stock item to an active order. If no active order exists, create one.
@@ -188,54 +368,56 @@ def add_item_to_order(request):
         if not all([shop_id, stock_id, quantity]):
             return Response({'error': 'shop_id, stock_id, and quantity are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            quantity = money.parse_quantity(quantity)
+        except ValueError:
+            return Response({'error': 'Quantity must be a positive number.'}, status=status.HTTP_400_BAD_REQUEST)
+
         shop = Shop.objects.get(id=shop_id)
-        stock = Stock.objects.get(id=stock_id)
-
-        # Ensure enough stock is available
-        if stock.quantity < int(quantity):
-            return Response({'error': f'Not enough stock available for {stock.name}. Only {stock.quantity} left.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Check for an existing active order
-        active_order = Order.objects.filter(buyer=request.user, status='active').first()
-
-        if active_order:
-            # If an active order exists, ensure it is for the same shop
-            if active_order.shop.id != shop.id:
-                return Response(
-                    {'error': 'You cannot add items from a different shop to your active order. Please submit or cancel your active order first.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        else:
-            # Create a new active order if none exists
-            active_order = Order.objects.create(
+        regions.activate(shop.region)
+
+        with regions.atomic():
+            # Concurrent adds of the same stock wait for each other here, so none of them oversells it
+            stock = Stock.objects.select_for_update().get(id=stock_id, shop=shop)
+
+            # Ensure enough stock is available
+            if stock.quantity < quantity:
+                return Response({'error': f'Not enough stock available for {stock.name}. Only {stock.quantity} left.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Customers keep one active order per shop. When a concurrent first add creates it in the
+            # meantime, get_or_create() catches the unique constraint violation and reads that one instead
+            active_order, _ = Order.objects.get_or_create(
                 buyer=request.user,
                 shop=shop,
                 status='active',
-                total_price=0
+                defaults={'total_price': 0}
             )
 
-        # Add item to order
-        order_item, item_created = OrderItem.objects.get_or_create(
-            order=active_order,
-            stock=stock,
-            defaults={
-                'quantity': quantity,
-                'price_at_purchase': stock.price_per_unit
-            }
-        )
+            # Add item to order
+            order_item, item_created = OrderItem.objects.get_or_create(
+                order=active_order,
+                stock=stock,
+                defaults={
+                    'quantity': quantity,
+                    'price_at_purchase': stock.price_per_unit
+                }
+            )
 
-        if not item_created:
-            # If the item already exists in the order, update the quantity
-            order_item.quantity += int(quantity)
-            order_item.save()
+            previous_quantity = 0
+            if not item_created:
+                # If the item already exists in the order, update the quantity
+                previous_quantity = order_item.quantity
+                order_item.quantity += quantity
+                order_item.save()
 
-        # Deduct stock quantity
-        stock.quantity -= int(quantity)
-        stock.save()
+            # Deduct stock quantity
+            stock.quantity = F('quantity') - quantity
+            stock.save(update_fields=['quantity'])
+            record_movement(stock, -quantity, 'order', active_order)
 
-        # Update total price of the order
-        active_order.total_price += stock.price_per_unit * int(quantity)
-        active_order.save()
+            # Update total price of the order, at the price the item was first added with
+            price = order_item.price_at_purchase
+            money.add_to_total(active_order, money.line_total(price, order_item.quantity) - money.line_total(price, previous_quantity))
 
         return Response({
             'message': 'Item added to order successfully.',
@@ -256,24 +438,27 @@ def add_item_to_order(request):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsBuyer])  # Only customers
 def delete_item_from_order(request, order_item_id):
-    try:
-        # Retrieve the order item
-        order_item = OrderItem.objects.get(id=order_item_id, order__buyer=request.user, order__status='active')
-    except OrderItem.DoesNotExist:
-        return Response({'error': 'Order item not found or not part of an active order.'}, status=status.HTTP_404_NOT_FOUND)
-
-    # Restore stock quantity
-    stock = order_item.stock
-    stock.quantity += int(order_item.quantity)
-    stock.save()
-
-    # Update the order total price
-    order = order_item.order
-    order.total_price -= int(order_item.quantity) * int(order_item.price_at_purchase)
-    order.save()
-
-    # Delete the order item
-    order_item.delete()
+    # The cart lives in the region of its shop
+    regions.locate(OrderItem.objects.filter(id=order_item_id, order__buyer=request.user))
+    with regions.atomic():
+        try:
+            # Retrieve the order item, a concurrent delete or edit of it waits for this one
+            order_item = OrderItem.objects.select_for_update(of=('self',)).select_related('order').get(
+                id=order_item_id, order__buyer=request.user, order__status='active')
+        except OrderItem.DoesNotExist:
+            return Response({'error': 'Order item not found or not part of an active order.'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Restore stock quantity, locked like the adds and checkouts of other carts changing it
+        stock = Stock.objects.select_for_update().get(id=order_item.stock_id)
+        stock.quantity = F('quantity') + order_item.quantity
+        stock.save(update_fields=['quantity'])
+        record_movement(stock, order_item.quantity, 'order_restore', order_item.order)
+
+        # Update the order total price
+        money.add_to_total(order_item.order, -money.line_total(order_item.price_at_purchase, order_item.quantity))
+
+        # Delete the order item
+        order_item.delete()
 
     return Response({'message': 'Item removed from order successfully.'}, status=status.HTTP_200_OK)
 
@@ -281,44 +466,51 @@ def delete_item_from_order(request, order_item_id):
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated, IsBuyer])  # Only customers
 def edit_item_quantity(request, order_item_id):
-    try:
-        # Retrieve the order item
-        order_item = OrderItem.objects.get(id=order_item_id, order__buyer=request.user, order__status='active')
-    except OrderItem.DoesNotExist:
-        return Response({'error': 'Order item not found or not part of an active order.'}, status=status.HTTP_404_NOT_FOUND)
-
     # Parse the new quantity
-    new_quantity = request.data.get('quantity')
-    if not new_quantity or int(new_quantity) <= 0:
+    try:
+        new_quantity = money.parse_quantity(request.data.get('quantity'))
+    except ValueError:
         return Response({'error': 'Quantity must be a positive number.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    new_quantity = int(new_quantity)
-    current_quantity = int(order_item.quantity)
-    stock = order_item.stock
-
-    # Calculate the quantity difference
-    quantity_difference = new_quantity - current_quantity
-
-    # Ensure sufficient stock if increasing quantity
-    if quantity_difference > 0 and stock.quantity < quantity_difference:
-        return Response({'error': f'Not enough stock for {stock.name}. Available: {stock.quantity}.'}, status=status.HTTP_400_BAD_REQUEST)
-
-    # Update stock quantity
-    stock.quantity -= quantity_difference
-    stock.save()
-
-    # Update order item quantity
-    order_item.quantity = new_quantity
-    order_item.save()
-
-    # Update the order total price
-    order = order_item.order
-    order.total_price += quantity_difference * int(order_item.price_at_purchase)
-    order.save()
+    # The cart lives in the region of its shop
+    regions.locate(OrderItem.objects.filter(id=order_item_id, order__buyer=request.user))
+    with regions.atomic():
+        try:
+            # Retrieve the order item, a concurrent delete or edit of it waits for this one
+            order_item = OrderItem.objects.select_for_update(of=('self',)).select_related('order').get(
+                id=order_item_id, order__buyer=request.user, order__status='active')
+        except OrderItem.DoesNotExist:
+            return Response({'error': 'Order item not found or not part of an active order.'}, status=status.HTTP_404_NOT_FOUND)
+
+        current_quantity = order_item.quantity
+        # Locked like the adds and checkouts of other carts changing it
+        stock = Stock.objects.select_for_update().get(id=order_item.stock_id)
+
+        # Calculate the quantity difference
+        quantity_difference = new_quantity - current_quantity
+
+        # Ensure sufficient stock if increasing quantity
+        if quantity_difference > 0 and stock.quantity < quantity_difference:
+            return Response({'error': f'Not enough stock for {stock.name}. Available: {stock.quantity}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if quantity_difference:
+            # Update stock quantity
+            stock.quantity = F('quantity') - quantity_difference
+            stock.save(update_fields=['quantity'])
+            record_movement(stock, -quantity_difference, 'order' if quantity_difference > 0 else 'order_restore',
+                            order_item.order)
+
+        # Update order item quantity
+        order_item.quantity = new_quantity
+        order_item.save(update_fields=['quantity'])
+
+        # Update the order total price
+        price = order_item.price_at_purchase
+        money.add_to_total(order_item.order, money.line_total(price, new_quantity) - money.line_total(price, current_quantity))
 
     return Response({'message': 'Item quantity updated successfully.', 'order_item': {
         'id': order_item.id,
-        'stock': order_item.stock.name,
+        'stock': stock.name,
         'quantity': order_item.quantity,
         'price_at_purchase': order_item.price_at_purchase
     }}, status=status.HTTP_200_OK)
@@ -326,18 +518,16 @@ def edit_item_quantity(request, order_item_id):
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated, IsBuyer])  # Customers only
+@idempotent
 def submit_order(request, id):
     """
     Submit an active order by changing its status to pending.
     """
-    try:
-        order = Order.objects.get(id=id, buyer=request.user, status='active')
-        order.status = 'pending'
-        order.save()
-        return Response({'message': 'Order submitted successfully!'}, status=status.HTTP_200_OK)
-
-    except Order.DoesNotExist:
+    # The order lives in the region of its shop
+    regions.locate(Order.objects.filter(id=id, buyer=request.user))
+    if not order_states.apply(Order.objects.filter(id=id, buyer=request.user), 'pending'):
         return Response({'error': 'Active order not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Order submitted successfully!'}, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -346,14 +536,9 @@ def confirm_order(request, id):
     """
     Confirm a pending order by changing its status to completed.
     """
-    try:
-        order = Order.objects.get(id=id, shop__seller=request.user, status='pending')
-        order.status = 'completed'
-        order.save()
-        return Response({'message': 'Order confirmed successfully!'}, status=status.HTTP_200_OK)
-
-    except Order.DoesNotExist:
+    if not order_states.apply(Order.objects.filter(id=id, shop__seller=request.user), 'completed'):
         return Response({'error': 'Pending order not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Order confirmed successfully!'}, status=status.HTTP_200_OK)
 
 
 @api_view(['PATCH'])
@@ -362,21 +547,56 @@ def cancel_order(request, id):
     """
     Cancel a pending order by changing its status to cancelled and restoring stock quantities.
     """
-    try:
-        order = Order.objects.get(id=id, buyer=request.user)
-        if order.status != 'pending' and order.status != 'active':
+    orders = Order.objects.filter(id=id, buyer=request.user)
+    # The order lives in the region of its shop
+    regions.locate(orders)
+    if not order_states.apply(orders, 'cancelled'):
+        if orders.exists():
             return Response({'error': 'Only active and pending orders can be cancelled.'}, status=status.HTTP_403_FORBIDDEN)
-        # Restore stock quantities
-        for item in order.items.all():
-            item.stock.quantity += item.quantity
-            item.stock.save()
+        return Response({'error': 'Pending order not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Order cancelled successfully!'}, status=status.HTTP_200_OK)
 
-        order.status = 'cancelled'
-        order.save()
-        return Response({'message': 'Order cancelled successfully!'}, status=status.HTTP_200_OK)
 
-    except Order.DoesNotExist:
-        return Response({'error': 'Pending order not found.'}, status=status.HTTP_404_NOT_FOUND)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])  # Both sellers and customers
+@idempotent
+def bulk_transition_orders(request):
+    """
+    Move many orders to a new status at once: sellers complete or cancel orders of their shop,
+    customers submit or cancel their own orders. Orders that cannot make the transition are skipped.
+    """
+    order_ids = request.data.get('order_ids')
+    new_status = request.data.get('status')
+
+    if request.user.role == 'seller':
+        orders = Order.objects.filter(shop__seller=request.user)
+        allowed = SELLER_TARGETS
+    elif request.user.role == 'customer':
+        orders = Order.objects.filter(buyer=request.user)
+        allowed = CUSTOMER_TARGETS
+    else:
+        return Response({'error': 'Invalid user role'}, status=status.HTTP_403_FORBIDDEN)
+
+    if new_status not in allowed:
+        return Response({'error': f'status must be one of: {", ".join(allowed)}.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(order_ids, list) or not order_ids or len(order_ids) > order_states.MAX_BATCH_SIZE:
+        return Response({'error': f'order_ids must be a list of 1 to {order_states.MAX_BATCH_SIZE} ids.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def transition():
+        return order_states.apply(orders.filter(id__in=order_ids), new_status)
+
+    try:
+        # A customer's orders may be spread over the databases of several regions, a seller's are in one
+        updated = sum(regions.scatter_gather(transition)) if request.user.role == 'customer' else transition()
+    except (TypeError, ValueError):
+        return Response({'error': 'order_ids must be a list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'message': f'{updated} orders {new_status}.',
+        'requested': len(order_ids),
+        'updated': updated,
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -437,26 +657,149 @@ def edit_stock(request, id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Orderings of the stock list, each backed by a (shop, ...) index of Stock, ties broken by id
+STOCK_SORTS = {
+    'recent': ('-timestamp_last_modified', '-id'),
+    'price': ('price_per_unit', 'id'),
+    '-price': ('-price_per_unit', '-id'),
+    'name': ('name', 'id'),
+}
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+
+def parse_stock_filters(params):
+    """
+    Validates the filters of a stock list. Returns them normalized, prices in cents, so that equal
+    filters share one cached list. Raises ValueError for malformed ones.
+    """
+    sort = params.get('sort', 'recent')
+    if sort not in STOCK_SORTS:
+        raise ValueError(f'sort must be one of: {", ".join(STOCK_SORTS)}.')
+
+    in_stock = params.get('in_stock', 'false').lower()
+    if in_stock not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError('in_stock must be true or false.')
+
+    prices = {}
+    for bound in ('min_price', 'max_price'):
+        value = params.get(bound)
+        if value is None:
+            continue
+        try:
+            prices[bound] = money.to_cents(value)
+        except (ArithmeticError, ValueError):
+            raise ValueError(f'{bound} must be a number.')
+        if prices[bound] < 0:
+            raise ValueError(f'{bound} must not be negative.')
+
+    subcategory = params.get('subcategory')
+    if subcategory is not None:
+        try:
+            subcategory = int(subcategory)
+        except ValueError:
+            raise ValueError('subcategory must be an id.')
+
+    return {
+        'sort': sort,
+        'in_stock': in_stock in TRUE_VALUES,
+        'min_price': prices.get('min_price'),
+        'max_price': prices.get('max_price'),
+        'subcategory': subcategory,
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # Both sellers and buyers
 def view_stocks(request, id):
+    """
+    Stocks of a shop, optionally only those `in_stock`, between `min_price` and `max_price` or of a
+    `subcategory`, sorted by `sort` (recent, price, -price or name).
+    """
     try:
+        filters = parse_stock_filters(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def list_stocks():
         # Retrieve the shop by ID
         shop = Shop.objects.get(id=id)
+        # Retrieve the stock entries for the specified shop, from the database of its region
+        with regions.use_region(shop.region):
+            stocks = Stock.objects.filter(shop=shop)
+            if filters['in_stock']:
+                stocks = stocks.filter(quantity__gt=0)
+            if filters['min_price'] is not None:
+                stocks = stocks.filter(price_per_unit__gte=money.from_cents(filters['min_price']))
+            if filters['max_price'] is not None:
+                stocks = stocks.filter(price_per_unit__lte=money.from_cents(filters['max_price']))
+            if filters['subcategory'] is not None:
+                stocks = stocks.filter(subcategory_id=filters['subcategory'])
+            stocks = stocks.order_by(*STOCK_SORTS[filters['sort']]).select_related(
+                'subcategory__category', 'shop__seller', 'shop__pickup_point')
+            return StockSerializer(stocks, many=True).data
+
+    # Every combination of filters is cached on its own, and invalidated with the shop's other lists
+    variant = ':'.join(f'{name}={value}' for name, value in filters.items())
+    try:
+        # Concurrent requests for the same shop share one computation, cached until the stock changes
+        data = cached_stock_list(id, variant, list_stocks)
     except Shop.DoesNotExist:
         return Response({'error': 'Shop not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-    # Retrieve the stock entries for the specified shop
-    stocks = Stock.objects.filter(shop=shop)
-    serializer = StockSerializer(stocks, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSeller])  # Only sellers
+def stock_forecast(request):
+    """
+    Expected daily demand and days until stockout of every stock of the seller's shop, soonest stockout first.
+    """
+    stocks = Stock.objects.filter(shop__seller=request.user).select_related('forecast')
+
+    forecasts = []
+    for stock in stocks:
+        forecast = getattr(stock, 'forecast', None)
+        daily_demand = current_demand(forecast) if forecast else Decimal(0)
+        forecasts.append({
+            'id': stock.id,
+            'name': stock.name,
+            'quantity': str(stock.quantity),
+            'daily_demand': str(daily_demand.quantize(Decimal('0.01'))),
+            'days_until_stockout': days_until_stockout(stock.quantity, daily_demand),
+        })
+
+    forecasts.sort(key=lambda f: (f['days_until_stockout'] is None, f['days_until_stockout']))
+    return Response(forecasts, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])  # Both sellers and buyers
+def related_stock_list(request, id):
+    """
+    Stocks most often bought together with the given one, served from the in-memory table.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', TOP_K)), 1), TOP_K)
+    except ValueError:
+        return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The stock lives in the region of its shop, the related table of that region's database answers
+    if regions.locate(Stock.objects.filter(id=id)) is None:
+        return Response({'error': 'Stock not found.'}, status=status.HTTP_404_NOT_FOUND)
+    related = related_stocks(id, limit)
+    # Stocks without neighbors are rarely asked for, only they pay for the existence check
+    if not related and not Stock.objects.filter(id=id).exists():
+        return Response({'error': 'Stock not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(related, status=status.HTTP_200_OK)
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])  # Both sellers and buyers
 def shops(request):
     if request.method == 'GET':  # All authenticated users can view shops
-        shops = Shop.objects.all()
+        shops = Shop.objects.select_related('seller', 'pickup_point')
         serializer = ShopSerializer(shops, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -470,12 +813,58 @@ def shops(request):
 
     return Response({'error': 'Only sellers can add shops'}, status=status.HTTP_403_FORBIDDEN)
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])  # Both sellers and buyers
+def shop_cards(request):
+    """
+    List the precomputed home screen cards of all shops with a single query.
+    """
+    cards = ShopCard.objects.all()
+    serializer = ShopCardSerializer(cards, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])  # Both sellers and buyers
+def shops_in_bbox(request):
+    """
+    Minimal projection of the shops whose pickup point lies inside the map viewport.
+    min_long may be greater than max_long when the viewport crosses the antimeridian.
+    """
+    params = request.query_params
+    try:
+        min_lat, min_long, max_lat, max_long = parse_bbox(
+            params.get('min_lat'), params.get('min_long'), params.get('max_lat'), params.get('max_long')
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Served from the shop cards, which carry the pickup point coordinates next to an index on them
+    longitudes = Q()
+    for west, east in long_ranges(min_long, max_long):
+        longitudes |= Q(long__range=(west, east))
+    cards = ShopCard.objects.filter(longitudes, lat__range=(min_lat, max_lat)).order_by() \
+        .values_list('shop_id', 'name', 'lat', 'long', 'rating')
+
+    return Response([
+        {
+            'id': shop_id,
+            'name': name,
+            'lat': str(lat),
+            'long': str(long),
+            'rating': None if rating is None else str(rating),
+        }
+        for shop_id, name, lat, long, rating in cards
+    ], status=status.HTTP_200_OK)
+
+
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated, IsSeller])  # Only sellers
 def manage_shop(request):
     try:
         # Ensure the seller has a shop
-        shop = Shop.objects.get(seller=request.user)
+        shop = Shop.objects.select_related('seller', 'pickup_point').get(seller=request.user)
     except Shop.DoesNotExist:
         return Response(
             {'error': 'You do not have an associated shop.'},
@@ -497,6 +886,34 @@ def manage_shop(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSeller])  # Only sellers
+def shop_analytics(request):
+    """
+    Sales figures of the seller's shop: revenue per period, units sold per stock, subcategory mix and basket size.
+    """
+    try:
+        shop = Shop.objects.get(seller=request.user)
+    except Shop.DoesNotExist:
+        return Response(
+            {'error': 'You do not have an associated shop.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    granularity = request.query_params.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return Response({'error': f'granularity must be one of: {", ".join(GRANULARITIES)}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        date_to = parse_bound(request.query_params.get('to'), end=True) or timezone.now()
+        date_from = parse_bound(request.query_params.get('from')) or date_to - timedelta(days=30)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(shop_sales(shop, granularity, date_from, date_to), status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def rate_user_or_shop(request):
@@ -533,7 +950,7 @@ def rate_user_or_shop(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # Both sellers and buyers
 def list_subcategories(request):
-    subcategories = SubCategory.objects.all()
+    subcategories = SubCategory.objects.select_related('category')
     serializer = SubCategorySerializer(subcategories, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -541,11 +958,36 @@ def list_subcategories(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  # Both sellers and buyers
 def list_categories(request):
-    categories = Category.objects.all()  # Retrieve all categories
+    categories = Category.objects.prefetch_related('subcategories__category')  # Retrieve all categories
     serializer = CategorySerializer(categories, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])  # Both sellers and buyers
+def catalog_bundle(request):
+    """
+    Categories, subcategories, pickup points and shops in one gzipped JSON snapshot, as served by their
+    list endpoints. Clients send back the ETag in If-None-Match and get a 304 while the catalog is unchanged.
+    """
+    version, mapped = catalog.bundle.current()
+    etag = f'"{version}"'
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = StreamingHttpResponse(catalog.stream(mapped), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(mapped)
+    else:
+        response = HttpResponse(gzip.decompress(mapped), content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsSeller])  # Only sellers
 def create_pickup_point(request):
@@ -572,6 +1014,31 @@ def list_pickup_points(request):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])  # Both sellers and buyers
+def pickup_point_clusters(request):
+    """
+    Pickup point clusters of the map viewport, bbox is given as min_long,min_lat,max_long,max_lat.
+    """
+    coordinates = request.query_params.get('bbox', '').split(',')
+    if len(coordinates) != 4:
+        return Response({'error': 'bbox must be given as min_long,min_lat,max_long,max_lat.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        zoom = int(request.query_params.get('zoom', 0))
+    except ValueError:
+        return Response({'error': 'zoom must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    min_long, min_lat, max_long, max_lat = coordinates
+    try:
+        bbox = parse_bbox(min_lat, min_long, max_lat, max_long)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    zoom, clusters = clusters_in_bbox(*bbox, zoom)
+    return Response({'zoom': zoom, 'clusters': clusters}, status=status.HTTP_200_OK)
+
+
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])  # Both sellers and buyers
 def profile(request):
@@ -585,3 +1052,48 @@ def profile(request):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])  # Staff only
+def list_profiles(request):
+    """
+    Stored request profiles, newest first, without their SQL timeline.
+    """
+    return Response(profiling.list_profiles(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])  # Staff only
+def profile_detail(request, id):
+    """
+    A stored request profile with its SQL timeline, or with `?folded=1` its folded stacks as text,
+    ready for flamegraph.pl or speedscope.
+    """
+    profile = profiling.load_profile(id)
+    if profile is None:
+        return Response({'error': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    metadata, folded = profile
+    if request.query_params.get('folded'):
+        response = HttpResponse(folded, content_type='text/plain')
+        response['Content-Disposition'] = f'attachment; filename="{id}.folded"'
+        return response
+    return Response(metadata, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])  # Staff only
+def region_summary(request):
+    """
+    Number of stocks and of orders per status in the database of every region, read from all of them at once.
+    """
+    def summarize():
+        return {
+            'database': regions.current_database(),
+            'stocks': Stock.objects.count(),
+            'orders': dict(Order.objects.order_by().values_list('status').annotate(count=Count('id'))),
+            'archived_orders': ArchivedOrder.objects.count(),
+        }
+
+    return Response(regions.scatter_gather(summarize), status=status.HTTP_200_OK)